@@ -3,6 +3,21 @@ import { useAuth } from "./contexts/AuthContext";
 import FileUpload from "./components/FileUpload";
 import "./FileVersions.css";
 
+// List endpoints are cursor-paginated; follow `next` until every page is read.
+const fetchAllPages = async (url, headers) => {
+  const results = [];
+  while (url) {
+    const response = await fetch(url, { headers });
+    if (!response.ok) {
+      throw new Error(`Request failed with status ${response.status}`);
+    }
+    const page = await response.json();
+    results.push(...page.results);
+    url = page.next;
+  }
+  return results;
+};
+
 const FileVersionItem = ({ version, onDelete, users }) => {
   const { getAuthHeader, user } = useAuth();
   const [isDeleting, setIsDeleting] = useState(false);
@@ -191,20 +206,15 @@ function FileVersions() {
   const fetchVersions = async () => {
     try {
       setLoading(true);
-      const response = await fetch("http://localhost:8001/api/versions/", {
-        headers: {
-          ...getAuthHeader(),
-          'Content-Type': 'application/json'
-        },
+      const data = await fetchAllPages("http://localhost:8001/api/versions/", {
+        ...getAuthHeader(),
+        'Content-Type': 'application/json'
       });
-      if (!response.ok) {
-        throw new Error('Failed to fetch versions');
-      }
-      const data = await response.json();
       setVersions(data);
       setError(null);
     } catch (err) {
-      setError(err.message);
+      console.error('Error fetching versions:', err);
+      setError('Failed to fetch versions');
     } finally {
       setLoading(false);
     }
@@ -212,16 +222,10 @@ function FileVersions() {
 
   const fetchUsers = async () => {
     try {
-      const response = await fetch("http://localhost:8001/api/versions/available_users/", {
-        headers: {
-          ...getAuthHeader(),
-          'Content-Type': 'application/json'
-        },
+      const data = await fetchAllPages("http://localhost:8001/api/versions/available_users/", {
+        ...getAuthHeader(),
+        'Content-Type': 'application/json'
       });
-      if (!response.ok) {
-        throw new Error('Failed to fetch users');
-      }
-      const data = await response.json();
       setUsers(data);
     } catch (err) {
       console.error('Error fetching users:', err);
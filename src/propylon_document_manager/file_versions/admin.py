@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'content_hash', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('content_hash',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,135 @@
+"""
+Async variants of the upload, download and version-listing endpoints.
+
+Served under ASGI (``propylon_document_manager.site.asgi``), a request only
+holds a thread while it runs blocking work in short ``sync_to_async`` calls.
+The server receives upload bodies before the view runs, and downloads are
+streamed from an async iterator, so slow clients cost a coroutine rather
+than a worker thread for the length of the transfer.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from ..models import File, FileVersion
+from .caching import cached_listing_response
+from .downloads import async_blob_response
+from .pagination import CreatedAtCursorPagination
+from .permissions import get_permission_resolver, readable_versions
+from .serializers import FileVersionSerializer
+from .uploads import store_upload
+from .views import prefetch_version_relations
+
+
+def api_request(request):
+    """
+    Wrap ``request`` in a DRF request parsed and authenticated like the sync
+    API views: JWT bearer tokens or the session, with CSRF checks for the latter.
+    """
+    request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    return request
+
+
+def error_response(exc):
+    """Render an API exception the way DRF's default exception handler does."""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return JsonResponse(data, status=exc.status_code, safe=False)
+
+
+def json_response(response):
+    """Render a DRF ``Response`` built outside a DRF view as JSON, keeping its headers."""
+    if response.data is None:
+        result = HttpResponse(status=response.status_code)
+    else:
+        result = JsonResponse(response.data, status=response.status_code)
+    for header, value in response.items():
+        if header != 'Content-Type':
+            result[header] = value
+    return result
+
+
+@csrf_exempt
+@require_POST
+async def create_version(request):
+    """
+    Upload a new version of an existing file: the async ``POST /api/versions/``.
+    Accepts the same multipart fields and returns the same payload.
+    """
+    try:
+        request = await sync_to_async(api_request)(request)
+
+        # Parses the already received body and runs the serializer's queries.
+        def validate():
+            serializer = FileVersionSerializer(data=request.data, context={'request': request})
+            serializer.is_valid(raise_exception=True)
+            if not get_permission_resolver(request).can_write_file(serializer.validated_data['file']):
+                raise PermissionDenied("You don't have write permission for this file.")
+            return serializer
+
+        serializer = await sync_to_async(validate)()
+        content_hash, size = await sync_to_async(store_upload, thread_sensitive=False)(
+            serializer.validated_data.pop('content')
+        )
+
+        def save():
+            version = serializer.save(content_hash=content_hash, size=size)
+            version.rebuild_access()
+            return serializer.data
+
+        data = await sync_to_async(save)()
+    except APIException as exc:
+        return error_response(exc)
+    return JsonResponse(data, status=status.HTTP_201_CREATED)
+
+
+@require_GET
+async def download_version(request, content_hash):
+    """Stream the raw bytes of a version: the async ``GET /api/versions/{content_hash}/download/``."""
+    try:
+        request = await sync_to_async(api_request)(request)
+    except APIException as exc:
+        return error_response(exc)
+    version = await (
+        readable_versions(request.user)
+        .filter(content_hash=content_hash)
+        .select_related('file')
+        .order_by('-created_at')
+        .afirst()
+    )
+    if version is None:
+        return JsonResponse({'detail': 'No version found with this content hash'}, status=status.HTTP_404_NOT_FOUND)
+    return await async_blob_response(request, version.content_hash, version.file.content_type, version.file_name)
+
+
+@require_GET
+async def file_versions(request, pk):
+    """List the versions of one of the user's files: the async ``GET /api/files/{id}/versions/``."""
+    try:
+        request = await sync_to_async(api_request)(request)
+    except APIException as exc:
+        return error_response(exc)
+    file = await File.objects.filter(pk=pk, owner=request.user).afirst()
+    if file is None:
+        return JsonResponse({'detail': 'No File matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+
+    def build_data():
+        paginator = CreatedAtCursorPagination()
+        page = paginator.paginate_queryset(
+            prefetch_version_relations(FileVersion.objects.filter(file=file)), request
+        )
+        serializer = FileVersionSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data).data
+
+    response = await sync_to_async(cached_listing_response)(request, build_data)
+    return json_response(response)
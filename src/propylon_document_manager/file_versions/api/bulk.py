@@ -0,0 +1,199 @@
+import json
+import mimetypes
+import posixpath
+import tarfile
+import zipfile
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.db import models, transaction
+from rest_framework.exceptions import ValidationError
+
+from ..changes import record_change
+from ..models import File, FileAccess, FileVersion, Job, SearchDocument, VersionAccess
+from ..storage import BlobTooLarge, get_blob_store
+from .serializers import BulkItemSerializer
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+def multipart_items(request):
+    """
+    Yield one item per part of the ``files`` field.
+    An optional JSON ``manifest`` lists ``url_path``/``file_name``/``content_type``
+    per part, in the same order; missing values fall back to the part itself.
+    """
+    uploads = request.FILES.getlist('files')
+    try:
+        manifest = json.loads(request.data.get('manifest') or '[]')
+    except ValueError:
+        raise ValidationError({'manifest': 'Expected a JSON list.'})
+    if not isinstance(manifest, list) or (manifest and len(manifest) != len(uploads)):
+        raise ValidationError({'manifest': 'Expected one entry per uploaded file.'})
+
+    for index, uploaded in enumerate(uploads):
+        meta = manifest[index] if manifest else {}
+        if not isinstance(meta, dict):
+            meta = {}
+        yield {
+            'url_path': meta.get('url_path') or f'/{uploaded.name}',
+            'file_name': meta.get('file_name') or uploaded.name,
+            'content_type': meta.get('content_type') or uploaded.content_type or DEFAULT_CONTENT_TYPE,
+            'chunks': uploaded.chunks(CHUNK_SIZE),
+        }
+
+
+def archive_item(name, prefix, chunks):
+    return {
+        'url_path': posixpath.normpath(posixpath.join(prefix, name.lstrip('/'))),
+        'file_name': posixpath.basename(name),
+        'content_type': mimetypes.guess_type(name)[0] or DEFAULT_CONTENT_TYPE,
+        'chunks': chunks,
+    }
+
+
+def archive_items(archive, prefix='/'):
+    """
+    Yield one item per regular file in a zip or (optionally compressed) tar archive.
+    Member paths are joined to ``prefix`` to form the ``url_path``. Tar archives
+    are read as a stream; each member must be consumed before the next is read.
+    """
+    prefix = '/' + prefix.strip('/')
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                with zf.open(info) as member:
+                    yield archive_item(info.filename, prefix, iter(partial(member.read, CHUNK_SIZE), b''))
+        return
+
+    archive.seek(0)
+    try:
+        tar = tarfile.open(fileobj=archive, mode='r|*')
+    except tarfile.TarError:
+        raise ValidationError({'archive': 'Expected a zip or tar archive.'})
+    with tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            fh = tar.extractfile(member)
+            yield archive_item(member.name, prefix, iter(partial(fh.read, CHUNK_SIZE), b''))
+
+
+def stage_items(items):
+    """
+    Stream every item's bytes into the blob store, hashing as they are written.
+    Returns one result dict per item; items that are invalid or could not be
+    stored carry an ``error`` and are left out of the database insert.
+    """
+    store = get_blob_store()
+    max_items = settings.FILE_VERSIONS_BULK_UPLOAD_MAX_ITEMS
+    results = []
+    for index, item in enumerate(items):
+        result = {'index': index, 'url_path': item['url_path'], 'file_name': item['file_name']}
+        results.append(result)
+        serializer = BulkItemSerializer(data=item)
+        if index >= max_items:
+            result['error'] = f'Too many items; at most {max_items} are accepted per request.'
+        elif not serializer.is_valid():
+            field, messages = next(iter(serializer.errors.items()))
+            result['error'] = f'{field}: {messages[0]}'
+        else:
+            try:
+                result['content_hash'], result['size'] = store.save_stream(
+                    item['chunks'], max_size=settings.FILE_VERSIONS_MAX_UPLOAD_SIZE
+                )
+            except BlobTooLarge:
+                result['error'] = 'Uploaded file exceeds the maximum allowed size.'
+            else:
+                result.update(serializer.validated_data)
+    return results
+
+
+def create_versions(owner, results):
+    """
+    Insert the versions for every staged item in a single transaction.
+    Existing files are resolved in one query and new ones bulk-created. The
+    per-file version counters, ``latest_version`` pointers and owner access
+    rows that ``File.save``/``FileVersion.save`` would maintain are updated in
+    bulk, since ``bulk_create`` bypasses both.
+    """
+    staged = [result for result in results if 'error' not in result]
+    if not staged:
+        return results
+
+    with transaction.atomic():
+        paths = {result['url_path'] for result in staged}
+        files = {file.url_path: file for file in File.objects.filter(owner=owner, url_path__in=paths)}
+        new_files = []
+        for result in staged:
+            if result['url_path'] not in files:
+                file = File(owner=owner, url_path=result['url_path'], content_type=result['content_type'])
+                files[file.url_path] = file
+                new_files.append(file)
+        File.objects.bulk_create(new_files)
+        FileAccess.objects.bulk_create(
+            FileAccess(file=file, user=owner, can_read=True, can_write=True) for file in new_files
+        )
+
+        # Reserve a contiguous block of version numbers per file.
+        counts = Counter(files[result['url_path']].pk for result in staged)
+        File.objects.filter(pk__in=counts).update(
+            latest_version_number=models.F('latest_version_number') + models.Case(
+                *[models.When(pk=pk, then=models.Value(count)) for pk, count in counts.items()],
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+        counters = dict(File.objects.filter(pk__in=counts).values_list('pk', 'latest_version_number'))
+        next_number = {pk: counters[pk] - count for pk, count in counts.items()}
+
+        versions = []
+        for result in staged:
+            file = files[result['url_path']]
+            next_number[file.pk] += 1
+            versions.append(FileVersion(
+                file=file,
+                version_number=next_number[file.pk],
+                content_hash=result['content_hash'],
+                size=result['size'],
+                file_name=result['file_name'],
+            ))
+        FileVersion.objects.bulk_create(versions)
+
+        latest = {version.file_id: version.pk for version in versions}
+        File.objects.filter(pk__in=latest).update(
+            latest_version=models.Case(
+                *[models.When(pk=file_id, then=models.Value(pk)) for file_id, pk in latest.items()],
+                output_field=models.IntegerField(),
+            )
+        )
+
+        audience = {owner.pk}
+        audience.update(FileAccess.objects.filter(file__in=latest).values_list('user_id', flat=True))
+        audience.update(VersionAccess.objects.filter(version__file__in=latest).values_list('user_id', flat=True))
+        record_change(audience)
+        for file_id in latest:
+            transaction.on_commit(partial(SearchDocument.refresh, file_id))
+        Job.enqueue(job for version in versions for job in version.background_jobs())
+
+    new_paths = {file.url_path for file in new_files}
+    for result, version in zip(staged, versions):
+        result['status'] = 'created' if result['url_path'] in new_paths else 'versioned'
+        result['file_id'] = version.file_id
+        result['version_number'] = version.version_number
+        new_paths.discard(result['url_path'])
+    return results
+
+
+def bulk_upload(owner, items):
+    """Store and insert a batch of uploads, returning one outcome per item."""
+    results = create_versions(owner, stage_items(items))
+    for result in results:
+        if 'error' in result:
+            result['status'] = 'error'
+        result.pop('content_type', None)
+    return results
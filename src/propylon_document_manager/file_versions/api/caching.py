@@ -0,0 +1,46 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from ..changes import get_change_token
+
+
+def listing_digest(request):
+    """
+    Return the ETag value for a listing as seen by the requesting user.
+    The tag combines the user's change token with the full request URI, so it
+    changes whenever anything the user can see changes, and differs between
+    pages and query parameters of the same listing.
+    """
+    token = get_change_token(request.user.pk)
+    return hashlib.sha256(f'{request.user.pk}:{token}:{request.build_absolute_uri()}'.encode()).hexdigest()
+
+
+def cached_listing_response(request, build_data):
+    """
+    Serve a listing with ``ETag``/``If-None-Match`` support.
+    A matching ``If-None-Match`` is answered with 304 before any file or
+    version query runs; otherwise the serialized payload is served from the
+    cache when present, and ``build_data()`` is only called on a miss.
+    """
+    digest = listing_digest(request)
+    etag = f'"{digest}"'
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in parse_etags(if_none_match):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        key = f'file_versions:listing:{digest}'
+        data = cache.get(key)
+        if data is None:
+            data = build_data()
+            cache.set(key, data, settings.FILE_VERSIONS_LISTING_CACHE_TIMEOUT)
+        response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization', 'Cookie'])
+    return response
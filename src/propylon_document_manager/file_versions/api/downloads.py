@@ -0,0 +1,133 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, HttpResponse
+from django.utils.http import parse_etags
+
+from ..storage import get_blob_store
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeFile:
+    """File wrapper that reads at most ``length`` bytes starting at ``start``."""
+
+    def __init__(self, fh, start, length):
+        self.fh = fh
+        self.fh.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fh.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header into an inclusive ``(start, end)`` pair.
+    Returns ``None`` when the header should be ignored and the full content
+    served, and raises ``ValueError`` when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple ranges and unknown units are allowed to be ignored.
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def blob_response(request, content_hash, content_type, filename):
+    """
+    Stream a blob with ``ETag``/``If-None-Match`` and ``Range`` support.
+    The ETag is the content hash, so it never changes for a given blob.
+    """
+    etag = f'"{content_hash}"'
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if "*" in etags or etag in etags:
+            response = HttpResponse(status=304)
+            response["ETag"] = etag
+            return response
+
+    store = get_blob_store()
+    size = store.size(content_hash)
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    fh = store.open(content_hash)
+    if byte_range is None:
+        response = FileResponse(fh, as_attachment=True, filename=filename, content_type=content_type)
+        # Compressed blobs are not seekable, so FileResponse cannot work the length out itself.
+        response["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            RangeFile(fh, start, length),
+            status=206,
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+async def aiter_file(fh, chunk_size=CHUNK_SIZE):
+    """Read ``fh`` chunk by chunk on the thread pool, yielding to the event loop between chunks."""
+    read = sync_to_async(fh.read, thread_sensitive=False)
+    while True:
+        chunk = await read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def async_blob_response(request, content_hash, content_type, filename):
+    """
+    ``blob_response`` for async views.
+    The body is streamed from an async iterator, so under ASGI no thread is
+    held while a slow client receives it; a synchronous file would instead be
+    read into memory in full before the first byte is sent.
+    """
+    response = await sync_to_async(blob_response, thread_sensitive=False)(
+        request, content_hash, content_type, filename
+    )
+    if isinstance(response, FileResponse):
+        response.streaming_content = aiter_file(response.file_to_stream)
+    return response
@@ -0,0 +1,95 @@
+import tarfile
+import time
+import zipfile
+from functools import partial
+
+from ..storage import get_blob_store
+
+CHUNK_SIZE = 64 * 1024
+
+
+def archive_name(url_path):
+    """Turn a ``url_path`` into a relative archive member name that cannot escape the extraction directory."""
+    return '/'.join(part for part in url_path.split('/') if part not in {'', '.', '..'})
+
+
+def export_entries(versions):
+    """
+    Yield ``(name, size, mtime, chunks)`` for each version, reading content
+    lazily from the blob store so only one chunk is held at a time.
+    """
+    store = get_blob_store()
+    for version in versions:
+        name = archive_name(version.file.url_path) or version.file_name
+        with store.open(version.content_hash) as fh:
+            yield name, version.size, version.created_at.timestamp(), iter(partial(fh.read, CHUNK_SIZE), b'')
+
+
+def iter_tar(entries):
+    """Stream a ustar/pax archive, writing headers and padding by hand so no member is buffered."""
+    written = 0
+    for name, size, mtime, chunks in entries:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        yield header
+        written += len(header)
+        for chunk in chunks:
+            yield chunk
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            yield tarfile.NUL * padding
+        written += size + padding
+    # Two zero blocks end the archive, padded to a whole record.
+    trailer = 2 * tarfile.BLOCKSIZE
+    trailer += -(written + trailer) % tarfile.RECORDSIZE
+    yield tarfile.NUL * trailer
+
+
+class StreamSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip(entries):
+    """
+    Stream a zip archive.
+    ``zipfile`` writes to the non-seekable sink using data descriptors, so each
+    member is compressed and emitted as it is read; only the central directory
+    (one small record per member) is kept until the end.
+    """
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, size, mtime, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with zf.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+ARCHIVE_FORMATS = {
+    'zip': (iter_zip, 'application/zip'),
+    'tar': (iter_tar, 'application/x-tar'),
+}
@@ -0,0 +1,33 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination on ``(created_at, id)``, newest first.
+    Pages are fetched with an indexed range scan, so the cost of a page does not
+    depend on how many rows precede it.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.FILE_VERSIONS_MAX_PAGE_SIZE
+
+
+class UserCursorPagination(CreatedAtCursorPagination):
+    """Keyset pagination for users, who record ``date_joined`` instead of ``created_at``."""
+    ordering = ('-date_joined', '-id')
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Page-number pagination for search results, which are ordered by score
+    rather than by a unique, indexed key that a cursor could follow.
+    """
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.FILE_VERSIONS_MAX_PAGE_SIZE
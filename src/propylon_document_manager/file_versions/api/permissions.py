@@ -1,5 +1,90 @@
+from collections import namedtuple
+
+from django.db import models
 from rest_framework import permissions
 
+from ..models import FileAccess, FileVersion, VersionAccess
+
+Rights = namedtuple('Rights', ['can_read', 'can_write'])
+NO_RIGHTS = Rights(False, False)
+OWNER_RIGHTS = Rights(True, True)
+
+
+class PermissionResolver:
+    """
+    Resolves a user's effective rights once per file and version and answers
+    every later check in the same request from memory.
+    ``hits`` and ``misses`` count how many checks were answered from memory
+    and how many had to be resolved.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.hits = 0
+        self.misses = 0
+        self._files = {}
+        self._versions = {}
+
+    def file_rights(self, file):
+        """Rights inherited by every version of ``file``."""
+        if file.pk in self._files:
+            self.hits += 1
+            return self._files[file.pk]
+        self.misses += 1
+        if file.owner_id == self.user.pk:
+            rights = OWNER_RIGHTS
+        else:
+            entry = FileAccess.objects.filter(file=file, user=self.user).values_list('can_read', 'can_write').first()
+            rights = Rights(*entry) if entry else NO_RIGHTS
+        self._files[file.pk] = rights
+        return rights
+
+    def version_rights(self, version):
+        """Rights on ``version``: its file's rights plus any per-version grant."""
+        inherited = self.file_rights(version.file)
+        if inherited.can_read and inherited.can_write:
+            # Per-version grants cannot add anything.
+            return inherited
+        if version.pk in self._versions:
+            self.hits += 1
+            return self._versions[version.pk]
+        self.misses += 1
+        entry = (
+            VersionAccess.objects.filter(version=version, user=self.user).values_list('can_read', 'can_write').first()
+        )
+        granted = Rights(*entry) if entry else NO_RIGHTS
+        rights = Rights(inherited.can_read or granted.can_read, inherited.can_write or granted.can_write)
+        self._versions[version.pk] = rights
+        return rights
+
+    def is_owner(self, file):
+        return file.owner_id == self.user.pk
+
+    def can_write_file(self, file):
+        """Whether the user may add versions to ``file``."""
+        if self.file_rights(file).can_write:
+            return True
+        return file.latest_version is not None and self.version_rights(file.latest_version).can_write
+
+
+def readable_versions(user):
+    """Return the versions ``user`` can read."""
+    # Versions inherit their file's ACL; per-version grants add to it.
+    # Both checks are indexed semi-joins, so no DISTINCT is needed
+    file_access = FileAccess.objects.filter(file=models.OuterRef('file'), user=user, can_read=True)
+    version_access = VersionAccess.objects.filter(version=models.OuterRef('pk'), user=user, can_read=True)
+    return FileVersion.objects.filter(models.Exists(file_access) | models.Exists(version_access))
+
+
+def get_permission_resolver(request):
+    """Return the permission resolver for ``request``, creating it on first use."""
+    resolver = getattr(request, '_permission_resolver', None)
+    if resolver is None or resolver.user != request.user:
+        resolver = PermissionResolver(request.user)
+        request._permission_resolver = resolver
+    return resolver
+
+
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     Custom permission to only allow owners of a file to modify it.
@@ -11,4 +96,5 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner
-        return obj.owner == request.user 
\ No newline at end of file
+        file = getattr(obj, 'file', obj)
+        return get_permission_resolver(request).is_owner(file)
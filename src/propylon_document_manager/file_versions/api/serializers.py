@@ -1,7 +1,9 @@
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from ..models import File, FileVersion
-import difflib
+from ..models import File, FileVersion, SearchDocument, UploadPart, UploadSession
+from ..diff import diff_versions
+from ..text import is_diffable_content_type
 
 User = get_user_model()
 
@@ -15,7 +17,7 @@ class FileVersionSerializer(serializers.ModelSerializer):
     """Serializer for file versions with content-addressable storage."""
     content_hash = serializers.CharField(read_only=True)
     file_name = serializers.CharField(required=True)
-    content = serializers.FileField(required=True)
+    content = serializers.FileField(required=True, write_only=True)
     can_read = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all(), required=False)
     can_write = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all(), required=False)
     diff_with_previous = serializers.SerializerMethodField()
@@ -28,33 +30,34 @@ class FileVersionSerializer(serializers.ModelSerializer):
 
     def validate_content(self, value):
         """Validate file content and calculate hash."""
+        if self.instance is not None:
+            raise serializers.ValidationError("Content cannot be changed; upload a new version instead.")
         if not value:
             raise serializers.ValidationError("File content is required")
         return value
 
+    def get_fields(self):
+        """Only include the diff when the request asks for it with ``?include=diff``."""
+        fields = super().get_fields()
+        if self.instance is not None:
+            # Versions are addressed by the hash of their bytes, so content is set once.
+            fields['content'].required = False
+        request = self.context.get('request')
+        include = request.query_params.get('include', '') if request is not None else ''
+        if 'diff' not in include.split(','):
+            fields.pop('diff_with_previous')
+        return fields
+
     def get_diff_with_previous(self, obj):
         """Get the differences between this version and the previous version."""
-        previous_version = FileVersion.objects.filter(
-            file=obj.file,
-            version_number__lt=obj.version_number
-        ).order_by('-version_number').first()
+        if not is_diffable_content_type(obj.file.content_type):
+            return None
 
+        previous_version = obj.get_previous_version()
         if not previous_version:
             return None
 
-        # Convert binary content to strings for comparison
-        current_content = obj.content.decode('utf-8', errors='ignore')
-        previous_content = previous_version.content.decode('utf-8', errors='ignore')
-
-        # Generate diff
-        diff = difflib.unified_diff(
-            previous_content.splitlines(),
-            current_content.splitlines(),
-            fromfile=f'v{previous_version.version_number}',
-            tofile=f'v{obj.version_number}',
-            lineterm=''
-        )
-        return '\n'.join(diff)
+        return diff_versions(previous_version, obj)
 
     def get_file_owner(self, obj):
         """Get the owner of the file."""
@@ -67,22 +70,43 @@ class FileSerializer(serializers.ModelSerializer):
     """Serializer for files with their latest version."""
     latest_version = serializers.SerializerMethodField()
     versions = FileVersionSerializer(many=True, read_only=True)
-    
+    can_read = serializers.SerializerMethodField()
+    can_write = serializers.SerializerMethodField()
+
     class Meta:
         model = File
-        fields = ['id', 'url_path', 'owner', 'versions', 'created_at', 'content_type', 'latest_version']
+        fields = [
+            'id',
+            'url_path',
+            'owner',
+            'versions',
+            'created_at',
+            'content_type',
+            'latest_version',
+            'can_read',
+            'can_write',
+        ]
         read_only_fields = ['id', 'owner', 'created_at']
 
     def get_latest_version(self, obj):
-        """Get the latest version of the file."""
-        if hasattr(obj, 'versions'):
-            latest = obj.versions.first()
-        else:
+        """
+        Get the latest version of the file through its denormalized pointer,
+        or, for snapshot reads, the version current at ``as_of``.
+        """
+        if hasattr(obj, 'as_of_version_id'):
+            version = next(v for v in obj.versions.all() if v.pk == obj.as_of_version_id)
+            return FileVersionSerializer(version, context=self.context).data
+        if obj.latest_version_id is None:
             return None
-            
-        if latest:
-            return FileVersionSerializer(latest).data
-        return None
+        return FileVersionSerializer(obj.latest_version, context=self.context).data
+
+    def get_can_read(self, obj):
+        """Users other than the owner who can read every version."""
+        return [entry.user_id for entry in obj.access.all() if entry.can_read and entry.user_id != obj.owner_id]
+
+    def get_can_write(self, obj):
+        """Users other than the owner who can write every version."""
+        return [entry.user_id for entry in obj.access.all() if entry.can_write and entry.user_id != obj.owner_id]
 
     def validate_url_path(self, value):
         """Validate URL path format."""
@@ -94,3 +118,94 @@ class FileSerializer(serializers.ModelSerializer):
         """Create a new file with initial version."""
         validated_data['owner'] = self.context['request'].user
         return super().create(validated_data)
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    """A file matching a search, with the version whose text was indexed."""
+    id = serializers.IntegerField(source='file_id', read_only=True)
+    content_hash = serializers.CharField(source='version.content_hash', default=None, read_only=True)
+    version_number = serializers.IntegerField(source='version.version_number', default=None, read_only=True)
+    score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SearchDocument
+        fields = ['id', 'url_path', 'file_name', 'content_hash', 'version_number', 'score']
+
+
+class ContentClaimSerializer(serializers.Serializer):
+    """A new version whose content the client identifies by its SHA-256 instead of uploading it."""
+    url_path = serializers.CharField(max_length=255)
+    file_name = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100, required=False, default='')
+    content_hash = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+
+    def validate_url_path(self, value):
+        """Validate URL path format."""
+        if not value.startswith('/'):
+            raise serializers.ValidationError("URL path must start with a forward slash")
+        return value
+
+    def validate_content_hash(self, value):
+        return value.lower()
+
+
+class BulkItemSerializer(serializers.Serializer):
+    """The path and names of one bulk upload item, from the manifest or the uploaded part."""
+    url_path = serializers.CharField(max_length=255)
+    file_name = serializers.CharField(max_length=255)
+    content_type = serializers.CharField()
+
+    def validate_url_path(self, value):
+        """Validate URL path format."""
+        if not value.startswith('/'):
+            raise serializers.ValidationError("URL path must start with a forward slash")
+        return value
+
+    def validate_content_type(self, value):
+        return value[:100]
+
+
+class UploadPartSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadPart
+        fields = ['number', 'size', 'sha256', 'uploaded_at']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    A resumable upload: the parts received so far, and those still missing.
+    ``part_size`` defaults to ``FILE_VERSIONS_UPLOAD_PART_SIZE``.
+    """
+    size = serializers.IntegerField(min_value=1)
+    part_size = serializers.IntegerField(min_value=1, required=False)
+    part_count = serializers.IntegerField(read_only=True)
+    parts = UploadPartSerializer(many=True, read_only=True)
+    missing_parts = serializers.SerializerMethodField()
+    file = serializers.IntegerField(source='version.file_id', default=None, read_only=True)
+    content_hash = serializers.CharField(source='version.content_hash', default=None, read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'url_path', 'file_name', 'content_type', 'size', 'part_size', 'part_count', 'parts',
+            'missing_parts', 'created_at', 'expires_at', 'completed_at', 'file', 'content_hash',
+        ]
+        read_only_fields = ['id', 'created_at', 'expires_at', 'completed_at']
+
+    def get_missing_parts(self, obj):
+        received = {part.number for part in obj.parts.all()}
+        return [number for number in range(1, obj.part_count + 1) if number not in received]
+
+    def validate_url_path(self, value):
+        """Validate URL path format."""
+        if not value.startswith('/'):
+            raise serializers.ValidationError("URL path must start with a forward slash")
+        return value
+
+    def validate(self, attrs):
+        max_parts = settings.FILE_VERSIONS_UPLOAD_MAX_PARTS
+        if 'part_size' not in attrs:
+            attrs['part_size'] = max(settings.FILE_VERSIONS_UPLOAD_PART_SIZE, -(-attrs['size'] // max_parts))
+        elif -(-attrs['size'] // attrs['part_size']) > max_parts:
+            raise serializers.ValidationError({'part_size': f'Too many parts; at most {max_parts} are accepted.'})
+        return attrs
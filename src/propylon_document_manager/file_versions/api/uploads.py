@@ -0,0 +1,200 @@
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from ..models import File, FileVersion, UploadPart, UploadSession
+from ..storage import BlobTooLarge, get_blob_store
+from .bulk import CHUNK_SIZE, DEFAULT_CONTENT_TYPE
+from .permissions import readable_versions
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Uploaded file exceeds the maximum allowed size."
+    default_code = "upload_too_large"
+
+
+class UploadIncomplete(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Some parts of this upload have not been received."
+    default_code = "upload_incomplete"
+
+    def __init__(self, missing_parts):
+        super().__init__()
+        # Kept as numbers, which the default detail handling would turn into strings.
+        self.detail = {'detail': self.detail, 'missing_parts': missing_parts}
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This upload is being completed by another request, or its parts are no longer available."
+    default_code = "upload_conflict"
+
+
+def store_upload(uploaded_file):
+    """
+    Stream an uploaded file into the blob store.
+    Reads the upload chunk by chunk, hashing and writing each chunk in a single
+    pass. The bytes are stored as is; compression and other per-blob work is
+    left to background jobs. Returns ``(content_hash, size)``.
+    """
+    max_size = settings.FILE_VERSIONS_MAX_UPLOAD_SIZE
+    if uploaded_file.size is not None and uploaded_file.size > max_size:
+        raise UploadTooLarge()
+    try:
+        return get_blob_store().save_stream(uploaded_file.chunks(), max_size=max_size)
+    except BlobTooLarge:
+        raise UploadTooLarge()
+
+
+def add_version(owner, url_path, file_name, content_type, content_hash, size):
+    """
+    Add a version with already stored content to the owner's file at
+    ``url_path``, creating the file if the owner has none there.
+    """
+    with transaction.atomic():
+        # get_or_create refetches the file if a concurrent request created it first.
+        file, _ = File.objects.get_or_create(
+            owner=owner, url_path=url_path, defaults={'content_type': content_type or DEFAULT_CONTENT_TYPE}
+        )
+        return FileVersion.objects.create(file=file, file_name=file_name, content_hash=content_hash, size=size)
+
+
+def claim_content(owner, url_path, file_name, content_type, content_hash):
+    """
+    Add a version whose content is already stored, without uploading it.
+    The content must belong to a version ``owner`` can read; otherwise, or if
+    nothing has that hash, ``NotFound`` is raised either way, so the hashes of
+    other users' documents cannot be probed. The new file, if one is created,
+    takes its content type from that version's file unless one is given.
+    """
+    source = readable_versions(owner).filter(content_hash=content_hash).select_related('file').first()
+    if source is None or not get_blob_store().exists(content_hash):
+        raise NotFound('No readable content with this hash; upload it instead.')
+    return add_version(
+        owner, url_path, file_name, content_type or source.file.content_type, content_hash, source.size
+    )
+
+
+def start_session(serializer, owner):
+    """Create an upload session from a validated ``UploadSessionSerializer`` and reserve its file."""
+    if serializer.validated_data['size'] > settings.FILE_VERSIONS_MAX_UPLOAD_SIZE:
+        raise UploadTooLarge()
+    session = serializer.save(
+        owner=owner,
+        expires_at=timezone.now() + timedelta(seconds=settings.FILE_VERSIONS_UPLOAD_SESSION_TIMEOUT),
+    )
+    get_blob_store().start_upload(session.id, session.size)
+    return session
+
+
+def lock_open_session(session):
+    """Lock an upload session's row, failing if it has been completed meanwhile."""
+    session = UploadSession.objects.select_for_update().get(pk=session.pk)
+    if session.closed_at is not None:
+        raise ValidationError({'detail': 'This upload is already complete.'})
+    return session
+
+
+def store_part(session, number, stream, sha256=None):
+    """
+    Write part ``number`` of an upload session from ``stream``, hashing it as it
+    is written. Every part but the last must be exactly ``part_size`` bytes.
+    A part sent again replaces the earlier attempt. If ``sha256`` is given, a
+    part whose bytes do not match it is rejected, so the client can resend it.
+
+    The part counts as missing from before its bytes are overwritten until
+    they are all written, so completion never sees a part half rewritten.
+    The session row is only locked around those bookkeeping steps, not while
+    the body streams in, so parts still upload in parallel.
+    """
+    if not 1 <= number <= session.part_count:
+        raise ValidationError({'number': f'Expected a part number from 1 to {session.part_count}.'})
+    with transaction.atomic():
+        session = lock_open_session(session)
+        session.parts.filter(number=number).delete()
+    offset, expected = session.part_range(number)
+    chunks = iter(partial(stream.read, CHUNK_SIZE), b'') if stream is not None else iter(())
+    try:
+        size, digest = get_blob_store().write_part(session.id, offset, chunks, max_size=expected)
+    except BlobTooLarge:
+        raise ValidationError({'detail': f'Part {number} must be {expected} bytes.'})
+    except KeyError:
+        raise ValidationError({'detail': 'This upload is already complete.'})
+    if size != expected:
+        raise ValidationError({'detail': f'Part {number} must be {expected} bytes; received {size}.'})
+    if sha256 is not None and sha256.lower() != digest:
+        raise ValidationError({'sha256': f'Part {number} does not match its SHA-256; send it again.'})
+    with transaction.atomic():
+        session = lock_open_session(session)
+        part, _ = UploadPart.objects.update_or_create(
+            session=session, number=number, defaults={'size': size, 'sha256': digest}
+        )
+    return part
+
+
+def lock_session(session):
+    session = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+    if session is None:
+        raise NotFound()
+    return session
+
+
+def complete_session(session):
+    """
+    Move a fully uploaded session into the blob store and create its version,
+    adding a new file at the session's ``url_path`` if the owner has none.
+
+    The session is closed to further parts first. The upload is then hashed
+    and moved into the store outside any transaction, and its hash recorded,
+    so only the version insert holds database locks. Each step can be
+    retried: completing a closed session picks up where the last attempt
+    stopped, and completing a completed session returns the version created
+    the first time.
+    """
+    with transaction.atomic():
+        session = lock_session(session)
+        if session.completed_at is not None:
+            if session.version is None:
+                raise ValidationError({'detail': 'The version created by this upload has been deleted.'})
+            return session.version
+        if session.closed_at is None:
+            missing = session.missing_parts()
+            if missing:
+                raise UploadIncomplete(missing)
+            session.closed_at = timezone.now()
+            session.save(update_fields=['closed_at'])
+
+    if not session.content_hash:
+        try:
+            content_hash, _ = get_blob_store().commit_upload(session.id)
+        except KeyError:
+            # Committed by a concurrent request, which records the hash next.
+            raise UploadConflict()
+        UploadSession.objects.filter(pk=session.pk).update(content_hash=content_hash)
+        session.content_hash = content_hash
+
+    with transaction.atomic():
+        session = lock_session(session)
+        if session.completed_at is not None:
+            return session.version
+        version = add_version(
+            session.owner, session.url_path, session.file_name, session.content_type, session.content_hash,
+            session.size,
+        )
+        session.version = version
+        session.completed_at = timezone.now()
+        session.save(update_fields=['version', 'completed_at'])
+    return version
+
+
+def abort_session(session):
+    """Delete an upload session and discard the parts written so far."""
+    if not session.content_hash:
+        get_blob_store().abort_upload(session.id)
+    session.delete()
@@ -1,22 +1,85 @@
+import logging
+
+from django.conf import settings
 from django.shortcuts import render
 from django.db import models
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.shortcuts import get_object_or_404
-from django.db.models import Max
+from django.db.models import Max, Prefetch
 from django.contrib.auth import get_user_model
 
-from ..models import File, FileVersion
-from .serializers import FileSerializer, FileVersionSerializer, UserSerializer
-from .permissions import IsOwnerOrReadOnly
+from ..models import File, FileVersion, UploadSession
+from ..diff import diff_versions
+from ..text import get_text, is_diffable_content_type
+from ..search import search_documents
+from .serializers import (
+    ContentClaimSerializer, FileSerializer, FileVersionSerializer, SearchResultSerializer, UploadSessionSerializer,
+    UserSerializer,
+)
+from .permissions import IsOwnerOrReadOnly, get_permission_resolver, readable_versions
+from .uploads import abort_session, claim_content, complete_session, start_session, store_part, store_upload
+from .downloads import blob_response
+from .pagination import SearchPagination, UserCursorPagination
+from .caching import cached_listing_response
+from .bulk import archive_items, bulk_upload, multipart_items
+from .exports import ARCHIVE_FORMATS, export_entries
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+UPLOAD_ID = r'(?P<upload_id>[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12})'
+
+
+def prefetch_version_relations(queryset):
+    """Select and prefetch everything FileVersionSerializer reads for each version."""
+    return queryset.select_related('file__owner').prefetch_related(
+        'can_read',
+        'can_write',
+        Prefetch(
+            'file__versions',
+            queryset=FileVersion.objects.only('id', 'file_id', 'version_number', 'content_hash'),
+        ),
+    )
+
+
+def parse_as_of(value):
+    """Parse an ``as_of`` query parameter into an aware datetime, or ``None`` when absent."""
+    if not value:
+        return None
+    try:
+        as_of = parse_datetime(value)
+    except ValueError:
+        as_of = None
+    if as_of is None:
+        raise ValidationError({'as_of': 'Expected an ISO 8601 timestamp.'})
+    if timezone.is_naive(as_of):
+        as_of = timezone.make_aware(as_of)
+    return as_of
+
+
+class PermissionResolverMixin:
+    """Log how many permission checks the request-scoped resolver answered from memory."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        resolver = getattr(request, '_permission_resolver', None)
+        if resolver is not None:
+            logger.debug(
+                "%s %s: %d permission checks from memory, %d resolved",
+                request.method, request.path, resolver.hits, resolver.misses,
+            )
+        return super().finalize_response(request, response, *args, **kwargs)
+
 
-class FileViewSet(viewsets.ModelViewSet):
+class FileViewSet(PermissionResolverMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing files and their versions.
     Provides endpoints for:
@@ -26,93 +89,272 @@ class FileViewSet(viewsets.ModelViewSet):
     - Listing user's files
     """
     serializer_class = FileSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     
     def get_queryset(self):
-        """Return files owned by the current user."""
-        return File.objects.filter(owner=self.request.user)
+        """Return files owned by the current user, with everything the serializer reads prefetched."""
+        if self.action in {'list', 'retrieve'}:
+            as_of = parse_as_of(self.request.query_params.get('as_of'))
+            if as_of is not None:
+                return self.get_snapshot_queryset(as_of)
+        return File.objects.filter(owner=self.request.user).select_related(
+            'owner', 'latest_version__file__owner'
+        ).prefetch_related(
+            Prefetch('versions', queryset=FileVersion.objects.prefetch_related('can_read', 'can_write')),
+            'latest_version__can_read',
+            'latest_version__can_write',
+            'access',
+        )
+
+    def get_snapshot_queryset(self, as_of):
+        """
+        Return the user's files as they were at ``as_of``.
+        Each file is annotated with ``as_of_version_id``, the newest version
+        created at or before ``as_of``, resolved by a correlated subquery that
+        walks the ``(file, -created_at, -id)`` index. Files without a version at
+        that time are left out, and only versions up to ``as_of`` are prefetched.
+        """
+        current = FileVersion.objects.filter(
+            file=models.OuterRef('pk'), created_at__lte=as_of
+        ).order_by('-created_at', '-id')
+        return File.objects.filter(owner=self.request.user).annotate(
+            as_of_version_id=models.Subquery(current.values('pk')[:1])
+        ).filter(as_of_version_id__isnull=False).select_related('owner').prefetch_related(
+            Prefetch(
+                'versions',
+                queryset=FileVersion.objects.filter(created_at__lte=as_of).prefetch_related('can_read', 'can_write'),
+            ),
+            'access',
+        )
 
     def perform_create(self, serializer):
         # Check if a file with the same URL path already exists for this user
         url_path = self.request.data.get('url_path')
         existing_file = File.objects.filter(owner=self.request.user, url_path=url_path).first()
-        
+        uploaded = self.request.FILES.get('content')
+
         if existing_file:
+            if uploaded is None:
+                raise ValidationError({'content': 'File content is required to add a version.'})
             # Create a new version of the existing file
-            content = self.request.FILES.get('content').read()
-            file_version = FileVersion.objects.create(
+            content_hash, size = store_upload(uploaded)
+            FileVersion.objects.create(
                 file=existing_file,
                 file_name=self.request.data.get('file_name'),
-                content=content,
-                version_number=existing_file.versions.count() + 1
+                content_hash=content_hash,
+                size=size,
             )
-            # Return the updated file with all versions
-            return Response(FileSerializer(existing_file).data, status=status.HTTP_201_CREATED)
-        
+            serializer.instance = existing_file
+            return
+
+        # Stream the content into the blob store before touching the database
+        if uploaded is not None:
+            content_hash, size = store_upload(uploaded)
+
         # If no existing file, create a new one with content_type
         file = serializer.save(
             owner=self.request.user,
             content_type=self.request.data.get('content_type')
         )
-        
+
         # Create the initial version
-        content = self.request.FILES.get('content').read()
-        file_version = FileVersion.objects.create(
-            file=file,
-            file_name=self.request.data.get('file_name'),
-            content=content,
-            version_number=1
+        if uploaded is not None:
+            FileVersion.objects.create(
+                file=file,
+                file_name=self.request.data.get('file_name'),
+                content_hash=content_hash,
+                size=size,
+            )
+
+    def list(self, request, *args, **kwargs):
+        return cached_listing_response(request, lambda: super(FileViewSet, self).list(request, *args, **kwargs).data)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_upload(self, request):
+        """
+        Add many files or versions in one request.
+        Accepts either multipart ``files`` parts (with an optional JSON
+        ``manifest``) or a single zip/tar ``archive`` unpacked under ``prefix``.
+        """
+        archive = request.FILES.get('archive')
+        if archive is not None:
+            items = archive_items(archive, request.data.get('prefix', '/'))
+        else:
+            items = multipart_items(request)
+        return Response({'results': bulk_upload(request.user, items)})
+
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        """
+        Add a version by the SHA-256 of its content, skipping the upload when
+        the content is already stored and readable by the user. Responds
+        ``404`` otherwise, and the client uploads the content as usual.
+        """
+        serializer = ContentClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        version = claim_content(request.user, **serializer.validated_data)
+        file = self.get_queryset().get(pk=version.file_id)
+        return Response(
+            FileSerializer(file, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED
         )
-        
-        # Return the file with its initial version
-        return Response(FileSerializer(file).data, status=status.HTTP_201_CREATED)
+
+    def get_upload_session(self, upload_id):
+        sessions = UploadSession.objects.filter(owner=self.request.user, expires_at__gt=timezone.now())
+        return get_object_or_404(sessions.prefetch_related('parts'), pk=upload_id)
+
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request):
+        """
+        Start a resumable upload of a new file, or a new version of the file at
+        ``url_path``. The content is then sent in numbered parts, which may be
+        retried and sent in parallel, and the upload completed once all arrived.
+        """
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = start_session(serializer, request.user)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'delete'], url_path=rf'uploads/{UPLOAD_ID}')
+    def upload(self, request, upload_id=None):
+        """Show which parts of an upload have been received, or abort it."""
+        session = self.get_upload_session(upload_id)
+        if request.method == 'DELETE':
+            abort_session(session)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(UploadSessionSerializer(session).data)
+
+    @action(detail=False, methods=['put'], url_path=rf'uploads/{UPLOAD_ID}/parts/(?P<number>[0-9]+)')
+    def upload_part(self, request, upload_id=None, number=None):
+        """
+        Store one part from the raw request body. An ``X-Content-SHA256``
+        header, if sent, is checked against the bytes received.
+        """
+        session = self.get_upload_session(upload_id)
+        part = store_part(session, int(number), request.stream, request.headers.get('X-Content-SHA256'))
+        return Response({'number': part.number, 'size': part.size, 'sha256': part.sha256})
+
+    @action(detail=False, methods=['post'], url_path=rf'uploads/{UPLOAD_ID}/complete')
+    def complete_upload(self, request, upload_id=None):
+        """Assemble the uploaded parts into a new version and return its file."""
+        version = complete_session(self.get_upload_session(upload_id))
+        file = self.get_queryset().get(pk=version.file_id)
+        return Response(
+            FileSerializer(file, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every file under ``prefix`` as a zip or tar archive.
+        Exports the latest versions, or version ``revision`` of each file, or
+        the versions current at ``as_of``.
+        """
+        archive = request.query_params.get('archive', 'zip')
+        if archive not in ARCHIVE_FORMATS:
+            raise ValidationError({'archive': f'Expected one of: {", ".join(ARCHIVE_FORMATS)}.'})
+        prefix = request.query_params.get('prefix', '/')
+        revision = request.query_params.get('revision')
+        as_of = parse_as_of(request.query_params.get('as_of'))
+
+        files = File.objects.filter(owner=request.user, url_path__startswith=prefix)
+        versions = FileVersion.objects.filter(file__in=files)
+        if revision is not None:
+            try:
+                versions = versions.filter(version_number=int(revision))
+            except ValueError:
+                raise ValidationError({'revision': 'Expected an integer.'})
+        elif as_of is not None:
+            current = FileVersion.objects.filter(
+                file=models.OuterRef('file'), created_at__lte=as_of
+            ).order_by('-created_at', '-id')
+            versions = versions.filter(pk=models.Subquery(current.values('pk')[:1]))
+        else:
+            versions = versions.filter(file__latest_version=models.F('pk'))
+        versions = versions.select_related('file').order_by('file__url_path').iterator(chunk_size=500)
+
+        write_archive, content_type = ARCHIVE_FORMATS[archive]
+        response = StreamingHttpResponse(write_archive(export_entries(versions)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="export.{archive}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over the paths, names and latest-version text of every
+        file the user can read, best match first.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'A search query is required.'})
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(search_documents(request.user, query), request, view=self)
+        return paginator.get_paginated_response(SearchResultSerializer(page, many=True).data)
 
     @action(detail=True, methods=['get'])
     def versions(self, request, pk=None):
-        file = self.get_object()
-        versions = FileVersion.objects.filter(file=file).order_by('-created_at')
-        serializer = FileVersionSerializer(versions, many=True)
-        return Response(serializer.data)
+        def build_data():
+            file = self.get_object()
+            page = self.paginate_queryset(prefetch_version_relations(FileVersion.objects.filter(file=file)))
+            serializer = FileVersionSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data).data
+
+        return cached_listing_response(request, build_data)
 
     @action(detail=True, methods=['get'])
     def get_version(self, request, pk=None):
         """
-        Get a specific version of a file by revision number.
-        If no revision is specified, returns the latest version.
+        Get a specific version of a file by revision number, or the version
+        that was current at the ``as_of`` timestamp.
+        If neither is specified, returns the latest version.
         """
         file = self.get_object()
         revision = request.query_params.get('revision')
+        as_of = parse_as_of(request.query_params.get('as_of'))
         
         if revision is not None:
             try:
                 revision = int(revision)
-                version = FileVersion.objects.get(file=file, version_number=revision)
+                version = file.versions.get(version_number=revision)
             except (ValueError, FileVersion.DoesNotExist):
                 raise Http404("Version not found")
+        elif as_of is not None:
+            version = file.versions.filter(created_at__lte=as_of).order_by('-created_at', '-id').first()
+            if not version:
+                raise Http404("No version at that time")
         else:
-            version = file.versions.first()
+            version = file.latest_version
             if not version:
                 raise Http404("No versions found")
         
-        serializer = FileVersionSerializer(version)
+        serializer = FileVersionSerializer(version, context=self.get_serializer_context())
         return Response(serializer.data)
 
-class FileVersionViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def set_permissions(self, request, pk=None):
+        """Set read/write permissions for every version of a file."""
+        file = self.get_object()
+        read_users = User.objects.filter(id__in=request.data.get('can_read', []))
+        write_users = User.objects.filter(id__in=request.data.get('can_write', []))
+
+        # Prevent setting permissions for the file owner
+        if file.owner in read_users or file.owner in write_users:
+            raise PermissionDenied("Cannot set permissions for the file owner.")
+
+        file.set_grants(read_users, write_users)
+        return Response(FileSerializer(self.get_object(), context=self.get_serializer_context()).data)
+
+class FileVersionViewSet(PermissionResolverMixin, viewsets.ModelViewSet):
     """
     ViewSet for retrieving file versions.
     Read-only access to file versions with content-addressable storage.
     """
     serializer_class = FileVersionSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
     lookup_field = 'content_hash'
 
     def get_queryset(self):
         """Return versions that the user has read access to."""
-        user = self.request.user
-        return FileVersion.objects.filter(
-            models.Q(file__owner=user) |  # User owns the file
-            models.Q(can_read=user)       # User has read permission
-        ).distinct()
+        return prefetch_version_relations(readable_versions(self.request.user))
 
     def get_object(self):
         """
@@ -129,26 +371,93 @@ class FileVersionViewSet(viewsets.ModelViewSet):
             raise Http404("No version found with this content hash")
             
         # Return the latest version
-        return versions.latest('created_at')
+        version = versions.latest('created_at')
+        self.check_object_permissions(self.request, version)
+        return version
 
     def perform_create(self, serializer):
         """Create a new version with proper permissions."""
         file = serializer.validated_data['file']
-        if file.owner != self.request.user and self.request.user not in file.versions.first().can_write.all():
-            raise permissions.PermissionDenied("You don't have write permission for this file.")
-        
-        # Set the version number
-        latest_version = file.versions.order_by('-version_number').first()
-        version_number = (latest_version.version_number + 1) if latest_version else 1
+        if not get_permission_resolver(self.request).can_write_file(file):
+            raise PermissionDenied("You don't have write permission for this file.")
         
-        serializer.save(version_number=version_number)
+        # The version number is allocated atomically when the version is saved
+        content_hash, size = store_upload(serializer.validated_data.pop('content'))
+        version = serializer.save(content_hash=content_hash, size=size)
+        version.rebuild_access()
+
+    def perform_update(self, serializer):
+        version = serializer.save()
+        version.rebuild_access()
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, content_hash=None):
+        """
+        Stream the raw bytes of a version.
+        Supports Range requests and conditional GETs keyed on the content hash.
+        """
+        version = self.get_object()
+        return blob_response(request, version.content_hash, version.file.content_type, version.file_name)
+
+    @action(detail=True, methods=['get'])
+    def diff(self, request, content_hash=None):
+        """
+        Diff this version against another readable version.
+        Compares against the previous version of the same file unless
+        ``?against=<content_hash>`` names another version.
+        """
+        version = self.get_object()
+        against = request.query_params.get('against')
+        if against:
+            other = self.get_queryset().filter(content_hash=against).first()
+            if other is None:
+                raise Http404("No version found with this content hash")
+        else:
+            other = version.get_previous_version()
+            if other is None:
+                raise Http404("No previous version to compare against")
+
+        for content_type in {version.file.content_type, other.file.content_type}:
+            if not is_diffable_content_type(content_type):
+                raise ValidationError(f"Cannot diff binary content of type '{content_type}'.")
+
+        diff = diff_versions(other, version)
+        if diff is None:
+            return Response(
+                {'detail': 'Text extraction for these versions has not finished yet.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({
+            'from': other.content_hash,
+            'to': version.content_hash,
+            'diff': diff,
+        })
+
+    @action(detail=True, methods=['get'])
+    def text(self, request, content_hash=None):
+        """
+        Preview the text of a version: text content as is, or the text
+        extracted from PDF and DOCX documents.
+        """
+        version = self.get_object()
+        text = get_text(
+            version.content_hash, version.file.content_type, max_size=settings.FILE_VERSIONS_PREVIEW_MAX_SIZE
+        )
+        if text is None and is_diffable_content_type(version.file.content_type):
+            return Response(
+                {'detail': 'Text extraction for this version has not finished yet.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if text is None:
+            raise ValidationError(f"Content of type '{version.file.content_type}' has no text form.")
+        return Response({'content_hash': version.content_hash, 'text': text})
 
     @action(detail=True, methods=['post'])
     def set_permissions(self, request, content_hash=None):
         """Set read/write permissions for a version."""
         version = self.get_object()
-        if version.file.owner != request.user:
-            raise permissions.PermissionDenied("Only the file owner can set permissions.")
+        if not get_permission_resolver(request).is_owner(version.file):
+            raise PermissionDenied("Only the file owner can set permissions.")
         
         can_read = request.data.get('can_read', [])
         can_write = request.data.get('can_write', [])
@@ -159,10 +468,9 @@ class FileVersionViewSet(viewsets.ModelViewSet):
         
         # Prevent setting permissions for the file owner
         if version.file.owner in read_users or version.file.owner in write_users:
-            raise permissions.PermissionDenied("Cannot set permissions for the file owner.")
+            raise PermissionDenied("Cannot set permissions for the file owner.")
         
-        version.can_read.set(read_users)
-        version.can_write.set(write_users)
+        version.set_grants(read_users, write_users)
         
         return Response(FileVersionSerializer(version).data)
 
@@ -170,5 +478,7 @@ class FileVersionViewSet(viewsets.ModelViewSet):
     def available_users(self, request):
         """Get list of users that can be granted permissions."""
         users = User.objects.exclude(id=request.user.id)  # Exclude current user
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = UserSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,36 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def change_token_key(user_id):
+    return f'file_versions:changes:{user_id}'
+
+
+def get_change_token(user_id):
+    """
+    Return the user's current change token.
+    The token is replaced whenever a file, version or permission the user can
+    see changes. A token lost from the cache is replaced by a fresh random
+    one, so eviction can only cause a miss, never a stale hit. The same holds
+    when the cache cannot store the token at all (a dummy cache, or a cache
+    server that is down): every call then returns a new token.
+    """
+    key = change_token_key(user_id)
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        token = cache.get(key)
+    return token or uuid.uuid4().hex
+
+
+def record_change(user_ids):
+    """Replace the change tokens of ``user_ids`` once the current transaction commits."""
+    user_ids = set(user_ids)
+
+    def bump():
+        cache.set_many({change_token_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+    if user_ids:
+        transaction.on_commit(bump)
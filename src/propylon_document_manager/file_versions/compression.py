@@ -0,0 +1,132 @@
+"""
+Blob compression.
+
+Compressed blobs start with a small header recording the codec and the size
+of the original content, followed by the compressed stream. Content hashes
+always cover the original bytes, so compression is invisible to callers.
+"""
+import fnmatch
+import struct
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MAGIC = b'PDMZ'
+HEADER = struct.Struct('>4scQ')
+CHUNK_SIZE = 64 * 1024
+
+ZLIB = b'z'
+ZSTD = b's'
+
+
+def available_codecs():
+    return {'zlib': ZLIB, 'zstd': ZSTD} if zstandard is not None else {'zlib': ZLIB}
+
+
+def codec_for(content_type):
+    """
+    Return the codec to store content of ``content_type`` with, or ``None``
+    to store it uncompressed. Unknown content types and already-compressed
+    formats matching ``FILE_VERSIONS_UNCOMPRESSED_CONTENT_TYPES`` are skipped.
+    """
+    name = settings.FILE_VERSIONS_BLOB_COMPRESSION
+    if not name or not content_type:
+        return None
+    content_type = content_type.split(';')[0].strip().lower()
+    if any(fnmatch.fnmatch(content_type, pattern) for pattern in settings.FILE_VERSIONS_UNCOMPRESSED_CONTENT_TYPES):
+        return None
+    codecs = available_codecs()
+    if name == 'auto':
+        return codecs.get('zstd', ZLIB)
+    return codecs.get(name, ZLIB)
+
+
+def compressor(codec):
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return zlib.compressobj(6)
+
+
+def pack_header(codec, size):
+    return HEADER.pack(MAGIC, codec, size)
+
+
+def unpack_header(data):
+    """Return ``(codec, size)`` from the first ``HEADER.size`` bytes of a compressed blob."""
+    magic, codec, size = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError('not a compressed blob')
+    return codec, size
+
+
+class DecompressingReader:
+    """
+    Read-only file object that decompresses a compressed blob as it is read.
+    Only forward seeks are supported; they decompress and discard the skipped
+    bytes, which is enough for serving ``Range`` requests.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.codec, self.size = unpack_header(fh.read(HEADER.size))
+        if self.codec == ZSTD:
+            if zstandard is None:
+                raise RuntimeError('zstandard is required to read this blob')
+            self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            self.decompressor = zlib.decompressobj()
+        self.buffer = b''
+        self.position = 0
+
+    def _fill(self, size):
+        while len(self.buffer) < size:
+            if self.codec == ZLIB and self.decompressor.unconsumed_tail:
+                data = self.decompressor.unconsumed_tail
+            else:
+                data = self.fh.read(CHUNK_SIZE)
+                if not data:
+                    return
+            if self.codec == ZLIB:
+                self.buffer += self.decompressor.decompress(data, max(size - len(self.buffer), CHUNK_SIZE))
+            else:
+                self.buffer += self.decompressor.decompress(data)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        self._fill(size)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+        if offset < self.position:
+            raise OSError('compressed blobs only support forward seeks')
+        while self.position < offset:
+            if not self.read(min(CHUNK_SIZE, offset - self.position)):
+                break
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
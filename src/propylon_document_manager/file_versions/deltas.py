@@ -0,0 +1,96 @@
+"""
+Line-based binary deltas between blobs.
+
+A delta describes a target blob as a sequence of operations against a base
+blob: ``COPY offset length`` reuses a byte range of the base, ``INSERT data``
+adds new bytes. Copies are found by matching lines with the Myers engine, so
+encoding costs grow with how much changed rather than with the document size.
+"""
+from .diff_engine import matching_blocks
+
+MAGIC = b'PDMDELTA1\n'
+COPY = b'C'
+INSERT = b'I'
+
+
+def _write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_delta(base_hash, base, target, max_cost=None, timeout=None):
+    """
+    Return a delta that rebuilds ``target`` from the blob ``base_hash``, whose
+    bytes are ``base``. Raises ``DiffTooLarge`` when matching exceeds its budget.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    offsets = [0]
+    for line in base_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    out = bytearray(MAGIC)
+    out += base_hash.encode('ascii')
+    _write_varint(out, len(target))
+    j = 0
+    for i, jb, size in matching_blocks(base_lines, target_lines, max_cost=max_cost, timeout=timeout):
+        if jb > j:
+            data = b''.join(target_lines[j:jb])
+            out += INSERT
+            _write_varint(out, len(data))
+            out += data
+        if size:
+            out += COPY
+            _write_varint(out, offsets[i])
+            _write_varint(out, offsets[i + size] - offsets[i])
+        j = jb + size
+    return bytes(out)
+
+
+def read_header(delta):
+    """Return ``(base_hash, size, body_offset)`` for an encoded delta."""
+    if not delta.startswith(MAGIC):
+        raise ValueError('not a delta')
+    pos = len(MAGIC)
+    base_hash = delta[pos:pos + 64].decode('ascii')
+    size, pos = _read_varint(delta, pos + 64)
+    return base_hash, size, pos
+
+
+def apply_delta(base, delta):
+    """Rebuild the target blob from ``base`` and an encoded delta."""
+    _, size, pos = read_header(delta)
+    out = bytearray()
+    base = memoryview(base)
+    while pos < len(delta):
+        op = delta[pos:pos + 1]
+        if op == COPY:
+            offset, pos = _read_varint(delta, pos + 1)
+            length, pos = _read_varint(delta, pos)
+            out += base[offset:offset + length]
+        elif op == INSERT:
+            length, pos = _read_varint(delta, pos + 1)
+            out += delta[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f'unknown delta operation {op!r}')
+    if len(out) != size:
+        raise ValueError('delta produced the wrong number of bytes')
+    return bytes(out)
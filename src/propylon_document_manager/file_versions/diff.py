@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .diff_engine import DiffTooLarge, unified_hunks
+from .models import DiffCacheEntry
+from .text import get_text, is_text_content_type
+
+# Returned in place of hunks when a diff exceeds its budget.
+DIFF_TOO_LARGE = 'Files differ; diff too large to display.'
+
+
+def compute_hunks(previous_content, current_content):
+    """
+    Return the unified diff hunks between two blobs, without the file header.
+    Raises ``DiffTooLarge`` when the diff exceeds the configured budget.
+    """
+    # Convert binary content to strings for comparison
+    previous_lines = previous_content.decode('utf-8', errors='ignore').splitlines()
+    current_lines = current_content.decode('utf-8', errors='ignore').splitlines()
+
+    hunks = unified_hunks(
+        previous_lines,
+        current_lines,
+        max_cost=settings.FILE_VERSIONS_DIFF_MAX_EDIT_COST,
+        timeout=settings.FILE_VERSIONS_DIFF_TIMEOUT,
+    )
+    return '\n'.join(hunks)
+
+
+def diff_content(version):
+    """
+    Return the bytes to diff for a version: the content itself for text types,
+    otherwise its extracted text, or ``None`` while extraction is pending.
+    """
+    if is_text_content_type(version.file.content_type):
+        return version.content
+    text = get_text(version.content_hash, version.file.content_type)
+    return text.encode('utf-8') if text is not None else None
+
+
+def cache_key(from_hash, to_hash):
+    return f'file_versions:diff:{from_hash}:{to_hash}'
+
+
+def get_hunks(previous_version, version):
+    """
+    Return the diff hunks between two versions, computing them at most once.
+    Looks in the Django cache first, then the ``DiffCacheEntry`` table, and
+    only runs the diff when neither has the pair of content hashes. Returns
+    ``None`` while the text of either side has not been extracted yet.
+    """
+    from_hash, to_hash = previous_version.content_hash, version.content_hash
+    key = cache_key(from_hash, to_hash)
+    hunks = cache.get(key)
+    if hunks is not None:
+        return hunks
+
+    entry = DiffCacheEntry.objects.filter(from_hash=from_hash, to_hash=to_hash).first()
+    if entry is not None:
+        # Touch the entry so eviction drops the least recently used diffs first.
+        entry.save(update_fields=['last_used_at'])
+        hunks = entry.hunks
+    else:
+        previous_content, current_content = diff_content(previous_version), diff_content(version)
+        if previous_content is None or current_content is None:
+            return None
+        try:
+            hunks = compute_hunks(previous_content, current_content)
+        except DiffTooLarge:
+            # Not cached: the time budget depends on load, so a later attempt may succeed.
+            return DIFF_TOO_LARGE
+        store_hunks(from_hash, to_hash, hunks)
+
+    cache.set(key, hunks, settings.FILE_VERSIONS_DIFF_CACHE_TIMEOUT)
+    return hunks
+
+
+def store_hunks(from_hash, to_hash, hunks):
+    """Persist computed hunks, evicting the least recently used entries over the limit."""
+    size = len(hunks.encode('utf-8'))
+    if size > settings.FILE_VERSIONS_DIFF_CACHE_MAX_ENTRY_SIZE:
+        return
+    try:
+        with transaction.atomic():
+            DiffCacheEntry.objects.create(from_hash=from_hash, to_hash=to_hash, hunks=hunks, size=size)
+    except IntegrityError:
+        # Another request stored the same pair first.
+        return
+
+    max_entries = settings.FILE_VERSIONS_DIFF_CACHE_MAX_ENTRIES
+    stale_ids = list(DiffCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:])
+    if stale_ids:
+        DiffCacheEntry.objects.filter(pk__in=stale_ids).delete()
+
+
+def diff_versions(previous_version, version):
+    """Return a unified diff between the contents of two versions."""
+    hunks = get_hunks(previous_version, version)
+    if not hunks or hunks == DIFF_TOO_LARGE:
+        return hunks
+    header = f'--- v{previous_version.version_number}\n+++ v{version.version_number}'
+    return f'{header}\n{hunks}'
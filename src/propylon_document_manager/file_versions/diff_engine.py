@@ -0,0 +1,168 @@
+"""
+Linear-space Myers diff over lines.
+
+Lines are interned to integers first, so every comparison in the inner loop
+is an integer comparison rather than a string comparison. The edit script is
+found with Myers' divide-and-conquer "middle snake" search, which needs
+O((N + M) * D) time and O(N + M) space, where D is the size of the edit
+script. Unlike ``difflib``, the cost therefore grows with how much changed
+rather than with the square of the document size.
+"""
+import difflib
+import time
+
+
+class DiffTooLarge(Exception):
+    """Raised when a diff exceeds its edit-cost or time budget."""
+
+
+def _intern_lines(a, b):
+    ids = {}
+    return [ids.setdefault(line, len(ids)) for line in a], [ids.setdefault(line, len(ids)) for line in b]
+
+
+def _middle_snake(a, alo, ahi, b, blo, bhi, max_d, deadline):
+    """
+    Find the middle snake of the shortest edit script for ``a[alo:ahi]`` and
+    ``b[blo:bhi]``. Returns the snake as absolute ``(x0, y0, x1, y1)``.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    limit = (n + m + 1) // 2
+    offset = limit + 1
+    forward = [0] * (2 * limit + 3)
+    backward = [0] * (2 * limit + 3)
+
+    for d in range(limit + 1):
+        if d > max_d:
+            raise DiffTooLarge(f"edit script longer than {2 * max_d} lines")
+        if deadline is not None and time.monotonic() > deadline:
+            raise DiffTooLarge("time budget exceeded")
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + backward[offset + delta - k] >= n:
+                return alo + x0, blo + y0, alo + x, blo + y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return ahi - x, bhi - y, ahi - x0, bhi - y0
+
+    raise AssertionError("middle snake not found")  # pragma: no cover
+
+
+def matching_blocks(a, b, max_cost=None, timeout=None):
+    """
+    Return the matching blocks between two line sequences in the format of
+    ``difflib.SequenceMatcher.get_matching_blocks``.
+    Raises ``DiffTooLarge`` when the edit script is longer than ``max_cost``
+    lines or the search takes longer than ``timeout`` seconds.
+    """
+    a, b = _intern_lines(a, b)
+    max_d = (max_cost + 1) // 2 if max_cost is not None else len(a) + len(b)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        start = alo
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            alo += 1
+            blo += 1
+        if alo > start:
+            blocks.append((start, blo - (alo - start), alo - start))
+        end = ahi
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+        if end > ahi:
+            blocks.append((ahi, bhi, end - ahi))
+        if alo == ahi or blo == bhi:
+            continue
+        x0, y0, x1, y1 = _middle_snake(a, alo, ahi, b, blo, bhi, max_d, deadline)
+        if x1 > x0:
+            blocks.append((x0, y0, x1 - x0))
+        stack.append((alo, x0, blo, y0))
+        stack.append((x1, ahi, y1, bhi))
+
+    # Sort and merge adjacent blocks, then append the sentinel difflib expects.
+    merged = []
+    for i, j, size in sorted(blocks):
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    merged.append((len(a), len(b), 0))
+    return [difflib.Match(*block) for block in merged]
+
+
+class MyersMatcher(difflib.SequenceMatcher):
+    """
+    ``SequenceMatcher`` whose matching blocks come from the Myers search, so the
+    standard ``get_opcodes``/``get_grouped_opcodes`` can be reused unchanged.
+    """
+
+    def __init__(self, a, b, max_cost=None, timeout=None):
+        # Skip SequenceMatcher's b2j index; the Myers search does not use it.
+        self.a = a
+        self.b = b
+        self.matching_blocks = matching_blocks(a, b, max_cost=max_cost, timeout=timeout)
+        self.opcodes = None
+
+    def get_matching_blocks(self):
+        return self.matching_blocks
+
+
+def _format_range(start, stop):
+    """Format a line range the way ``difflib.unified_diff`` does."""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f'{beginning}'
+    if not length:
+        beginning -= 1
+    return f'{beginning},{length}'
+
+
+def unified_hunks(a, b, n=3, max_cost=None, timeout=None):
+    """
+    Yield unified diff hunk lines between two line sequences, without the
+    ``---``/``+++`` file header.
+    """
+    matcher = MyersMatcher(a, b, max_cost=max_cost, timeout=timeout)
+    for group in matcher.get_grouped_opcodes(n):
+        first, last = group[0], group[-1]
+        yield f'@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@'
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in {'replace', 'delete'}:
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in {'replace', 'insert'}:
+                for line in b[j1:j2]:
+                    yield '+' + line
@@ -0,0 +1,85 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.management.commands.benchmark_diff import amend, make_document
+from propylon_document_manager.file_versions.storage import DeltaBlobStore
+
+
+def stored_bytes(location):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(location)
+        for name in names
+    )
+
+
+def build_chain(store, versions):
+    """Store a version chain the way ``FileVersion.save`` does, returning the hashes oldest first."""
+    hashes = []
+    for number, content in enumerate(versions, start=1):
+        hashes.append(store.save(content))
+        if number > 1 and (number - 1) % store.keyframe_interval:
+            store.save_delta(hashes[-2], hashes[-1])
+    return hashes
+
+
+class Command(BaseCommand):
+    help = "Report storage savings against read latency of delta storage on synthetic amendment chains"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=5000, help="Lines per document")
+        parser.add_argument('--versions', type=int, default=50, help="Versions per chain")
+        parser.add_argument('--edit-ratio', type=float, default=0.01, help="Fraction of lines changed per version")
+        parser.add_argument('--intervals', type=int, nargs='+', default=[1, 5, 10, 20])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        document = make_document(options['lines'], rng)
+        edits = max(1, int(options['lines'] * options['edit_ratio']))
+        versions = []
+        for _ in range(options['versions']):
+            versions.append('\n'.join(document).encode())
+            document = amend(document, edits, rng)
+
+        full_size = sum(len(content) for content in versions)
+        self.stdout.write(
+            f"{options['versions']} versions of {options['lines']} lines, {edits} edits each, "
+            f"{full_size / 1024:.0f} KiB in full"
+        )
+        self.stdout.write(
+            f"{'interval':>8} {'stored KiB':>11} {'saving':>7} {'write (s)':>10} "
+            f"{'cold p50 (ms)':>14} {'cold max (ms)':>14} {'warm p50 (ms)':>14}"
+        )
+        for interval in options['intervals']:
+            with tempfile.TemporaryDirectory() as location:
+                store = DeltaBlobStore(location=location, keyframe_interval=interval)
+                start = time.perf_counter()
+                hashes = build_chain(store, versions)
+                write_time = time.perf_counter() - start
+                size = stored_bytes(location)
+
+                keys = [f"file_versions:blob:{content_hash}" for content_hash in hashes]
+                cold = []
+                for content_hash in hashes:
+                    # Cold: nothing in the chain has been reconstructed yet.
+                    cache.delete_many(keys)
+                    start = time.perf_counter()
+                    store.read(content_hash)
+                    cold.append((time.perf_counter() - start) * 1000)
+                warm = []
+                for content_hash in hashes:
+                    start = time.perf_counter()
+                    store.read(content_hash)
+                    warm.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write(
+                f"{interval:>8} {size / 1024:>11.0f} {1 - size / full_size:>6.0%} {write_time:>10.2f} "
+                f"{statistics.median(cold):>14.2f} {max(cold):>14.2f} {statistics.median(warm):>14.2f}"
+            )
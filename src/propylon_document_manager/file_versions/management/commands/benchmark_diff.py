@@ -0,0 +1,70 @@
+import difflib
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.diff_engine import unified_hunks
+
+
+def make_document(lines, rng):
+    """Build a statute-like document with numbered sections and repeated boilerplate."""
+    document = []
+    for number in range(lines):
+        if number % 25 == 0:
+            document.append(f'Section {number // 25 + 1}.')
+        elif number % 7 == 0:
+            document.append('Subject to the provisions of this Act,')
+        else:
+            document.append(f'({number % 25}) clause {rng.randrange(10 ** 6)} of the amended text.')
+    return document
+
+
+def amend(document, edits, rng):
+    """Apply ``edits`` random line insertions, deletions and replacements."""
+    amended = list(document)
+    for _ in range(edits):
+        position = rng.randrange(len(amended) or 1)
+        operation = rng.choice(('insert', 'delete', 'replace'))
+        if operation == 'insert' or not amended:
+            amended.insert(position, f'Inserted by amendment {rng.randrange(10 ** 6)}.')
+        elif operation == 'delete':
+            del amended[position]
+        else:
+            amended[position] = f'Substituted by amendment {rng.randrange(10 ** 6)}.'
+    return amended
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare the Myers diff engine against difflib on synthetic document versions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+        parser.add_argument('--edit-ratio', type=float, default=0.01, help="Fraction of lines changed per version")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'lines':>8} {'edits':>7} {'difflib (s)':>12} {'myers (s)':>10} {'speedup':>8}")
+        for lines in options['lines']:
+            edits = max(1, int(lines * options['edit_ratio']))
+            previous = make_document(lines, rng)
+            current = amend(previous, edits, rng)
+
+            difflib_time = best_of(
+                options['repeat'], lambda: list(difflib.unified_diff(previous, current, lineterm=''))
+            )
+            myers_time = best_of(options['repeat'], lambda: list(unified_hunks(previous, current)))
+            self.stdout.write(
+                f"{lines:>8} {edits:>7} {difflib_time:>12.4f} {myers_time:>10.4f} {difflib_time / myers_time:>7.1f}x"
+            )
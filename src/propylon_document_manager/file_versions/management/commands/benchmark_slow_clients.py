@@ -0,0 +1,175 @@
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from propylon_document_manager.file_versions.models import File, FileVersion, Job, User
+from propylon_document_manager.file_versions.storage import get_blob_store
+
+
+class InFlight:
+    """Counts transfers in progress and remembers the peak, along with the peak number of threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+        self.peak_threads = threading.active_count()
+
+    def start(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def finish(self):
+        with self.lock:
+            self.current -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test: download a document with many slow clients through the sync view on a "
+        "thread-per-request server, and through the async view under ASGI"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help="Concurrent clients")
+        parser.add_argument('--size', type=int, default=1024, help="Document size in KiB")
+        parser.add_argument('--rate', type=int, default=256, help="KiB/s each client reads at")
+        parser.add_argument('--threads', type=int, default=32, help="Worker threads of the sync server")
+        parser.add_argument('--host', default='localhost', help="Host header; must be in ALLOWED_HOSTS")
+        parser.add_argument('--servers', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            email='benchmark-slow-clients@example.com', username='benchmark-slow-clients', password=None
+        )
+        try:
+            file = File.objects.create(
+                url_path='/benchmark/slow-clients.bin', owner=user, content_type='application/octet-stream'
+            )
+            version = FileVersion.objects.create(
+                file=file, file_name='slow-clients.bin', content=os.urandom(options['size'] * 1024)
+            )
+            token = str(RefreshToken.for_user(user).access_token)
+            self.stdout.write(
+                f"{options['clients']} clients downloading {options['size']} KiB at "
+                f"{options['rate']} KiB/s each; sync server has {options['threads']} threads"
+            )
+            self.stdout.write(
+                f"{'server':>6} {'wall (s)':>9} {'clients/s':>10} {'peak in flight':>15} {'peak threads':>13}"
+            )
+            for name in options['servers']:
+                run = self.run_sync if name == 'sync' else self.run_async
+                in_flight = InFlight()
+                start = time.perf_counter()
+                run(version.content_hash, token, in_flight, options)
+                wall = time.perf_counter() - start
+                self.stdout.write(
+                    f"{name:>6} {wall:>9.2f} {options['clients'] / wall:>10.1f} "
+                    f"{in_flight.peak:>15} {in_flight.peak_threads:>13}"
+                )
+        finally:
+            content_hash = FileVersion.objects.filter(file__owner=user).values_list('content_hash', flat=True).first()
+            user.delete()
+            if content_hash:
+                Job.objects.filter(content_hash=content_hash).delete()
+                get_blob_store().delete(content_hash)
+
+    def run_sync(self, content_hash, token, in_flight, options):
+        """
+        Serve each client on a fixed pool of threads, the way a WSGI server
+        does: the thread stays busy until the slow client has read everything.
+        """
+        application = get_wsgi_application()
+        url = reverse('api:version-download', kwargs={'content_hash': content_hash})
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': url,
+            'QUERY_STRING': '',
+            'SERVER_NAME': options['host'],
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': options['host'],
+            'HTTP_AUTHORIZATION': f'Bearer {token}',
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+        def download():
+            statuses = []
+            body = application(
+                {**environ, 'wsgi.input': io.BytesIO()}, lambda status, headers, exc_info=None: statuses.append(status)
+            )
+            if not statuses[0].startswith('200'):
+                raise RuntimeError(f"sync download returned {statuses[0]}")
+            in_flight.start()
+            for chunk in body:
+                time.sleep(len(chunk) / (options['rate'] * 1024))
+            in_flight.finish()
+            body.close()
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            futures = [pool.submit(download) for _ in range(options['clients'])]
+            for future in futures:
+                future.result()
+
+    def run_async(self, content_hash, token, in_flight, options):
+        """Drive the ASGI application directly, with every client reading at the same rate."""
+        application = get_asgi_application()
+        url = reverse('api:async-version-download', kwargs={'content_hash': content_hash})
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url,
+            'raw_path': url.encode(),
+            'query_string': b'',
+            'headers': [(b'host', options['host'].encode()), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': (options['host'], 80),
+        }
+
+        async def download():
+            sent = asyncio.Event()
+            status = None
+
+            async def receive():
+                if not sent.is_set():
+                    sent.set()
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Never disconnect.
+                await asyncio.Future()
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+                    in_flight.start()
+                elif message['type'] == 'http.response.body':
+                    await asyncio.sleep(len(message.get('body', b'')) / (options['rate'] * 1024))
+                    if not message.get('more_body'):
+                        in_flight.finish()
+
+            await application(dict(scope), receive, send)
+            if status != 200:
+                raise RuntimeError(f"async download returned {status}")
+
+        async def main():
+            await asyncio.gather(*(download() for _ in range(options['clients'])))
+
+        asyncio.run(main())
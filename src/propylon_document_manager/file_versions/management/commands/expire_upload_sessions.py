@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.api.uploads import abort_session
+from propylon_document_manager.file_versions.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete expired resumable upload sessions and the parts they left behind"
+
+    def handle(self, *args, **options):
+        count = 0
+        for session in UploadSession.objects.filter(expires_at__lte=timezone.now()).iterator():
+            abort_session(session)
+            count += 1
+        self.stdout.write(f"Expired {count} upload sessions")
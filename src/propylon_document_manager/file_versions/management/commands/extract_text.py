@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from propylon_document_manager.file_versions.models import FileVersion, SearchDocument
+from propylon_document_manager.file_versions.text import extract, extractor_for
+
+
+def extract_one(job):
+    return extract(*job) is not None
+
+
+class Command(BaseCommand):
+    help = "Extract the text of every PDF and DOCX version that has not been extracted yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Extraction processes")
+
+    def handle(self, *args, **options):
+        jobs = [
+            (content_hash, content_type)
+            for content_hash, content_type in FileVersion.objects.values_list(
+                'content_hash', 'file__content_type'
+            ).distinct()
+            if extractor_for(content_type) is not None
+        ]
+        # Forked workers must not inherit open database connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            extracted = sum(pool.map(extract_one, jobs, chunksize=16))
+
+        file_ids = FileVersion.objects.filter(
+            content_hash__in=[content_hash for content_hash, _ in jobs]
+        ).values_list('file_id', flat=True).distinct()
+        for file_id in file_ids:
+            SearchDocument.refresh(file_id)
+        self.stdout.write(f"Extracted text for {extracted} blobs")
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.models import Job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (text extraction, compression, delta storage)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when idle")
+        parser.add_argument('--status', action='store_true', help="Print the queue depth and exit")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            depth = Job.queue_depth()
+            self.stdout.write(
+                f"pending={depth[Job.PENDING]} running={depth[Job.RUNNING]} done={depth[Job.DONE]} "
+                f"failed={depth[Job.FAILED]} oldest_pending_age={depth['oldest_pending_age']:.0f}s"
+            )
+            return
+
+        processed = 0
+        try:
+            while True:
+                ran = Job.run_pending(limit=100)
+                processed += ran
+                if ran:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Processed {processed} jobs")
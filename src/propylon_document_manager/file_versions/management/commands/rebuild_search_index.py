@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.models import File, SearchDocument
+
+
+class Command(BaseCommand):
+    help = "Index every file for full-text search, e.g. after enabling search on an existing database"
+
+    def handle(self, *args, **options):
+        count = 0
+        for file_id in File.objects.values_list('pk', flat=True).iterator():
+            SearchDocument.refresh(file_id)
+            count += 1
+        self.stdout.write(f"Indexed {count} files")
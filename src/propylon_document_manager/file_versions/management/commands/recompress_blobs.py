@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.file_versions.storage import get_blob_store
+
+
+class Command(BaseCommand):
+    help = "Rewrite stored blobs to match the current per-content-type compression policy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        store = get_blob_store()
+        if not hasattr(store, 'recompress'):
+            self.stderr.write(f"{type(store).__name__} does not support compression")
+            return
+
+        blobs = (
+            FileVersion.objects.order_by('content_hash')
+            .values_list('content_hash', 'file__content_type')
+            .distinct()
+            .iterator(chunk_size=options['batch_size'])
+        )
+        previous = None
+        rewritten = skipped = saved = 0
+        for content_hash, content_type in blobs:
+            # A blob shared by files of different types follows the first type seen.
+            if content_hash == previous:
+                continue
+            previous = content_hash
+            try:
+                change = store.recompress(content_hash, content_type)
+            except KeyError:
+                # Missing, or stored as a delta.
+                skipped += 1
+                continue
+            if change:
+                rewritten += 1
+                saved -= change
+        self.stdout.write(f"Rewrote {rewritten} blobs, skipped {skipped}, saved {saved} bytes")
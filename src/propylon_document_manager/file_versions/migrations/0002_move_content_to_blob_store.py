@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+from propylon_document_manager.file_versions.storage import get_blob_store
+
+
+def move_content_to_blob_store(apps, schema_editor):
+    """Copy every version's bytes into the blob store, storing duplicates once."""
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    store = get_blob_store()
+    for version in FileVersion.objects.only("id", "content", "content_hash").iterator():
+        content = bytes(version.content or b"")
+        content_hash = store.save(content)
+        FileVersion.objects.filter(pk=version.pk).update(content_hash=content_hash, size=len(content))
+
+
+def move_content_to_database(apps, schema_editor):
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    store = get_blob_store()
+    for version in FileVersion.objects.only("id", "content_hash").iterator():
+        FileVersion.objects.filter(pk=version.pk).update(content=store.read(version.content_hash))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileversion",
+            name="size",
+            field=models.BigIntegerField(default=0),
+        ),
+        # A default lets the column be re-added when this migration is reversed.
+        migrations.AlterField(
+            model_name="fileversion",
+            name="content",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.RunPython(move_content_to_blob_store, move_content_to_database),
+        migrations.RemoveField(
+            model_name="fileversion",
+            name="content",
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0002_move_content_to_blob_store"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DiffCacheEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("from_hash", models.CharField(max_length=64)),
+                ("to_hash", models.CharField(max_length=64)),
+                ("hunks", models.TextField()),
+                ("size", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_used_at", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                "unique_together": {("from_hash", "to_hash")},
+            },
+        ),
+    ]
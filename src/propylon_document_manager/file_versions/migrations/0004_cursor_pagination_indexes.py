@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("file_versions", "0003_diff_cache"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(fields=["owner", "-created_at", "-id"], name="file_owner_cursor_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(fields=["file", "-created_at", "-id"], name="version_file_cursor_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(fields=["-created_at", "-id"], name="version_cursor_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["-date_joined", "-id"], name="user_joined_cursor_idx"),
+        ),
+    ]
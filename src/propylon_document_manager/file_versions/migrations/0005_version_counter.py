@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def initialise_version_counters(apps, schema_editor):
+    File = apps.get_model("file_versions", "File")
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    highest = (
+        FileVersion.objects.filter(file=models.OuterRef("pk")).order_by("-version_number").values("version_number")[:1]
+    )
+    File.objects.update(latest_version_number=Coalesce(models.Subquery(highest), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0004_cursor_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="file",
+            name="latest_version_number",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(initialise_version_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def point_files_at_latest_version(apps, schema_editor):
+    File = apps.get_model("file_versions", "File")
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    latest = FileVersion.objects.filter(file=models.OuterRef("pk")).order_by("-created_at", "-id").values("pk")[:1]
+    File.objects.update(latest_version=models.Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0005_version_counter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="file",
+            name="latest_version",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="file_versions.fileversion",
+            ),
+        ),
+        migrations.RunPython(point_files_at_latest_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_access_index(apps, schema_editor):
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    VersionAccess = apps.get_model("file_versions", "VersionAccess")
+    rows = {}
+    for version_id, owner_id in FileVersion.objects.values_list("id", "file__owner_id").iterator():
+        rows[(owner_id, version_id)] = [True, True]
+    for version_id, user_id in FileVersion.can_read.through.objects.values_list("fileversion_id", "user_id"):
+        rows.setdefault((user_id, version_id), [False, False])[0] = True
+    for version_id, user_id in FileVersion.can_write.through.objects.values_list("fileversion_id", "user_id"):
+        rows.setdefault((user_id, version_id), [False, False])[1] = True
+    VersionAccess.objects.bulk_create(
+        [
+            VersionAccess(user_id=user_id, version_id=version_id, can_read=can_read, can_write=can_write)
+            for (user_id, version_id), (can_read, can_write) in rows.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0006_latest_version_pointer"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionAccess",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("can_read", models.BooleanField(default=True)),
+                ("can_write", models.BooleanField(default=False)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="version_access",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "version",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="access",
+                        to="file_versions.fileversion",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "version")},
+            },
+        ),
+        migrations.RunPython(build_access_index, migrations.RunPython.noop),
+    ]
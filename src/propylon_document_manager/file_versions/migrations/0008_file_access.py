@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def collapse_version_grants(apps, schema_editor):
+    """
+    Create a FileAccess entry for each owner, and one for each user granted the
+    same access on every version of a file. Drop the per-version grants those
+    entries now cover, and leave the rest as per-version grants.
+    """
+    File = apps.get_model("file_versions", "File")
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    FileAccess = apps.get_model("file_versions", "FileAccess")
+    VersionAccess = apps.get_model("file_versions", "VersionAccess")
+    ReadGrant = FileVersion.can_read.through
+    WriteGrant = FileVersion.can_write.through
+
+    for file in File.objects.only("id", "owner_id").iterator():
+        FileAccess.objects.create(file_id=file.pk, user_id=file.owner_id, can_read=True, can_write=True)
+        version_ids = list(FileVersion.objects.filter(file_id=file.pk).values_list("id", flat=True))
+        if not version_ids:
+            continue
+
+        def granted_on_every_version(grants):
+            counts = (
+                grants.objects.filter(fileversion_id__in=version_ids)
+                .exclude(user_id=file.owner_id)
+                .values("user_id")
+                .annotate(versions=models.Count("fileversion_id"))
+            )
+            return {row["user_id"] for row in counts if row["versions"] == len(version_ids)}
+
+        readers = granted_on_every_version(ReadGrant)
+        writers = granted_on_every_version(WriteGrant)
+        FileAccess.objects.bulk_create(
+            [
+                FileAccess(file_id=file.pk, user_id=user_id, can_read=user_id in readers, can_write=user_id in writers)
+                for user_id in readers | writers
+            ]
+        )
+        ReadGrant.objects.filter(fileversion_id__in=version_ids, user_id__in=readers).delete()
+        WriteGrant.objects.filter(fileversion_id__in=version_ids, user_id__in=writers).delete()
+
+        # Rebuild the per-version index from the grants that remain.
+        VersionAccess.objects.filter(version_id__in=version_ids).delete()
+        rows = {}
+        for version_id, user_id in ReadGrant.objects.filter(fileversion_id__in=version_ids).values_list(
+            "fileversion_id", "user_id"
+        ):
+            rows.setdefault((version_id, user_id), [False, False])[0] = True
+        for version_id, user_id in WriteGrant.objects.filter(fileversion_id__in=version_ids).values_list(
+            "fileversion_id", "user_id"
+        ):
+            rows.setdefault((version_id, user_id), [False, False])[1] = True
+        VersionAccess.objects.bulk_create(
+            [
+                VersionAccess(version_id=version_id, user_id=user_id, can_read=can_read, can_write=can_write)
+                for (version_id, user_id), (can_read, can_write) in rows.items()
+                if user_id != file.owner_id
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0007_version_access_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileAccess",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("can_read", models.BooleanField(default=True)),
+                ("can_write", models.BooleanField(default=False)),
+                (
+                    "file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="access", to="file_versions.file"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="file_access",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "file")},
+            },
+        ),
+        migrations.RunPython(collapse_version_grants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = "file_versions_search_fts"
+DOCUMENT_TABLE = "file_versions_searchdocument"
+
+# External-content FTS5 table kept in sync with SearchDocument by triggers. Django
+# rebuilds SQLite tables on most schema changes, which drops the triggers, so a
+# later migration altering SearchDocument must recreate them.
+SQLITE_CREATE = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"url_path, file_name, body, content='{DOCUMENT_TABLE}', content_rowid='file_id', tokenize='porter unicode61')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, url_path, file_name, body) "
+    f"VALUES (new.file_id, new.url_path, new.file_name, new.body); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, url_path, file_name, body) "
+    f"VALUES ('delete', old.file_id, old.url_path, old.file_name, old.body); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, url_path, file_name, body) "
+    f"VALUES ('delete', old.file_id, old.url_path, old.file_name, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, url_path, file_name, body) "
+    f"VALUES (new.file_id, new.url_path, new.file_name, new.body); END",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def postgres_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Must match file_versions.search.search_vector() for queries to use the index.
+    vector = SearchVector("url_path", "file_name", weight="A", config="english") + SearchVector(
+        "body", weight="B", config="english"
+    )
+    return GinIndex(vector, name="search_document_vector_idx")
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("file_versions", "SearchDocument"), postgres_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("file_versions", "SearchDocument"), postgres_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0008_file_access"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="file_versions.file",
+                    ),
+                ),
+                ("url_path", models.CharField(max_length=255)),
+                ("file_name", models.CharField(blank=True, max_length=255)),
+                ("body", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "version",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="file_versions.fileversion",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
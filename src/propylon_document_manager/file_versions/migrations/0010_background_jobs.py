@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0009_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("extract_text", "Extract text"),
+                            ("compress", "Compress"),
+                            ("compact", "Store as delta"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                ("content_type", models.CharField(blank=True, max_length=100)),
+                ("base_hash", models.CharField(blank=True, max_length=64)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["status", "run_after"], name="job_queue_idx")],
+                "unique_together": {("kind", "content_hash")},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0011_upload_sessions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="closed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadsession",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,10 +1,23 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.db.models import CharField, EmailField
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import hashlib
-import os
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from .changes import record_change
+from .compression import codec_for
+from .storage import get_blob_store
+from .text import extract, extract_text, extractor_for
+
+logger = logging.getLogger(__name__)
 
 class User(AbstractUser):
     """
@@ -23,6 +36,11 @@ class User(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='user_joined_cursor_idx'),
+        ]
+
     def get_absolute_url(self) -> str:
         """Get URL for user's detail view.
 
@@ -37,29 +55,89 @@ class File(models.Model):
     """
     Model representing a file in the system.
     Each file has a unique URL path per user and can have multiple versions.
+    Access is granted per file through ``FileAccess`` and inherited by every
+    version; ``FileVersion.can_read``/``can_write`` add per-version grants.
     """
     url_path = models.CharField(max_length=255)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='files')
     created_at = models.DateTimeField(auto_now_add=True)
     content_type = models.CharField(max_length=100)
+    latest_version_number = models.PositiveIntegerField(default=0)
+    latest_version = models.ForeignKey(
+        'FileVersion', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
 
     class Meta:
         unique_together = ('url_path', 'owner')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'], name='file_owner_cursor_idx'),
+        ]
 
     def __str__(self):
         return f"{self.url_path} (owned by {self.owner.username})"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            record_change(self.audience_ids())
+            transaction.on_commit(partial(SearchDocument.refresh, self.pk))
+            return
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            FileAccess.objects.create(file=self, user_id=self.owner_id, can_read=True, can_write=True)
+            record_change([self.owner_id])
+            transaction.on_commit(partial(SearchDocument.refresh, self.pk))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            record_change(self.audience_ids())
+            return super().delete(*args, **kwargs)
+
+    def audience_ids(self):
+        """Ids of every user who can see this file or one of its versions."""
+        ids = {self.owner_id}
+        ids.update(FileAccess.objects.filter(file=self).values_list('user_id', flat=True))
+        ids.update(VersionAccess.objects.filter(version__file=self).values_list('user_id', flat=True))
+        return ids
+
+    def set_grants(self, read_users, write_users):
+        """Replace the users granted read and write access to every version of this file."""
+        read_ids = {user.pk for user in read_users}
+        write_ids = {user.pk for user in write_users}
+        rows = [
+            FileAccess(file=self, user_id=user_id, can_read=user_id in read_ids, can_write=user_id in write_ids)
+            for user_id in (read_ids | write_ids) - {self.owner_id}
+        ]
+        with transaction.atomic():
+            previous_audience = self.audience_ids()
+            FileAccess.objects.filter(file=self).exclude(user_id=self.owner_id).delete()
+            FileAccess.objects.bulk_create(rows)
+            record_change(previous_audience | self.audience_ids())
+
+    def allocate_version_number(self):
+        """
+        Reserve the next version number for this file.
+        The counter is incremented in the database, so concurrent callers never
+        receive the same number. Must be called inside a transaction, which
+        holds the row lock until it commits.
+        """
+        File.objects.filter(pk=self.pk).update(latest_version_number=models.F('latest_version_number') + 1)
+        self.latest_version_number = File.objects.values_list('latest_version_number', flat=True).get(pk=self.pk)
+        return self.latest_version_number
+
 
 class FileVersion(models.Model):
     """
     Model representing a version of a file.
     Uses content-addressable storage with SHA-256 hashing.
+    The bytes themselves live in the blob store, keyed by ``content_hash``;
+    this table only holds metadata.
     """
     file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='versions')
     version_number = models.IntegerField()
     content_hash = models.CharField(max_length=64, db_index=True)
-    content = models.BinaryField()
+    size = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     file_name = models.CharField(max_length=255)
     can_read = models.ManyToManyField(User, related_name='readable_versions', blank=True)
@@ -70,16 +148,433 @@ class FileVersion(models.Model):
         unique_together = ('file', 'version_number')
         indexes = [
             models.Index(fields=['content_hash'], name='content_hash_idx'),
+            models.Index(fields=['file', '-created_at', '-id'], name='version_file_cursor_idx'),
+            models.Index(fields=['-created_at', '-id'], name='version_cursor_idx'),
         ]
 
     def __str__(self):
         return f"Version {self.version_number} of {self.file.url_path}"
 
+    @property
+    def content(self):
+        """Content of this version, loaded from the blob store on first access."""
+        if getattr(self, '_content', None) is None:
+            if not self.content_hash:
+                return None
+            self._content = get_blob_store().read(self.content_hash)
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = bytes(value) if value is not None else None
+        self._content_dirty = value is not None
+
+    def get_previous_version(self):
+        """Find the version preceding this one, using prefetched siblings when available."""
+        siblings = getattr(self.file, '_prefetched_objects_cache', {}).get('versions')
+        if siblings is None:
+            return FileVersion.objects.filter(
+                file=self.file,
+                version_number__lt=self.version_number
+            ).order_by('-version_number').first()
+        earlier = [v for v in siblings if v.version_number < self.version_number]
+        return max(earlier, key=lambda v: v.version_number, default=None)
+
     def calculate_content_hash(self):
         """Calculate SHA-256 hash of the file content."""
         return hashlib.sha256(self.content).hexdigest()
 
     def save(self, *args, **kwargs):
-        if not self.content_hash:
-            self.content_hash = self.calculate_content_hash()
-        super().save(*args, **kwargs)
+        if getattr(self, '_content_dirty', False):
+            # Stored as is; a ``compress`` job applies the content type's codec later.
+            self.content_hash = get_blob_store().save(self._content)
+            self.size = len(self._content)
+            self._content_dirty = False
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            record_change(self.file.audience_ids())
+            transaction.on_commit(partial(SearchDocument.refresh, self.file_id))
+            return
+
+        with transaction.atomic():
+            if self.version_number is None:
+                self.version_number = self.file.allocate_version_number()
+            else:
+                # Keep the counter ahead of explicitly numbered versions.
+                File.objects.filter(
+                    pk=self.file_id, latest_version_number__lt=self.version_number
+                ).update(latest_version_number=self.version_number)
+            super().save(*args, **kwargs)
+            File.objects.filter(pk=self.file_id).update(latest_version=self)
+            record_change(self.file.audience_ids())
+            Job.enqueue(self.background_jobs())
+        if FileVersion.file.is_cached(self):
+            self.file.latest_version = self
+        transaction.on_commit(partial(SearchDocument.refresh, self.file_id))
+
+    def background_jobs(self):
+        """
+        Return the unsaved ``Job``s that finish storing this version: text
+        extraction and compression of its blob, and turning the previous
+        version's blob into a delta against it. Deltas point backwards, so the
+        latest version is always stored in full; every ``keyframe_interval``-th
+        version is kept in full too, which bounds a chain to
+        ``keyframe_interval - 1`` deltas.
+        """
+        store = get_blob_store()
+        content_type = self.file.content_type
+        jobs = []
+        if extractor_for(content_type) is not None:
+            jobs.append(Job(kind=Job.EXTRACT_TEXT, content_hash=self.content_hash, content_type=content_type))
+        if hasattr(store, 'recompress') and codec_for(content_type) is not None:
+            jobs.append(Job(kind=Job.COMPRESS, content_hash=self.content_hash, content_type=content_type))
+        if hasattr(store, 'save_delta'):
+            previous = FileVersion.objects.filter(
+                file_id=self.file_id, version_number__lt=self.version_number
+            ).order_by('-version_number').first()
+            if (
+                previous is not None
+                and previous.content_hash != self.content_hash
+                and previous.version_number % store.keyframe_interval
+            ):
+                jobs.append(Job(kind=Job.COMPACT, content_hash=previous.content_hash, base_hash=self.content_hash))
+        return jobs
+
+    def set_grants(self, read_users, write_users):
+        """Replace this version's own grants, keeping the access index in sync."""
+        with transaction.atomic():
+            self.can_read.set(read_users)
+            self.can_write.set(write_users)
+            self.rebuild_access()
+
+    def rebuild_access(self):
+        """Recompute this version's ``VersionAccess`` rows from its per-version grants."""
+        read_ids = set(self.can_read.values_list('pk', flat=True))
+        write_ids = set(self.can_write.values_list('pk', flat=True))
+        rows = [
+            VersionAccess(version=self, user_id=user_id, can_read=user_id in read_ids, can_write=user_id in write_ids)
+            for user_id in (read_ids | write_ids) - {self.file.owner_id}
+        ]
+        with transaction.atomic():
+            previous_audience = self.file.audience_ids()
+            VersionAccess.objects.filter(version=self).delete()
+            VersionAccess.objects.bulk_create(rows)
+            record_change(previous_audience | self.file.audience_ids())
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            record_change(self.file.audience_ids())
+            result = super().delete(*args, **kwargs)
+            # Repoint the file at its newest remaining version.
+            latest = FileVersion.objects.filter(file=models.OuterRef('pk')).order_by('-created_at', '-id')
+            File.objects.filter(pk=self.file_id, latest_version__isnull=True).update(
+                latest_version=models.Subquery(latest.values('pk')[:1])
+            )
+            transaction.on_commit(partial(SearchDocument.refresh, self.file_id))
+        return result
+
+
+class FileAccess(models.Model):
+    """
+    Access control entry granting a user read and/or write access to a file.
+    Every version of the file inherits it. The owner always has an entry.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='file_access')
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='access')
+    can_read = models.BooleanField(default=True)
+    can_write = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('user', 'file')
+
+    def __str__(self):
+        return f"{self.user} on {self.file}"
+
+
+class VersionAccess(models.Model):
+    """
+    Index of per-version grants that add to the file's ``FileAccess`` entries.
+    Holds one row per (user, version) so access checks are a single indexed
+    lookup on ``user``. Maintained by ``FileVersion.set_grants``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='version_access')
+    version = models.ForeignKey(FileVersion, on_delete=models.CASCADE, related_name='access')
+    can_read = models.BooleanField(default=True)
+    can_write = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('user', 'version')
+
+    def __str__(self):
+        return f"{self.user} on {self.version}"
+
+
+class DiffCacheEntry(models.Model):
+    """
+    Persistent cache of the diff between two blobs.
+    Blobs are immutable, so the diff for a ``(from_hash, to_hash)`` pair never
+    changes. Only the hunks are stored; the ``---``/``+++`` header depends on
+    the versions being compared and is added when the diff is rendered.
+    """
+    from_hash = models.CharField(max_length=64)
+    to_hash = models.CharField(max_length=64)
+    hunks = models.TextField()
+    size = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = ('from_hash', 'to_hash')
+
+    def __str__(self):
+        return f"Diff {self.from_hash[:12]}..{self.to_hash[:12]}"
+
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of a file: its path, and the name and text of its latest version.
+    On SQLite an FTS5 table mirrors these rows through triggers; on PostgreSQL
+    a GIN index over their ``tsvector`` backs the search. Kept current by
+    ``refresh`` whenever a file or its latest version changes.
+    """
+    file = models.OneToOneField(File, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    version = models.ForeignKey(FileVersion, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    url_path = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.url_path}"
+
+    @classmethod
+    def refresh(cls, file_id):
+        """Re-index a file from its current latest version."""
+        file = File.objects.select_related('latest_version').filter(pk=file_id).first()
+        if file is None:
+            return
+        version = file.latest_version
+        cls.objects.update_or_create(file=file, defaults={
+            'version': version,
+            'url_path': file.url_path,
+            'file_name': version.file_name if version else '',
+            'body': extract_text(version.content_hash, file.content_type) if version else '',
+        })
+
+
+class Job(models.Model):
+    """
+    Background work on a blob, queued in the database and run by
+    ``manage.py process_jobs``.
+    Blobs are immutable, so there is one job per ``(kind, content_hash)``:
+    queueing the same work again is a no-op unless the earlier job failed.
+    Failed runs are retried with exponential backoff, and jobs left running
+    by a worker that died are picked up again after a timeout.
+    """
+    EXTRACT_TEXT = 'extract_text'
+    COMPRESS = 'compress'
+    COMPACT = 'compact'
+    KIND_CHOICES = [
+        (EXTRACT_TEXT, 'Extract text'),
+        (COMPRESS, 'Compress'),
+        (COMPACT, 'Store as delta'),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    content_hash = models.CharField(max_length=64)
+    content_type = models.CharField(max_length=100, blank=True)
+    # Blob a ``compact`` job encodes ``content_hash`` against.
+    base_hash = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'content_hash')
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.content_hash[:12]} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, jobs):
+        """
+        Queue unsaved ``jobs``, skipping work that is already queued or done
+        and requeueing work that failed. Call inside the transaction that
+        creates the versions so jobs are queued if and only if it commits.
+        """
+        jobs = list({(job.kind, job.content_hash): job for job in jobs}.values())
+        if not jobs:
+            return
+        cls.objects.bulk_create(jobs, ignore_conflicts=True)
+        keys = models.Q()
+        for job in jobs:
+            keys |= models.Q(kind=job.kind, content_hash=job.content_hash)
+        cls.objects.filter(keys, status=cls.FAILED).update(
+            status=cls.PENDING, attempts=0, run_after=timezone.now(), last_error=''
+        )
+        if settings.FILE_VERSIONS_JOBS_EAGER:
+            transaction.on_commit(cls.run_pending)
+
+    @classmethod
+    def runnable(cls):
+        """Jobs that are due, including those held by a worker for longer than the lock timeout."""
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.FILE_VERSIONS_JOB_LOCK_TIMEOUT)
+        return cls.objects.filter(
+            models.Q(status=cls.PENDING, run_after__lte=now) | models.Q(status=cls.RUNNING, locked_at__lt=stale)
+        )
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Lock the oldest runnable job for this worker and return it, or ``None``.
+        Jobs are claimed with a conditional update, so concurrent workers never
+        run the same job even on databases without row locks.
+        """
+        for pk in cls.runnable().order_by('run_after', 'pk').values_list('pk', flat=True)[:10]:
+            if cls.runnable().filter(pk=pk).update(
+                status=cls.RUNNING, locked_at=timezone.now(), attempts=models.F('attempts') + 1
+            ):
+                return cls.objects.get(pk=pk)
+        return None
+
+    @classmethod
+    def run_pending(cls, limit=None):
+        """Run runnable jobs until none are left, or ``limit`` have run. Returns how many ran."""
+        count = 0
+        while limit is None or count < limit:
+            job = cls.claim_next()
+            if job is None:
+                break
+            job.run()
+            count += 1
+        return count
+
+    @classmethod
+    def queue_depth(cls):
+        """Return the number of jobs per status, and the age in seconds of the oldest pending job."""
+        depth = {status: 0 for status, _ in cls.STATUS_CHOICES}
+        depth.update(cls.objects.values_list('status').annotate(count=models.Count('pk')).order_by())
+        oldest = cls.objects.filter(status=cls.PENDING).aggregate(oldest=models.Min('created_at'))['oldest']
+        depth['oldest_pending_age'] = (timezone.now() - oldest).total_seconds() if oldest else 0
+        return depth
+
+    def run(self):
+        """Run a claimed job, recording success or scheduling a retry."""
+        try:
+            getattr(self, f'run_{self.kind}')()
+        except Exception:
+            logger.exception("Job %s failed", self)
+            self.last_error = traceback.format_exc()
+            if self.attempts >= settings.FILE_VERSIONS_JOB_MAX_ATTEMPTS:
+                self.status = self.FAILED
+            else:
+                self.status = self.PENDING
+                delay = settings.FILE_VERSIONS_JOB_RETRY_DELAY * 2 ** (self.attempts - 1)
+                self.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            self.status = self.DONE
+            self.last_error = ''
+        self.locked_at = None
+        self.save(update_fields=['status', 'run_after', 'locked_at', 'last_error', 'updated_at'])
+
+    def run_extract_text(self):
+        extract(self.content_hash, self.content_type)
+        # Re-index the files whose latest version now has text.
+        files = File.objects.filter(latest_version__content_hash=self.content_hash)
+        for file_id in files.values_list('pk', flat=True):
+            SearchDocument.refresh(file_id)
+        # Diffs of the versions with this content can now be computed, so
+        # cached listings of their files are out of date.
+        file_ids = FileVersion.objects.filter(content_hash=self.content_hash).values('file_id')
+        audience = set(FileAccess.objects.filter(file__in=file_ids).values_list('user_id', flat=True))
+        audience.update(VersionAccess.objects.filter(version__file__in=file_ids).values_list('user_id', flat=True))
+        record_change(audience)
+
+    def run_compress(self):
+        try:
+            get_blob_store().recompress(self.content_hash, self.content_type)
+        except KeyError:
+            # Stored as a delta by now; nothing to compress.
+            pass
+
+    def run_compact(self):
+        # A file reverted to older content has it as its latest version again,
+        # which must stay stored in full.
+        if File.objects.filter(latest_version__content_hash=self.content_hash).exists():
+            return
+        get_blob_store().save_delta(self.content_hash, self.base_hash)
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of one version, sent as numbered parts of ``part_size``
+    bytes. Parts are written straight into their place in the upload file, so
+    they may arrive in any order, in parallel, and be retried individually.
+    Completing the session closes it to further parts, moves the assembled
+    file into the blob store, recording its ``content_hash``, and then creates
+    the version.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    url_path = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    part_size = models.BigIntegerField()
+    version = models.ForeignKey(FileVersion, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Upload {self.id} of {self.url_path}"
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.size // self.part_size))
+
+    def part_range(self, number):
+        """Return ``(offset, size)`` of part ``number``, counting from 1."""
+        offset = (number - 1) * self.part_size
+        return offset, min(self.part_size, self.size - offset)
+
+    def missing_parts(self):
+        received = set(self.parts.values_list('number', flat=True))
+        return [number for number in range(1, self.part_count + 1) if number not in received]
+
+
+class UploadPart(models.Model):
+    """A part of an upload session that has been written, with the SHA-256 of its bytes."""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='parts')
+    number = models.PositiveIntegerField()
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    uploaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('session', 'number')
+        ordering = ['number']
+
+    def __str__(self):
+        return f"Part {self.number} of upload {self.session_id}"
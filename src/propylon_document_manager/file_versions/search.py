@@ -0,0 +1,79 @@
+"""
+Full-text search over ``SearchDocument`` rows.
+
+SQLite uses the FTS5 table created by migration 0009 and ranks with BM25;
+PostgreSQL uses a GIN-indexed ``tsvector`` expression and ``ts_rank``. Other
+databases fall back to unranked substring matching.
+"""
+import re
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+from .models import FileAccess, SearchDocument, VersionAccess
+
+FTS_TABLE = 'file_versions_search_fts'
+SEARCH_CONFIG = 'english'
+
+
+def search_vector():
+    """
+    The ``tsvector`` searched on PostgreSQL. Paths and names weigh more than body text.
+    Must stay identical to the expression indexed by migration 0009.
+    """
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector('url_path', 'file_name', weight='A', config=SEARCH_CONFIG) + SearchVector(
+        'body', weight='B', config=SEARCH_CONFIG
+    )
+
+
+def fts5_query(query):
+    """Turn free text into an FTS5 query matching documents that contain every word."""
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in re.findall(r'\w+', query))
+
+
+def readable_documents(user):
+    """Search documents whose indexed version ``user`` can read."""
+    return SearchDocument.objects.filter(
+        models.Exists(FileAccess.objects.filter(file=models.OuterRef('file'), user=user, can_read=True))
+        | models.Exists(VersionAccess.objects.filter(version=models.OuterRef('version'), user=user, can_read=True))
+    )
+
+
+def search_documents(user, query):
+    """
+    Return the documents ``user`` can read that match ``query``, best match
+    first, each annotated with a ``score`` where higher is better.
+    """
+    documents = readable_documents(user).select_related('file', 'version')
+    if connection.vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return documents.none()
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        # bm25() is lower for better matches; the columns are weighted path, name, body.
+        score = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {SearchDocument._meta.db_table}.file_id',
+            [match],
+            output_field=models.FloatField(),
+        )
+        return documents.filter(pk__in=matches).annotate(score=score).order_by('-score', 'pk')
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return documents.annotate(vector=search_vector()).filter(vector=search_query).annotate(
+            score=SearchRank(models.F('vector'), search_query)
+        ).order_by('-score', 'pk')
+
+    words = re.findall(r'\w+', query)
+    if not words:
+        return documents.none()
+    for word in words:
+        documents = documents.filter(
+            models.Q(url_path__icontains=word) | models.Q(file_name__icontains=word) | models.Q(body__icontains=word)
+        )
+    return documents.annotate(score=models.Value(0.0)).order_by('pk')
@@ -0,0 +1,500 @@
+import fcntl
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from . import compression
+from .deltas import apply_delta, encode_delta, read_header
+from .diff_engine import DiffTooLarge
+
+
+class BlobTooLarge(Exception):
+    """Raised when streamed content exceeds the size limit given to the store."""
+
+
+def fsync_dir(path):
+    """Flush a directory's entries, making renames and new files in it durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def unlink(path):
+    """Remove ``path`` if it exists."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobStore:
+    """
+    Base class for content-addressed blob stores.
+    Blobs are immutable and keyed by the SHA-256 hash of their content,
+    so identical content is only ever stored once.
+    """
+
+    def exists(self, content_hash):
+        raise NotImplementedError
+
+    def open(self, content_hash):
+        """Return a binary file object positioned at the start of the blob."""
+        raise NotImplementedError
+
+    def size(self, content_hash):
+        raise NotImplementedError
+
+    def save(self, content, content_type=None):
+        """Store ``content`` and return its content hash."""
+        content_hash, _ = self.save_stream([content], content_type=content_type)
+        return content_hash
+
+    def save_stream(self, chunks, max_size=None, content_type=None):
+        """
+        Store the concatenation of ``chunks`` and return ``(content_hash, size)``.
+        The hash is computed in the same pass that writes the data, so content
+        is never held in memory as a whole. Raises ``BlobTooLarge`` as soon as
+        more than ``max_size`` bytes have been read. ``content_type`` lets the
+        store pick a compression codec; the hash always covers the original bytes.
+        """
+        raise NotImplementedError
+
+    def delete(self, content_hash):
+        raise NotImplementedError
+
+    def read(self, content_hash):
+        with self.open(content_hash) as fh:
+            return fh.read()
+
+    def read_text(self, content_hash):
+        """Return the text extracted from a blob, or ``None`` if none has been stored."""
+        raise NotImplementedError
+
+    def save_text(self, content_hash, text):
+        """Store the text extracted from a blob alongside it."""
+        raise NotImplementedError
+
+    def start_upload(self, upload_id, size):
+        """Reserve space for a resumable upload of ``size`` bytes, sent in parts."""
+        raise NotImplementedError
+
+    def write_part(self, upload_id, offset, chunks, max_size=None):
+        """
+        Write the concatenation of ``chunks`` into an upload at ``offset`` and
+        return ``(size, sha256)`` of the part. Parts cover disjoint byte ranges,
+        so they may be written concurrently and in any order. Raises
+        ``BlobTooLarge`` as soon as more than ``max_size`` bytes have been read.
+        """
+        raise NotImplementedError
+
+    def commit_upload(self, upload_id):
+        """Move a fully written upload into the store and return ``(content_hash, size)``."""
+        raise NotImplementedError
+
+    def abort_upload(self, upload_id):
+        """Discard an upload and the parts written so far."""
+        raise NotImplementedError
+
+
+class FileSystemBlobStore(BlobStore):
+    """
+    Blob store backed by the local filesystem.
+    Blobs live under ``<location>/<aa>/<bb>/<hash>`` where ``aa`` and ``bb``
+    are the first two byte pairs of the hash, keeping directories small.
+    Blobs compressed according to ``FILE_VERSIONS_BLOB_COMPRESSION`` are
+    stored as ``<hash>.z`` instead and decompressed as they are read.
+    """
+
+    def __init__(self, location=None):
+        self.location = location or os.path.join(settings.MEDIA_ROOT, "blobs")
+
+    def path(self, content_hash):
+        return os.path.join(self.location, content_hash[:2], content_hash[2:4], content_hash)
+
+    def compressed_path(self, content_hash):
+        return self.path(content_hash) + ".z"
+
+    def exists(self, content_hash):
+        return os.path.exists(self.path(content_hash)) or os.path.exists(self.compressed_path(content_hash))
+
+    def is_compressed(self, content_hash):
+        return not os.path.exists(self.path(content_hash)) and os.path.exists(self.compressed_path(content_hash))
+
+    def open(self, content_hash):
+        try:
+            return open(self.path(content_hash), "rb")
+        except FileNotFoundError:
+            pass
+        try:
+            return compression.DecompressingReader(open(self.compressed_path(content_hash), "rb"))
+        except FileNotFoundError:
+            raise KeyError(content_hash) from None
+
+    def size(self, content_hash):
+        try:
+            return os.path.getsize(self.path(content_hash))
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.compressed_path(content_hash), "rb") as fh:
+                return compression.unpack_header(fh.read(compression.HEADER.size))[1]
+        except FileNotFoundError:
+            raise KeyError(content_hash) from None
+
+    def stored_size(self, content_hash):
+        """Return the number of bytes the blob occupies on disk."""
+        for path in (self.path(content_hash), self.compressed_path(content_hash)):
+            if os.path.exists(path):
+                return os.path.getsize(path)
+        raise KeyError(content_hash)
+
+    def write_temp(self, chunks, max_size=None, codec=None):
+        """
+        Write ``chunks`` to a temporary file, compressed with ``codec`` if given.
+        Returns ``(tmp_path, content_hash, size)``.
+        """
+        # Write to a temporary file first so readers never see a partial blob.
+        tmp_dir = os.path.join(self.location, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as fh:
+                compressor = None
+                if codec is not None:
+                    compressor = compression.compressor(codec)
+                    fh.write(compression.pack_header(codec, 0))
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise BlobTooLarge(max_size)
+                    hasher.update(chunk)
+                    fh.write(compressor.compress(chunk) if compressor else chunk)
+                if compressor:
+                    fh.write(compressor.flush())
+                    # The original size is only known now; patch it into the header.
+                    fh.seek(0)
+                    fh.write(compression.pack_header(codec, size))
+                fh.flush()
+                os.fsync(fh.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path, hasher.hexdigest(), size
+
+    def save_stream(self, chunks, max_size=None, content_type=None):
+        codec = compression.codec_for(content_type)
+        tmp_path, content_hash, size = self.write_temp(chunks, max_size=max_size, codec=codec)
+        try:
+            if self.exists(content_hash):
+                # Already stored: drop the duplicate instead of committing it.
+                os.unlink(tmp_path)
+            elif codec is not None and os.path.getsize(tmp_path) >= size:
+                # Compression did not help; keep the original bytes instead.
+                with compression.DecompressingReader(open(tmp_path, "rb")) as fh:
+                    raw_path, _, _ = self.write_temp(iter(partial(fh.read, compression.CHUNK_SIZE), b""))
+                os.unlink(tmp_path)
+                self.commit(raw_path, self.path(content_hash))
+            else:
+                self.commit(tmp_path, self.compressed_path(content_hash) if codec else self.path(content_hash))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return content_hash, size
+
+    def commit(self, tmp_path, path):
+        """
+        Rename a fully written and fsynced file into place, then fsync its
+        directory, and any directories created for it, so the blob is durable
+        before the database records it.
+        """
+        directory = os.path.dirname(path)
+        created = []
+        parent = directory
+        while not os.path.isdir(parent):
+            created.append(parent)
+            parent = os.path.dirname(parent)
+        os.makedirs(directory, exist_ok=True)
+        os.replace(tmp_path, path)
+        fsync_dir(directory)
+        for new_directory in created:
+            fsync_dir(os.path.dirname(new_directory))
+
+    def stored_codec(self, content_hash):
+        """Return the codec a full blob is compressed with, or ``None`` when stored as is."""
+        if os.path.exists(self.path(content_hash)):
+            return None
+        try:
+            with open(self.compressed_path(content_hash), "rb") as fh:
+                return compression.unpack_header(fh.read(compression.HEADER.size))[0]
+        except FileNotFoundError:
+            raise KeyError(content_hash) from None
+
+    def recompress(self, content_hash, content_type):
+        """
+        Rewrite a full blob according to the current compression policy for
+        ``content_type``. Returns the change in bytes on disk.
+        """
+        codec = compression.codec_for(content_type)
+        if self.stored_codec(content_hash) == codec:
+            return 0
+        before = self.stored_size(content_hash)
+        with self.open(content_hash) as fh:
+            tmp_path, new_hash, size = self.write_temp(
+                iter(partial(fh.read, compression.CHUNK_SIZE), b""), codec=codec
+            )
+        if new_hash != content_hash:
+            os.unlink(tmp_path)
+            raise ValueError(f"blob {content_hash} does not match its hash")
+        if codec is not None and os.path.getsize(tmp_path) >= size:
+            # Compression does not help this blob; keep it uncompressed.
+            os.unlink(tmp_path)
+            if self.stored_codec(content_hash) is None:
+                return 0
+            with self.open(content_hash) as fh:
+                tmp_path, _, _ = self.write_temp(iter(partial(fh.read, compression.CHUNK_SIZE), b""))
+            codec = None
+        after = os.path.getsize(tmp_path)
+        if codec is None:
+            self.commit(tmp_path, self.path(content_hash))
+            unlink(self.compressed_path(content_hash))
+        else:
+            self.commit(tmp_path, self.compressed_path(content_hash))
+            unlink(self.path(content_hash))
+        return after - before
+
+    def text_path(self, content_hash):
+        return self.path(content_hash) + ".txt"
+
+    def read_text(self, content_hash):
+        try:
+            with open(self.text_path(content_hash), encoding="utf-8") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def save_text(self, content_hash, text):
+        tmp_path, _, _ = self.write_temp([text.encode("utf-8")])
+        self.commit(tmp_path, self.text_path(content_hash))
+
+    def upload_path(self, upload_id):
+        return os.path.join(self.location, "uploads", str(upload_id))
+
+    def start_upload(self, upload_id, size):
+        path = self.upload_path(upload_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.truncate(size)
+
+    def write_part(self, upload_id, offset, chunks, max_size=None):
+        path = self.upload_path(upload_id)
+        try:
+            fd = os.open(path, os.O_WRONLY)
+        except FileNotFoundError:
+            raise KeyError(upload_id) from None
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            # Writers share the lock; commit_upload takes it exclusively, so it
+            # waits for writes in flight and later writes find the upload gone.
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            try:
+                if os.stat(path).st_ino != os.fstat(fd).st_ino:
+                    raise KeyError(upload_id)
+            except FileNotFoundError:
+                raise KeyError(upload_id) from None
+            for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise BlobTooLarge(max_size)
+                hasher.update(chunk)
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    view = view[written:]
+                    offset += written
+        finally:
+            os.close(fd)
+        return size, hasher.hexdigest()
+
+    def commit_upload(self, upload_id):
+        """
+        The parts were written in place, so the upload is already assembled:
+        committing reads it once to hash it and renames it into the store.
+        Parts still being written are waited for.
+        """
+        path = self.upload_path(upload_id)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            raise KeyError(upload_id) from None
+        with fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            for chunk in iter(partial(fh.read, 1024 * 1024), b""):
+                hasher.update(chunk)
+                size += len(chunk)
+            content_hash = hasher.hexdigest()
+            # Still holding the lock, so no part is written after hashing.
+            os.fsync(fh.fileno())
+            try:
+                if self.exists(content_hash):
+                    os.unlink(path)
+                else:
+                    self.commit(path, self.path(content_hash))
+            except FileNotFoundError:
+                # Aborted while it was being hashed.
+                raise KeyError(upload_id) from None
+        return content_hash, size
+
+    def abort_upload(self, upload_id):
+        unlink(self.upload_path(upload_id))
+
+    def delete(self, content_hash):
+        unlink(self.path(content_hash))
+        unlink(self.compressed_path(content_hash))
+        unlink(self.text_path(content_hash))
+
+
+class DeltaBlobStore(FileSystemBlobStore):
+    """
+    Filesystem blob store that can keep blobs as deltas against other blobs.
+    ``save_delta`` replaces a full blob with a ``<hash>.delta`` file encoding it
+    against a base blob, which must itself be stored in full; chains therefore
+    never form cycles. Reads rebuild delta blobs through their chain and cache
+    the result. Blobs used as delta bases must not be deleted.
+    """
+
+    def __init__(self, location=None, keyframe_interval=None, max_delta_ratio=0.5):
+        super().__init__(location)
+        if keyframe_interval is None:
+            keyframe_interval = settings.FILE_VERSIONS_DELTA_KEYFRAME_INTERVAL
+        self.keyframe_interval = keyframe_interval
+        self.max_delta_ratio = max_delta_ratio
+
+    def delta_path(self, content_hash):
+        return self.path(content_hash) + ".delta"
+
+    def is_delta(self, content_hash):
+        return not super().exists(content_hash) and os.path.exists(self.delta_path(content_hash))
+
+    def exists(self, content_hash):
+        return super().exists(content_hash) or os.path.exists(self.delta_path(content_hash))
+
+    def open(self, content_hash):
+        try:
+            return super().open(content_hash)
+        except KeyError:
+            return io.BytesIO(self.reconstruct(content_hash))
+
+    def size(self, content_hash):
+        try:
+            return super().size(content_hash)
+        except KeyError:
+            return read_header(self.read_delta(content_hash))[1]
+
+    def read_delta(self, content_hash):
+        try:
+            with open(self.delta_path(content_hash), "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            raise KeyError(content_hash) from None
+
+    def reconstruct(self, content_hash):
+        """Rebuild a delta blob from its base, caching the result."""
+        key = f"file_versions:blob:{content_hash}"
+        content = cache.get(key)
+        if content is not None:
+            return content
+        delta = self.read_delta(content_hash)
+        base_hash, size, _ = read_header(delta)
+        content = apply_delta(self.read(base_hash), delta)
+        if hashlib.sha256(content).hexdigest() != content_hash:
+            raise ValueError(f"delta for {content_hash} does not reproduce its content")
+        if size <= settings.FILE_VERSIONS_DELTA_CACHE_MAX_ENTRY_SIZE:
+            cache.set(key, content, settings.FILE_VERSIONS_DELTA_CACHE_TIMEOUT)
+        return content
+
+    def lock_path(self, content_hash):
+        return os.path.join(self.location, "locks", content_hash[:2], content_hash[2:4], content_hash)
+
+    @contextmanager
+    def locked(self, *content_hashes):
+        """Hold exclusive locks on ``content_hashes``, taken in sorted order so callers cannot deadlock."""
+        with ExitStack() as stack:
+            for content_hash in sorted(set(content_hashes)):
+                path = self.lock_path(content_hash)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fh = stack.enter_context(open(path, "ab"))
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def save_delta(self, content_hash, base_hash):
+        """
+        Store ``content_hash`` as a delta against ``base_hash``.
+        Both blobs must be stored in full, and the base must not have a delta
+        of its own. Returns whether the blob was replaced; it is kept in full
+        when the delta would save too little or matching exceeds the diff
+        budget.
+        """
+        if content_hash == base_hash:
+            return False
+        # Both blobs are locked and checked under the lock, so two calls
+        # encoding each blob against the other cannot both succeed.
+        with self.locked(content_hash, base_hash):
+            if (
+                not super().exists(content_hash)
+                or not super().exists(base_hash)
+                or os.path.exists(self.delta_path(base_hash))
+            ):
+                return False
+            with super().open(content_hash) as fh:
+                target = fh.read()
+            with super().open(base_hash) as fh:
+                base = fh.read()
+            try:
+                delta = encode_delta(
+                    base_hash,
+                    base,
+                    target,
+                    max_cost=settings.FILE_VERSIONS_DIFF_MAX_EDIT_COST,
+                    timeout=settings.FILE_VERSIONS_DIFF_TIMEOUT,
+                )
+            except DiffTooLarge:
+                return False
+            if len(delta) > len(target) * self.max_delta_ratio:
+                return False
+
+            tmp_path, _, _ = self.write_temp([delta])
+            self.commit(tmp_path, self.delta_path(content_hash))
+            # Drop the full copy only; the extracted text stays with the blob.
+            unlink(self.path(content_hash))
+            unlink(self.compressed_path(content_hash))
+            return True
+
+    def delete(self, content_hash):
+        super().delete(content_hash)
+        unlink(self.delta_path(content_hash))
+
+
+def get_blob_store():
+    """Return the blob store configured by ``FILE_VERSIONS_BLOB_STORE``."""
+    backend = getattr(
+        settings,
+        "FILE_VERSIONS_BLOB_STORE",
+        "propylon_document_manager.file_versions.storage.FileSystemBlobStore",
+    )
+    options = getattr(settings, "FILE_VERSIONS_BLOB_STORE_OPTIONS", {})
+    return import_string(backend)(**options)
@@ -0,0 +1,151 @@
+"""
+Text representations of blobs.
+
+Text content types are their own text. PDF and DOCX blobs are converted to
+normalized text once per ``content_hash`` by a background job after the
+upload commits; the result is stored next to the blob and reused by search,
+diffs and previews.
+"""
+import io
+import logging
+import re
+import unicodedata
+import zipfile
+from xml.etree import ElementTree
+
+from django.conf import settings
+
+from .storage import get_blob_store
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover - optional dependency
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+# Non-``text/*`` content types that are still safe to treat as text.
+TEXT_CONTENT_TYPES = {
+    'application/json',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/javascript',
+    'application/x-yaml',
+    'application/yaml',
+    'application/csv',
+}
+
+PDF = 'application/pdf'
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def base_content_type(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def is_text_content_type(content_type):
+    """Return whether content of ``content_type`` can be diffed as text."""
+    content_type = base_content_type(content_type)
+    return (
+        content_type.startswith('text/')
+        or content_type in TEXT_CONTENT_TYPES
+        or content_type.endswith('+xml')
+        or content_type.endswith('+json')
+    )
+
+
+def normalize_text(text):
+    """Normalize Unicode and whitespace so equivalent documents extract to identical text."""
+    text = unicodedata.normalize('NFC', text).replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t\f\v]+', ' ', line).strip() for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def seekable(fh):
+    """Return ``fh`` if it can seek, else an in-memory copy; PDF and zip readers need random access."""
+    if getattr(fh, 'seekable', lambda: False)():
+        return fh
+    return io.BytesIO(fh.read())
+
+
+def extract_pdf(fh):
+    reader = pypdf.PdfReader(seekable(fh))
+    return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def extract_docx(fh):
+    paragraphs = []
+    with zipfile.ZipFile(seekable(fh)) as archive, archive.open('word/document.xml') as document:
+        parts = []
+        for _, element in ElementTree.iterparse(document):
+            if element.tag == f'{WORD_NAMESPACE}t':
+                parts.append(element.text or '')
+            elif element.tag == f'{WORD_NAMESPACE}tab':
+                parts.append('\t')
+            elif element.tag in {f'{WORD_NAMESPACE}br', f'{WORD_NAMESPACE}cr'}:
+                parts.append('\n')
+            elif element.tag == f'{WORD_NAMESPACE}p':
+                paragraphs.append(''.join(parts))
+                parts = []
+                element.clear()
+    return '\n'.join(paragraphs)
+
+
+def extractor_for(content_type):
+    """Return the function converting blobs of ``content_type`` to text, or ``None``."""
+    content_type = base_content_type(content_type)
+    if content_type == PDF and pypdf is not None:
+        return extract_pdf
+    if content_type == DOCX:
+        return extract_docx
+    return None
+
+
+def is_diffable_content_type(content_type):
+    """Return whether versions of ``content_type`` have a text form that can be diffed."""
+    return is_text_content_type(content_type) or extractor_for(content_type) is not None
+
+
+def extract(content_hash, content_type):
+    """
+    Convert a blob to text and store the result, unless that was already done.
+    Returns the text, or ``None`` when ``content_type`` has no extractor.
+    Unreadable documents are stored as empty text so they are not retried.
+    """
+    store = get_blob_store()
+    text = store.read_text(content_hash)
+    if text is not None:
+        return text
+    extractor = extractor_for(content_type)
+    if extractor is None:
+        return None
+    try:
+        with store.open(content_hash) as fh:
+            text = normalize_text(extractor(fh))
+    except Exception:
+        logger.exception("Could not extract text from %s (%s)", content_hash, content_type)
+        text = ''
+    text = text[:settings.FILE_VERSIONS_EXTRACTED_TEXT_MAX_SIZE]
+    store.save_text(content_hash, text)
+    return text
+
+
+def get_text(content_hash, content_type, max_size=None):
+    """
+    Return the text of a blob: text content decoded as UTF-8, or the stored
+    extraction for PDF/DOCX. Returns ``None`` when there is no text (yet).
+    """
+    if is_text_content_type(content_type):
+        with get_blob_store().open(content_hash) as fh:
+            data = fh.read(-1 if max_size is None else max_size)
+        return data.decode('utf-8', errors='ignore')
+    text = get_blob_store().read_text(content_hash)
+    if text is not None and max_size is not None:
+        text = text[:max_size]
+    return text
+
+
+def extract_text(content_hash, content_type):
+    """Return the searchable text of a blob, or an empty string if it has none (yet)."""
+    return get_text(content_hash, content_type, max_size=settings.FILE_VERSIONS_SEARCH_MAX_TEXT_SIZE) or ''
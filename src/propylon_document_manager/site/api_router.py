@@ -1,6 +1,8 @@
 from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
+from propylon_document_manager.file_versions.api import async_views
 from propylon_document_manager.file_versions.api.views import FileViewSet, FileVersionViewSet
 
 if settings.DEBUG:
@@ -12,4 +14,13 @@ router.register("files", FileViewSet, basename="file")
 router.register("versions", FileVersionViewSet, basename="version")
 
 app_name = "api"
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    # Async variants of the transfer-heavy endpoints, for ASGI deployments.
+    path("async/files/<int:pk>/versions/", async_views.file_versions, name="async-file-versions"),
+    path("async/versions/", async_views.create_version, name="async-version-list"),
+    path(
+        "async/versions/<str:content_hash>/download/",
+        async_views.download_version,
+        name="async-version-download",
+    ),
+]
@@ -0,0 +1,17 @@
+"""
+ASGI config for Propylon Document Manager.
+
+Serve with an ASGI server, e.g.::
+
+    uvicorn propylon_document_manager.site.asgi:application
+
+so the async endpoints under ``/api/async/`` can hold many slow uploads and
+downloads without tying up a worker thread each.
+"""
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "propylon_document_manager.site.settings.production")
+
+application = get_asgi_application()
@@ -48,6 +48,12 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": "propylon_document_manager.sqlite",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, so concurrent writers
+            # wait for each other instead of failing with "database is locked".
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
     }
 }
 # https://docs.djangoproject.com/en/stable/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
@@ -57,6 +63,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#root-urlconf
 ROOT_URLCONF = "propylon_document_manager.site.urls"
+# https://docs.djangoproject.com/en/dev/ref/settings/#asgi-application
+ASGI_APPLICATION = "propylon_document_manager.site.asgi.application"
 
 # APPS
 # ------------------------------------------------------------------------------
@@ -273,6 +281,8 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_PAGINATION_CLASS": "propylon_document_manager.file_versions.api.pagination.CreatedAtCursorPagination",
+    "PAGE_SIZE": env.int("API_PAGE_SIZE", default=50),
 }
 
 # JWT Settings
@@ -301,3 +311,79 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# File versions
+# ------------------------------------------------------------------------------
+# Content-addressed blob store holding the bytes of every file version.
+FILE_VERSIONS_BLOB_STORE = env(
+    "FILE_VERSIONS_BLOB_STORE",
+    default="propylon_document_manager.file_versions.storage.FileSystemBlobStore",
+)
+FILE_VERSIONS_BLOB_STORE_OPTIONS: dict = {}
+# Uploads larger than this many bytes are rejected with 413.
+FILE_VERSIONS_MAX_UPLOAD_SIZE = env.int("FILE_VERSIONS_MAX_UPLOAD_SIZE", default=1024 * 1024 * 1024)
+# Diffs between pairs of blobs are cached in the default cache (seconds, None
+# keeps them until evicted) and in a database table bounded to MAX_ENTRIES rows.
+FILE_VERSIONS_DIFF_CACHE_TIMEOUT = env.int("FILE_VERSIONS_DIFF_CACHE_TIMEOUT", default=None)
+FILE_VERSIONS_DIFF_CACHE_MAX_ENTRIES = env.int("FILE_VERSIONS_DIFF_CACHE_MAX_ENTRIES", default=10000)
+FILE_VERSIONS_DIFF_CACHE_MAX_ENTRY_SIZE = env.int("FILE_VERSIONS_DIFF_CACHE_MAX_ENTRY_SIZE", default=1024 * 1024)
+# Budget for a single diff: edit-script length in lines and wall-clock seconds.
+# Diffs over budget are summarised as "Files differ; diff too large".
+FILE_VERSIONS_DIFF_MAX_EDIT_COST = env.int("FILE_VERSIONS_DIFF_MAX_EDIT_COST", default=20000)
+FILE_VERSIONS_DIFF_TIMEOUT = env.float("FILE_VERSIONS_DIFF_TIMEOUT", default=2.0)
+# Upper bound for the ?page_size= query parameter on paginated endpoints.
+FILE_VERSIONS_MAX_PAGE_SIZE = env.int("FILE_VERSIONS_MAX_PAGE_SIZE", default=500)
+# How long serialized file and version listings are cached, keyed by their ETag.
+FILE_VERSIONS_LISTING_CACHE_TIMEOUT = env.int("FILE_VERSIONS_LISTING_CACHE_TIMEOUT", default=300)
+# Maximum number of items accepted by a single bulk upload request.
+FILE_VERSIONS_BULK_UPLOAD_MAX_ITEMS = env.int("FILE_VERSIONS_BULK_UPLOAD_MAX_ITEMS", default=1000)
+# Delta storage (FILE_VERSIONS_BLOB_STORE = "...storage.DeltaBlobStore"): every Nth version
+# of a file is kept in full, bounding reconstruction to N - 1 deltas. 1 disables deltas.
+FILE_VERSIONS_DELTA_KEYFRAME_INTERVAL = env.int("FILE_VERSIONS_DELTA_KEYFRAME_INTERVAL", default=10)
+FILE_VERSIONS_DELTA_CACHE_TIMEOUT = env.int("FILE_VERSIONS_DELTA_CACHE_TIMEOUT", default=3600)
+FILE_VERSIONS_DELTA_CACHE_MAX_ENTRY_SIZE = env.int("FILE_VERSIONS_DELTA_CACHE_MAX_ENTRY_SIZE", default=8 * 1024 * 1024)
+# Blob compression: "auto" (zstd when the zstandard package is installed, else zlib),
+# "zstd", "zlib", or empty to disable. Content types matching the patterns below are
+# already compressed and stored as is; so is content of unknown type.
+FILE_VERSIONS_BLOB_COMPRESSION = env("FILE_VERSIONS_BLOB_COMPRESSION", default="auto")
+FILE_VERSIONS_UNCOMPRESSED_CONTENT_TYPES = [
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zstd",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/epub+zip",
+    "application/vnd.openxmlformats-officedocument.*",
+    "application/vnd.oasis.opendocument.*",
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "audio/*",
+    "video/*",
+]
+# Only the first this many bytes of a version's text are indexed for search.
+FILE_VERSIONS_SEARCH_MAX_TEXT_SIZE = env.int("FILE_VERSIONS_SEARCH_MAX_TEXT_SIZE", default=1024 * 1024)
+# Text extracted from PDF (needs pypdf) and DOCX blobs is truncated to this many characters.
+FILE_VERSIONS_EXTRACTED_TEXT_MAX_SIZE = env.int("FILE_VERSIONS_EXTRACTED_TEXT_MAX_SIZE", default=16 * 1024 * 1024)
+# Longest text returned by the version text preview, in characters (bytes for text content).
+FILE_VERSIONS_PREVIEW_MAX_SIZE = env.int("FILE_VERSIONS_PREVIEW_MAX_SIZE", default=64 * 1024)
+# Background jobs (text extraction, compression, delta storage) are queued in the
+# database and run by `manage.py process_jobs`. Failed jobs are retried up to
+# MAX_ATTEMPTS times, RETRY_DELAY seconds apart, doubling each time; jobs held by a
+# worker for LOCK_TIMEOUT seconds are assumed abandoned. EAGER runs jobs as soon as
+# the transaction queueing them commits, without a worker.
+FILE_VERSIONS_JOBS_EAGER = env.bool("FILE_VERSIONS_JOBS_EAGER", default=False)
+FILE_VERSIONS_JOB_MAX_ATTEMPTS = env.int("FILE_VERSIONS_JOB_MAX_ATTEMPTS", default=5)
+FILE_VERSIONS_JOB_RETRY_DELAY = env.int("FILE_VERSIONS_JOB_RETRY_DELAY", default=30)
+FILE_VERSIONS_JOB_LOCK_TIMEOUT = env.int("FILE_VERSIONS_JOB_LOCK_TIMEOUT", default=600)
+# Resumable uploads: the default part size in bytes (raised when a document would
+# otherwise need more than MAX_PARTS parts), and how long in seconds a session can
+# take before `manage.py expire_upload_sessions` discards it.
+FILE_VERSIONS_UPLOAD_PART_SIZE = env.int("FILE_VERSIONS_UPLOAD_PART_SIZE", default=8 * 1024 * 1024)
+FILE_VERSIONS_UPLOAD_MAX_PARTS = env.int("FILE_VERSIONS_UPLOAD_MAX_PARTS", default=10000)
+FILE_VERSIONS_UPLOAD_SESSION_TIMEOUT = env.int("FILE_VERSIONS_UPLOAD_SESSION_TIMEOUT", default=24 * 60 * 60)
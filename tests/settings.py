@@ -2,6 +2,9 @@
 With these settings, tests run faster.
 """
 
+import os
+import tempfile
+
 from propylon_document_manager.site.settings.base import *  # noqa
 from propylon_document_manager.site.settings.base import env
 
@@ -15,6 +18,14 @@ SECRET_KEY = env(
 # https://docs.djangoproject.com/en/dev/ref/settings/#test-runner
 TEST_RUNNER = "django.test.runner.DiscoverRunner"
 
+# DATABASES
+# ------------------------------------------------------------------------------
+# An on-disk test database lets concurrency tests use several connections;
+# in-memory shared-cache SQLite fails on table locks instead of waiting.
+DATABASES["default"]["TEST"] = {  # noqa: F405
+    "NAME": os.path.join(tempfile.gettempdir(), "test_propylon_document_manager.sqlite"),
+}
+
 # PASSWORDS
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#password-hashers
@@ -30,3 +41,5 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore # noqa: F405
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Run background jobs when their transaction commits instead of needing a worker.
+FILE_VERSIONS_JOBS_EAGER = True
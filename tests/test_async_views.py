@@ -0,0 +1,101 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from propylon_document_manager.file_versions.models import FileVersion
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+CONTENT = b''.join(b'Line %d of the consolidated act.\n' % n for n in range(10000))
+
+
+async def read_streaming(response):
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+@pytest.mark.django_db
+class TestAsyncViews:
+    def setup_method(self):
+        self.file = FileFactory(url_path='/docs/act.txt', content_type='text/plain')
+        self.version = FileVersionFactory(file=self.file, version_number=1, content=CONTENT)
+        self.client = AsyncClient()
+
+    def auth(self, user, **headers):
+        return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}', **headers}
+
+    def get(self, url, **headers):
+        return async_to_sync(self.client.get)(url, headers=self.auth(self.file.owner, **headers))
+
+    def post(self, url, data):
+        return async_to_sync(self.client.post)(url, data, headers=self.auth(self.file.owner))
+
+    def test_download_streams_asynchronously(self):
+        """Test that downloads are streamed from an async iterator, including ranges."""
+        url = reverse('api:async-version-download', kwargs={'content_hash': self.version.content_hash})
+
+        response = self.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.is_async
+        assert response['Content-Length'] == str(len(CONTENT))
+        assert async_to_sync(read_streaming)(response) == CONTENT
+
+        response = self.get(url, Range='bytes=100-199')
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert async_to_sync(read_streaming)(response) == CONTENT[100:200]
+
+        response = self.get(url, **{'If-None-Match': f'"{self.version.content_hash}"'})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_download_requires_read_access(self):
+        """Test that other users cannot download the version, and anonymous users are rejected."""
+        url = reverse('api:async-version-download', kwargs={'content_hash': self.version.content_hash})
+
+        response = async_to_sync(self.client.get)(url, headers=self.auth(UserFactory()))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert async_to_sync(self.client.get)(url).status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_upload(self, django_capture_on_commit_callbacks):
+        """Test that the async upload creates the next version like ``POST /api/versions/``."""
+        with django_capture_on_commit_callbacks(execute=True):
+            response = self.post(
+                reverse('api:async-version-list'),
+                {'file': self.file.pk, 'file_name': 'act.txt', 'content': SimpleUploadedFile('act.txt', b'Amended.')},
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()['version_number'] == 2
+        version = FileVersion.objects.get(file=self.file, version_number=2)
+        assert version.content == b'Amended.'
+        assert response.json()['content_hash'] == version.content_hash
+
+    def test_upload_validation_and_permissions(self):
+        """Test that invalid uploads and uploads to other users' files are rejected."""
+        url = reverse('api:async-version-list')
+        response = self.post(url, {'file': self.file.pk, 'file_name': 'act.txt'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'content' in response.json()
+
+        other = FileFactory(url_path='/docs/other.txt', content_type='text/plain')
+        response = self.post(
+            url, {'file': other.pk, 'file_name': 'x.txt', 'content': SimpleUploadedFile('x.txt', b'x')}
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert not other.versions.exists()
+
+    def test_version_listing(self):
+        """Test that the async listing returns the same page and ETag handling as the sync one."""
+        FileVersionFactory(file=self.file, version_number=2, content=b'v2')
+        url = reverse('api:async-file-versions', kwargs={'pk': self.file.pk})
+
+        response = self.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert [v['version_number'] for v in response.json()['results']] == [2, 1]
+
+        response = self.get(url, **{'If-None-Match': response['ETag']})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        other = FileFactory(url_path='/docs/other.txt')
+        assert self.get(reverse('api:async-file-versions', kwargs={'pk': other.pk})).status_code == 404
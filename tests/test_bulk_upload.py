@@ -0,0 +1,127 @@
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.models import File, FileAccess
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+
+@pytest.mark.django_db
+class TestBulkUpload:
+    def setup_method(self):
+        """Set up an owner with one existing file."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.existing = FileFactory(owner=self.owner, url_path='/docs/a.txt', content_type='text/plain')
+        FileVersionFactory(file=self.existing, version_number=1, content=b'a1')
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('api:file-bulk-upload')
+
+    def test_multipart_upload(self):
+        """Test that parts create new files and version existing ones in order."""
+        manifest = [
+            {'url_path': '/docs/a.txt'},
+            {'url_path': '/docs/b.txt', 'content_type': 'text/plain'},
+            {'url_path': '/docs/b.txt'},
+        ]
+        files = [
+            SimpleUploadedFile('a.txt', b'a2'),
+            SimpleUploadedFile('b.txt', b'b1'),
+            SimpleUploadedFile('b.txt', b'b2'),
+        ]
+        response = self.client.post(self.url, {'files': files, 'manifest': json.dumps(manifest)}, format='multipart')
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data['results']
+        assert [r['status'] for r in results] == ['versioned', 'created', 'versioned']
+        assert [r['version_number'] for r in results] == [2, 1, 2]
+
+        new_file = File.objects.get(owner=self.owner, url_path='/docs/b.txt')
+        assert new_file.latest_version_number == 2
+        assert new_file.latest_version.content == b'b2'
+        assert FileAccess.objects.filter(file=new_file, user=self.owner, can_write=True).exists()
+        self.existing.refresh_from_db()
+        assert self.existing.latest_version.content == b'a2'
+
+    def test_zip_archive(self):
+        """Test that archive members are stored under the prefix with guessed content types."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('a.txt', b'a2')
+            zf.writestr('nested/c.json', b'{}')
+        archive = SimpleUploadedFile('batch.zip', buffer.getvalue())
+
+        response = self.client.post(self.url, {'archive': archive, 'prefix': '/docs'}, format='multipart')
+
+        results = response.data['results']
+        assert [(r['url_path'], r['status']) for r in results] == [
+            ('/docs/a.txt', 'versioned'),
+            ('/docs/nested/c.json', 'created'),
+        ]
+        assert File.objects.get(owner=self.owner, url_path='/docs/nested/c.json').content_type == 'application/json'
+
+    def test_tar_archive(self):
+        """Test that compressed tar archives are read as a stream."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            info = tarfile.TarInfo('d.txt')
+            info.size = 2
+            tar.addfile(info, io.BytesIO(b'd1'))
+        archive = SimpleUploadedFile('batch.tar.gz', buffer.getvalue())
+
+        response = self.client.post(self.url, {'archive': archive}, format='multipart')
+
+        assert response.data['results'][0]['status'] == 'created'
+        assert File.objects.get(owner=self.owner, url_path='/d.txt').latest_version.content == b'd1'
+
+    def test_query_count_is_constant(self):
+        """Test that the number of queries does not grow with the number of items."""
+        def upload(count, start):
+            manifest = [{'url_path': f'/bulk/{start + i}'} for i in range(count)]
+            files = [SimpleUploadedFile(f'{i}.txt', f'{start + i}'.encode()) for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {'files': files, 'manifest': json.dumps(manifest)}, format='multipart')
+            return len(queries)
+
+        assert upload(2, 0) == upload(20, 100)
+
+    def test_item_errors_are_reported(self, settings):
+        """Test that oversized items are reported without failing the batch."""
+        settings.FILE_VERSIONS_MAX_UPLOAD_SIZE = 4
+        files = [SimpleUploadedFile('small.txt', b'ok'), SimpleUploadedFile('big.txt', b'too large')]
+
+        response = self.client.post(self.url, {'files': files}, format='multipart')
+
+        results = response.data['results']
+        assert [r['status'] for r in results] == ['created', 'error']
+        assert 'error' in results[1]
+        assert not File.objects.filter(owner=self.owner, url_path='/big.txt').exists()
+
+    def test_invalid_manifest_entries_are_reported(self):
+        """Test that manifest paths and names are validated like single uploads, per item."""
+        manifest = [
+            {'url_path': 'relative.txt'},
+            {'url_path': ['/docs/list.txt']},
+            {'file_name': 'n' * 256},
+            {'url_path': '/docs/ok.txt'},
+        ]
+        files = [SimpleUploadedFile(f'{n}.txt', b'x') for n in range(4)]
+
+        response = self.client.post(self.url, {'files': files, 'manifest': json.dumps(manifest)}, format='multipart')
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data['results']
+        assert [r['status'] for r in results] == ['error', 'error', 'error', 'created']
+        assert [r['error'].split(':')[0] for r in results[:3]] == ['url_path', 'url_path', 'file_name']
+        assert list(File.objects.filter(owner=self.owner).values_list('url_path', flat=True).order_by('pk')) == [
+            '/docs/a.txt', '/docs/ok.txt'
+        ]
@@ -0,0 +1,117 @@
+import hashlib
+import os
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions import compression
+from propylon_document_manager.file_versions.storage import FileSystemBlobStore
+from tests.factories import FileFactory, FileVersionFactory
+
+TEXT = b''.join(b'<clause id="%d">Subject to the provisions of this Act.</clause>\n' % n for n in range(2000))
+
+
+@pytest.fixture
+def store(tmpdir):
+    return FileSystemBlobStore(location=tmpdir.strpath)
+
+
+class TestCompressedBlobs:
+    def test_text_is_compressed_and_hash_covers_original(self, store):
+        """Test that text is stored compressed under the hash of the original bytes."""
+        content_hash, size = store.save_stream([TEXT[:1000], TEXT[1000:]], content_type='application/xml')
+
+        assert content_hash == hashlib.sha256(TEXT).hexdigest()
+        assert size == len(TEXT)
+        assert store.is_compressed(content_hash)
+        assert store.stored_size(content_hash) < len(TEXT) // 5
+        assert store.size(content_hash) == len(TEXT)
+        assert store.read(content_hash) == TEXT
+
+    def test_compressed_formats_are_skipped(self, store):
+        """Test that already-compressed content types are stored as is."""
+        content_hash = store.save(TEXT, content_type='application/pdf')
+
+        assert not store.is_compressed(content_hash)
+        assert store.stored_size(content_hash) == len(TEXT)
+
+    def test_incompressible_content_is_stored_raw(self, store):
+        """Test that content that does not shrink is kept uncompressed."""
+        content_hash = store.save(os.urandom(10000), content_type='text/plain')
+
+        assert not store.is_compressed(content_hash)
+
+    @pytest.mark.parametrize('codec', ['zlib', 'auto'])
+    def test_streaming_reads_and_forward_seeks(self, store, settings, codec):
+        """Test that compressed blobs decompress incrementally and support forward seeks."""
+        settings.FILE_VERSIONS_BLOB_COMPRESSION = codec
+        content_hash = store.save(TEXT, content_type='text/plain')
+
+        with store.open(content_hash) as fh:
+            assert fh.read(10) == TEXT[:10]
+            fh.seek(50000)
+            assert fh.read(100) == TEXT[50000:50100]
+            with pytest.raises(OSError):
+                fh.seek(0)
+
+    @pytest.mark.parametrize('codec', ['zlib', 'zstd'])
+    def test_codecs(self, store, settings, codec):
+        """Test that every configured codec round-trips."""
+        if codec == 'zstd':
+            pytest.importorskip('zstandard')
+        settings.FILE_VERSIONS_BLOB_COMPRESSION = codec
+        content_hash = store.save(TEXT, content_type='text/plain')
+
+        assert store.stored_codec(content_hash) == compression.available_codecs()[codec]
+        assert store.read(content_hash) == TEXT
+
+    def test_recompress(self, store, settings):
+        """Test that recompressing follows the policy in both directions."""
+        settings.FILE_VERSIONS_BLOB_COMPRESSION = ''
+        content_hash = store.save(TEXT, content_type='text/plain')
+        settings.FILE_VERSIONS_BLOB_COMPRESSION = 'auto'
+
+        assert store.recompress(content_hash, 'text/plain') < 0
+        assert store.is_compressed(content_hash)
+        assert store.recompress(content_hash, 'text/plain') == 0
+        assert store.recompress(content_hash, 'application/zip') > 0
+        assert not store.is_compressed(content_hash)
+        assert store.read(content_hash) == TEXT
+
+
+@pytest.mark.django_db
+class TestCompressedDownloads:
+    @pytest.fixture(autouse=True)
+    def blob_location(self, settings, tmpdir):
+        settings.FILE_VERSIONS_BLOB_STORE_OPTIONS = {'location': tmpdir.strpath}
+
+    def test_download_and_range(self):
+        """Test that downloads stream decompressed content, including ranges."""
+        file = FileFactory(url_path='/docs/act.xml', content_type='application/xml')
+        version = FileVersionFactory(file=file, version_number=1, content=TEXT)
+        client = APIClient()
+        client.force_authenticate(user=file.owner)
+        url = reverse('api:version-download', kwargs={'content_hash': version.content_hash})
+
+        response = client.get(url)
+        assert response['Content-Length'] == str(len(TEXT))
+        assert b''.join(response.streaming_content) == TEXT
+
+        response = client.get(url, HTTP_RANGE='bytes=70000-70099')
+        assert response.status_code == 206
+        assert b''.join(response.streaming_content) == TEXT[70000:70100]
+
+    def test_recompress_command(self, settings, capsys):
+        """Test that the management command compresses blobs stored before compression was enabled."""
+        settings.FILE_VERSIONS_BLOB_COMPRESSION = ''
+        file = FileFactory(url_path='/docs/act.txt', content_type='text/plain')
+        version = FileVersionFactory(file=file, version_number=1, content=TEXT)
+        settings.FILE_VERSIONS_BLOB_COMPRESSION = 'zlib'
+
+        call_command('recompress_blobs')
+
+        assert 'Rewrote 1 blobs' in capsys.readouterr().out
+        store = FileSystemBlobStore(location=settings.FILE_VERSIONS_BLOB_STORE_OPTIONS['location'])
+        assert store.is_compressed(version.content_hash)
@@ -0,0 +1,88 @@
+import hashlib
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.models import File, FileVersion
+from propylon_document_manager.file_versions.storage import get_blob_store
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+CONTENT = b'Consolidated text of the Finance Act.\n' * 100
+
+
+@pytest.mark.django_db
+class TestContentClaim:
+    def setup_method(self):
+        self.source = FileFactory(url_path='/acts/finance.pdf', content_type='application/pdf')
+        self.version = FileVersionFactory(file=self.source, version_number=1, content=CONTENT)
+        self.client = APIClient()
+
+    def claim(self, user, **data):
+        self.client.force_authenticate(user=user)
+        data = {
+            'url_path': '/republished/finance.pdf',
+            'file_name': 'finance.pdf',
+            'content_hash': self.version.content_hash,
+            **data,
+        }
+        return self.client.post(reverse('api:file-claim'), data, format='json')
+
+    def test_claim_own_content(self, monkeypatch):
+        """Test that a readable hash creates a new file by reference, without storing the content again."""
+        store = type(get_blob_store())
+        monkeypatch.setattr(store, 'save_stream', lambda *args, **kwargs: pytest.fail('content was stored again'))
+
+        response = self.claim(self.source.owner, content_hash=self.version.content_hash.upper())
+
+        assert response.status_code == status.HTTP_201_CREATED
+        file = File.objects.get(owner=self.source.owner, url_path='/republished/finance.pdf')
+        assert response.json()['id'] == file.pk
+        assert file.content_type == 'application/pdf'
+        version = file.latest_version
+        assert (version.content_hash, version.size, version.file_name) == (
+            self.version.content_hash, len(CONTENT), 'finance.pdf'
+        )
+        assert version.content == CONTENT
+
+    def test_claim_adds_version_to_existing_file(self):
+        """Test that claiming to an existing path adds the next version of that file."""
+        user = self.source.owner
+        FileVersionFactory(file=self.source, version_number=2, content=b'Amended.')
+
+        response = self.claim(user, url_path='/acts/finance.pdf')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        latest = File.objects.get(pk=self.source.pk).latest_version
+        assert (latest.version_number, latest.content) == (3, CONTENT)
+
+    def test_claim_shared_content(self):
+        """Test that content shared with the user can be claimed into their own file."""
+        reader = UserFactory()
+        self.source.set_grants([reader], [])
+
+        response = self.claim(reader, content_type='text/plain')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        file = File.objects.get(owner=reader)
+        assert file.content_type == 'text/plain'
+        assert file.latest_version.content_hash == self.version.content_hash
+
+    def test_unreadable_and_unknown_hashes_look_the_same(self):
+        """Test that other users' content cannot be claimed, or told apart from missing content."""
+        stranger = UserFactory()
+        unreadable = self.claim(stranger)
+        unknown = self.claim(stranger, content_hash=hashlib.sha256(b'never uploaded').hexdigest())
+
+        assert unreadable.status_code == unknown.status_code == status.HTTP_404_NOT_FOUND
+        assert unreadable.json() == unknown.json()
+        assert not File.objects.filter(owner=stranger).exists()
+        assert FileVersion.objects.count() == 1
+
+    def test_validation(self):
+        """Test that malformed hashes and paths are rejected."""
+        response = self.claim(self.source.owner, content_hash='abc', url_path='relative.pdf')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.json()) == {'content_hash', 'url_path'}
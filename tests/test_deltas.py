@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+from propylon_document_manager.file_versions.deltas import apply_delta, encode_delta, read_header
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.file_versions import storage
+from propylon_document_manager.file_versions.storage import DeltaBlobStore, get_blob_store
+from propylon_document_manager.file_versions.text import DOCX, get_text
+from tests.factories import FileFactory, FileVersionFactory
+from tests.test_text_extraction import make_docx
+
+BASE = b''.join(b'line %d of the bill\n' % n for n in range(200))
+TARGET = BASE.replace(b'line 50 of', b'line fifty of') + b'new closing line'
+
+
+def test_delta_round_trip():
+    """Test that applying an encoded delta reproduces the target bytes."""
+    base_hash = hashlib.sha256(BASE).hexdigest()
+    delta = encode_delta(base_hash, BASE, TARGET)
+
+    assert read_header(delta)[:2] == (base_hash, len(TARGET))
+    assert apply_delta(BASE, delta) == TARGET
+    assert len(delta) < len(TARGET) // 10
+
+
+class TestDeltaBlobStore:
+    def test_save_delta_replaces_full_blob(self, tmpdir):
+        """Test that a blob stored as a delta reads back unchanged."""
+        store = DeltaBlobStore(location=tmpdir.strpath, keyframe_interval=10)
+        base_hash, target_hash = store.save(BASE), store.save(TARGET)
+
+        assert store.save_delta(target_hash, base_hash)
+        assert store.is_delta(target_hash)
+        assert not os.path.exists(store.path(target_hash))
+        assert store.exists(target_hash)
+        assert store.size(target_hash) == len(TARGET)
+        assert store.read(target_hash) == TARGET
+
+    def test_base_must_be_full(self, tmpdir):
+        """Test that a delta is never made against another delta, so chains cannot loop."""
+        store = DeltaBlobStore(location=tmpdir.strpath, keyframe_interval=10)
+        base_hash, target_hash = store.save(BASE), store.save(TARGET)
+        store.save_delta(target_hash, base_hash)
+
+        assert not store.save_delta(base_hash, target_hash)
+        assert store.read(base_hash) == BASE
+
+    def test_concurrent_mutual_deltas(self, tmpdir, monkeypatch):
+        """Test that two blobs compacted against each other at once do not both become deltas."""
+        store = DeltaBlobStore(location=tmpdir.strpath, keyframe_interval=10)
+        base_hash, target_hash = store.save(BASE), store.save(TARGET)
+        encoding, release = threading.Event(), threading.Event()
+        real_encode_delta = storage.encode_delta
+
+        def encode_delta(*args, **kwargs):
+            encoding.set()
+            release.wait()
+            return real_encode_delta(*args, **kwargs)
+
+        monkeypatch.setattr(storage, 'encode_delta', encode_delta)
+        first = threading.Thread(target=store.save_delta, args=(target_hash, base_hash))
+        first.start()
+        encoding.wait()
+        second = threading.Thread(target=store.save_delta, args=(base_hash, target_hash))
+        second.start()
+        second.join(0.2)
+        try:
+            assert second.is_alive()
+        finally:
+            release.set()
+            first.join()
+        second.join()
+
+        assert (store.is_delta(target_hash), store.is_delta(base_hash)) == (True, False)
+        assert (store.read(target_hash), store.read(base_hash)) == (TARGET, BASE)
+
+    def test_unrelated_content_stays_full(self, tmpdir):
+        """Test that a delta saving too little is not kept."""
+        store = DeltaBlobStore(location=tmpdir.strpath, keyframe_interval=10)
+        base_hash, other_hash = store.save(BASE), store.save(os.urandom(4096))
+
+        assert not store.save_delta(other_hash, base_hash)
+        assert not store.is_delta(other_hash)
+
+
+@pytest.mark.django_db
+class TestDeltaVersions:
+    @pytest.fixture(autouse=True)
+    def delta_store(self, settings, tmpdir):
+        settings.FILE_VERSIONS_BLOB_STORE = 'propylon_document_manager.file_versions.storage.DeltaBlobStore'
+        settings.FILE_VERSIONS_BLOB_STORE_OPTIONS = {'location': tmpdir.strpath, 'keyframe_interval': 3}
+
+    def test_previous_versions_become_deltas(self, django_capture_on_commit_callbacks):
+        """Test that older versions are delta-encoded except for keyframes and the latest version."""
+        file = FileFactory(url_path='/bills/1')
+        contents = [BASE + b'revision %d\n' % n for n in range(1, 6)]
+        with django_capture_on_commit_callbacks(execute=True):
+            versions = [FileVersionFactory(file=file, version_number=None, content=content) for content in contents]
+
+        store = get_blob_store()
+        assert [store.is_delta(v.content_hash) for v in versions] == [True, True, False, True, False]
+        for version, content in zip(versions, contents):
+            assert FileVersion.objects.get(pk=version.pk).content == content
+
+    def test_extracted_text_survives_compaction(self, django_capture_on_commit_callbacks):
+        """Test that the text extracted from a blob is kept when the blob becomes a delta."""
+        file = FileFactory(url_path='/bills/2.docx', content_type=DOCX)
+        paragraphs = [f'Section {n} of the bill.' for n in range(200)]
+        with django_capture_on_commit_callbacks(execute=True):
+            first = FileVersionFactory(file=file, version_number=None, content=make_docx(*paragraphs))
+        with django_capture_on_commit_callbacks(execute=True):
+            FileVersionFactory(file=file, version_number=None, content=make_docx(*paragraphs, 'Closing section.'))
+
+        assert get_blob_store().is_delta(first.content_hash)
+        assert get_text(first.content_hash, DOCX) == '\n'.join(paragraphs)
+
+    def test_reverted_content_stays_full(self, django_capture_on_commit_callbacks):
+        """Test that content a file was reverted to is kept in full, and the reverted-from blob is compacted."""
+        file = FileFactory(url_path='/bills/3')
+        with django_capture_on_commit_callbacks(execute=True):
+            FileVersionFactory(file=file, version_number=None, content=BASE)
+            FileVersionFactory(file=file, version_number=None, content=TARGET)
+            latest = FileVersionFactory(file=file, version_number=None, content=BASE)
+
+        store = get_blob_store()
+        assert not store.is_delta(latest.content_hash)
+        assert store.is_delta(hashlib.sha256(TARGET).hexdigest())
+        assert FileVersion.objects.get(file=file, version_number=2).content == TARGET
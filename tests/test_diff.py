@@ -0,0 +1,112 @@
+import difflib
+import random
+
+import pytest
+from django.core.cache import cache
+
+from propylon_document_manager.file_versions import diff
+from propylon_document_manager.file_versions.diff_engine import DiffTooLarge, MyersMatcher, unified_hunks
+from propylon_document_manager.file_versions.models import DiffCacheEntry
+from tests.factories import FileFactory, FileVersionFactory
+
+
+@pytest.mark.django_db
+class TestDiffCache:
+    def setup_method(self):
+        """Create two versions of a text file and start from an empty cache."""
+        cache.clear()
+        self.file = FileFactory(content_type='text/plain')
+        self.version1 = FileVersionFactory(file=self.file, version_number=1, content=b'a\nb\n')
+        self.version2 = FileVersionFactory(file=self.file, version_number=2, content=b'a\nc\n')
+
+    def test_diff_is_computed_once(self, monkeypatch):
+        """Test that repeated diffs of the same pair of blobs are served from the cache."""
+        calls = []
+        compute_hunks = diff.compute_hunks
+        monkeypatch.setattr(diff, 'compute_hunks', lambda *args: calls.append(args) or compute_hunks(*args))
+
+        first = diff.diff_versions(self.version1, self.version2)
+        second = diff.diff_versions(self.version1, self.version2)
+
+        assert first == second == '--- v1\n+++ v2\n@@ -1,2 +1,2 @@\n a\n-b\n+c'
+        assert len(calls) == 1
+        assert DiffCacheEntry.objects.filter(
+            from_hash=self.version1.content_hash, to_hash=self.version2.content_hash
+        ).exists()
+
+    def test_database_fallback(self, monkeypatch):
+        """Test that the database table answers when the cache has been cleared."""
+        diff.diff_versions(self.version1, self.version2)
+        cache.clear()
+        monkeypatch.setattr(diff, 'compute_hunks', lambda *args: pytest.fail('diff was recomputed'))
+
+        assert '+c' in diff.diff_versions(self.version1, self.version2)
+
+    def test_header_follows_versions(self):
+        """Test that versions sharing blobs reuse the cached hunks with their own header."""
+        other = FileFactory(content_type='text/plain')
+        version7 = FileVersionFactory(file=other, version_number=7, content=b'a\nb\n')
+        version8 = FileVersionFactory(file=other, version_number=8, content=b'a\nc\n')
+
+        diff.diff_versions(self.version1, self.version2)
+        assert diff.diff_versions(version7, version8).startswith('--- v7\n+++ v8\n')
+
+    def test_eviction(self, settings):
+        """Test that the table is bounded to the configured number of entries."""
+        settings.FILE_VERSIONS_DIFF_CACHE_MAX_ENTRIES = 2
+        for number in range(3, 7):
+            version = FileVersionFactory(file=self.file, version_number=number, content=b'v%d' % number)
+            diff.diff_versions(self.version1, version)
+
+        assert DiffCacheEntry.objects.count() == 2
+
+
+def longest_common_subsequence(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) - 1, -1, -1):
+        for j in range(len(b) - 1, -1, -1):
+            if a[i] == b[j]:
+                lengths[i][j] = lengths[i + 1][j + 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+    return lengths[0][0]
+
+
+class TestDiffEngine:
+    def test_edit_script_is_minimal(self):
+        """Test that the opcodes rebuild the new lines and keep a longest common subsequence."""
+        rng = random.Random(0)
+        for _ in range(500):
+            a = [rng.choice('abcd') for _ in range(rng.randint(0, 12))]
+            b = [rng.choice('abcd') for _ in range(rng.randint(0, 12))]
+            matcher = MyersMatcher(a, b)
+
+            rebuilt = []
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                rebuilt += a[i1:i2] if tag == 'equal' else b[j1:j2]
+            assert rebuilt == b
+            assert sum(block.size for block in matcher.get_matching_blocks()) == longest_common_subsequence(a, b)
+
+    def test_matches_difflib_format(self):
+        """Test that hunks are formatted exactly like difflib.unified_diff."""
+        a = [f'line {i}' for i in range(40)]
+        b = a[:5] + ['inserted'] + a[5:20] + a[21:]
+
+        expected = list(difflib.unified_diff(a, b, lineterm=''))[2:]
+        assert list(unified_hunks(a, b)) == expected
+
+    def test_budget(self):
+        """Test that a diff over the edit budget raises DiffTooLarge."""
+        with pytest.raises(DiffTooLarge):
+            list(unified_hunks(list('abcdef'), list('uvwxyz'), max_cost=4))
+
+    @pytest.mark.django_db
+    def test_over_budget_diff_is_summarised(self, settings):
+        """Test that diffs over budget degrade to a summary instead of failing."""
+        cache.clear()
+        settings.FILE_VERSIONS_DIFF_MAX_EDIT_COST = 2
+        file = FileFactory(content_type='text/plain')
+        version1 = FileVersionFactory(file=file, version_number=1, content=b'a\nb\nc\n')
+        version2 = FileVersionFactory(file=file, version_number=2, content=b'x\ny\nz\n')
+
+        assert diff.diff_versions(version1, version2) == diff.DIFF_TOO_LARGE
@@ -0,0 +1,66 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.api.exports import archive_name
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+
+@pytest.mark.django_db
+class TestExport:
+    def setup_method(self):
+        """Set up an owner with two files under /docs and one outside it."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.a = FileFactory(owner=self.owner, url_path='/docs/a.txt')
+        self.b = FileFactory(owner=self.owner, url_path='/docs/sub/b.txt')
+        other = FileFactory(owner=self.owner, url_path='/other/c.txt')
+        self.a1 = FileVersionFactory(file=self.a, version_number=1, content=b'a1')
+        self.a2 = FileVersionFactory(file=self.a, version_number=2, content=b'a2')
+        FileVersionFactory(file=self.b, version_number=1, content=b'b1')
+        FileVersionFactory(file=other, version_number=1, content=b'c1')
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('api:file-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        assert response.status_code == status.HTTP_200_OK
+        return b''.join(response.streaming_content)
+
+    def test_zip_of_latest_versions(self):
+        """Test that the zip holds the latest version of every file under the prefix."""
+        with zipfile.ZipFile(io.BytesIO(self.export(prefix='/docs/'))) as zf:
+            assert {name: zf.read(name) for name in zf.namelist()} == {
+                'docs/a.txt': b'a2',
+                'docs/sub/b.txt': b'b1',
+            }
+
+    def test_tar_of_revision(self):
+        """Test that ``revision`` selects that version number and skips files without it."""
+        with tarfile.open(fileobj=io.BytesIO(self.export(prefix='/docs/', revision=2, archive='tar'))) as tar:
+            assert [(m.name, tar.extractfile(m).read()) for m in tar] == [('docs/a.txt', b'a2')]
+
+    def test_as_of(self):
+        """Test that ``as_of`` exports the versions current at that time."""
+        as_of = self.a1.created_at.isoformat()
+        type(self.a2).objects.filter(pk=self.a2.pk).update(created_at=self.a1.created_at.replace(year=2100))
+
+        with zipfile.ZipFile(io.BytesIO(self.export(prefix='/docs/a', as_of=as_of))) as zf:
+            assert zf.read('docs/a.txt') == b'a1'
+
+    def test_unknown_archive_format(self):
+        """Test that unsupported archive formats are rejected."""
+        response = self.client.get(self.url, {'archive': 'rar'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_archive_name_cannot_escape():
+    """Test that member names are relative and free of parent references."""
+    assert archive_name('/../../etc/passwd') == 'etc/passwd'
+    assert archive_name('/docs/./a.txt') == 'docs/a.txt'
@@ -3,7 +3,10 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
+from propylon_document_manager.file_versions.changes import get_change_token
 from propylon_document_manager.file_versions.models import File, FileVersion
 from tests.factories import UserFactory, FileFactory, FileVersionFactory
 
@@ -56,8 +59,8 @@ class TestFileAPI:
         response = self.client.get(url)
         
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) == 1
-        assert response.data[0]['url_path'] == self.file.url_path
+        assert len(response.data['results']) == 1
+        assert response.data['results'][0]['url_path'] == self.file.url_path
 
     def test_file_create(self):
         """Test that a user can create a new file."""
@@ -118,3 +121,456 @@ class TestFileAPI:
         response = self.client.get(url)
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestFileUpload:
+    def setup_method(self):
+        """Set up test client and user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, body, url_path='/docs/act.txt'):
+        content = ContentFile(body, name='act.txt')
+        data = {
+            'url_path': url_path,
+            'content_type': 'text/plain',
+            'file_name': 'act.txt',
+            'content': content,
+        }
+        return self.client.post(reverse('api:file-list'), data, format='multipart')
+
+    def test_upload_creates_versions(self):
+        """Test that uploading to an existing path adds a new version."""
+        assert self.upload(b'first').status_code == status.HTTP_201_CREATED
+        response = self.upload(b'second')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        file = File.objects.get(owner=self.user, url_path='/docs/act.txt')
+        assert [v.content for v in file.versions.order_by('version_number')] == [b'first', b'second']
+        assert len(response.data['versions']) == 2
+
+    def test_upload_size_limit(self, settings):
+        """Test that uploads over the configured limit are rejected."""
+        settings.FILE_VERSIONS_MAX_UPLOAD_SIZE = 4
+        response = self.upload(b'too large')
+
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        assert not File.objects.filter(owner=self.user).exists()
+
+    def test_version_content_cannot_be_updated(self):
+        """Test that updating a version rejects new content instead of rewriting its bytes."""
+        self.upload(b'first')
+        version = FileVersion.objects.get(file__owner=self.user)
+        url = reverse('api:version-detail', kwargs={'content_hash': version.content_hash})
+
+        response = self.client.patch(url, {'content': ContentFile(b'rewritten', name='act.txt')}, format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'content' in response.data
+        version.refresh_from_db()
+        assert version.content == b'first'
+
+        response = self.client.patch(url, {'file_name': 'renamed.txt'}, format='multipart')
+        assert response.status_code == status.HTTP_200_OK
+        assert FileVersion.objects.get(pk=version.pk).file_name == 'renamed.txt'
+
+
+@pytest.mark.django_db
+class TestFileVersionDownload:
+    def setup_method(self):
+        """Set up test client, user and a version to download."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.file = FileFactory(owner=self.user, content_type='text/plain')
+        self.version = FileVersionFactory(file=self.file, content=b'0123456789')
+        self.url = reverse('api:version-download', kwargs={'content_hash': self.version.content_hash})
+
+    def test_download(self):
+        """Test that the raw bytes are streamed with an ETag."""
+        response = self.client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert b''.join(response.streaming_content) == b'0123456789'
+        assert response['ETag'] == f'"{self.version.content_hash}"'
+        assert response['Accept-Ranges'] == 'bytes'
+
+    def test_range(self):
+        """Test that a Range request returns only the requested bytes."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert b''.join(response.streaming_content) == b'2345'
+        assert response['Content-Range'] == 'bytes 2-5/10'
+        assert response['Content-Length'] == '4'
+
+    def test_suffix_range(self):
+        """Test that a suffix range returns the final bytes."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert b''.join(response.streaming_content) == b'789'
+
+    def test_unsatisfiable_range(self):
+        """Test that a range past the end is rejected."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response['Content-Range'] == 'bytes */10'
+
+    def test_if_none_match(self):
+        """Test that a matching ETag yields 304 without a body."""
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.version.content_hash}"')
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_other_user_cannot_download(self):
+        """Test that users without read access get 404."""
+        self.client.force_authenticate(user=UserFactory())
+        response = self.client.get(self.url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestListingQueryCount:
+    def setup_method(self):
+        """Set up test client and a user with files shared to another user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.reader = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def add_files(self, count, versions_per_file):
+        for _ in range(count):
+            file = FileFactory(owner=self.user, url_path=f'/docs/{File.objects.count()}')
+            for number in range(1, versions_per_file + 1):
+                version = FileVersionFactory(file=file, version_number=number, content=b'v%d' % number)
+                version.set_grants([self.reader], [])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        return len(queries)
+
+    def test_file_list_query_count_is_constant(self):
+        """Test that listing files does not issue queries per file or version."""
+        self.add_files(1, 1)
+        baseline = self.count_queries(reverse('api:file-list'))
+
+        self.add_files(5, 4)
+        assert self.count_queries(reverse('api:file-list')) == baseline
+
+    def test_version_list_query_count_is_constant(self):
+        """Test that listing readable versions does not issue queries per version."""
+        self.add_files(1, 1)
+        self.client.force_authenticate(user=self.reader)
+        baseline = self.count_queries(reverse('api:version-list'))
+
+        self.add_files(5, 4)
+        assert self.count_queries(reverse('api:version-list')) == baseline
+        assert len(self.client.get(reverse('api:version-list')).data['results']) == 21
+
+
+@pytest.mark.django_db
+class TestFileVersionDiff:
+    def setup_method(self):
+        """Set up test client, user and a text file with two versions."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.file = FileFactory(owner=self.user, content_type='text/plain')
+        self.version1 = FileVersionFactory(file=self.file, version_number=1, content=b'one\ntwo\n')
+        self.version2 = FileVersionFactory(file=self.file, version_number=2, content=b'one\nthree\n')
+
+    def test_diff_not_in_default_payload(self):
+        """Test that listings do not compute diffs unless asked to."""
+        response = self.client.get(reverse('api:version-list'))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert all('diff_with_previous' not in item for item in response.data['results'])
+
+    def test_diff_included_on_request(self):
+        """Test that ?include=diff adds the diff to each version."""
+        url = reverse('api:file-versions', kwargs={'pk': self.file.pk})
+        response = self.client.get(url, {'include': 'diff'})
+
+        diffs = {item['version_number']: item['diff_with_previous'] for item in response.data['results']}
+        assert diffs[1] is None
+        assert '-two' in diffs[2] and '+three' in diffs[2]
+
+    def test_diff_action_defaults_to_previous_version(self):
+        """Test that the diff action compares against the previous version."""
+        url = reverse('api:version-diff', kwargs={'content_hash': self.version2.content_hash})
+        response = self.client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['from'] == self.version1.content_hash
+        assert '+three' in response.data['diff']
+
+    def test_diff_action_against(self):
+        """Test that ?against= picks the version to compare with."""
+        url = reverse('api:version-diff', kwargs={'content_hash': self.version1.content_hash})
+        response = self.client.get(url, {'against': self.version2.content_hash})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert '+two' in response.data['diff']
+
+    def test_diff_action_rejects_binary_content(self):
+        """Test that binary content types are rejected before reading any content."""
+        self.file.content_type = 'image/png'
+        self.file.save()
+        url = reverse('api:version-diff', kwargs={'content_hash': self.version2.content_hash})
+        response = self.client.get(url)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+    def setup_method(self):
+        """Set up test client and a user with several files."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.files = [FileFactory(owner=self.user, url_path=f'/docs/{i}') for i in range(5)]
+
+    def collect(self, url, params):
+        items = []
+        response = self.client.get(url, params)
+        while True:
+            assert response.status_code == status.HTTP_200_OK
+            items += response.data['results']
+            if not response.data['next']:
+                return items
+            response = self.client.get(response.data['next'])
+
+    def test_file_list_pages(self):
+        """Test that following next cursors visits every file once, newest first."""
+        items = self.collect(reverse('api:file-list'), {'page_size': 2})
+
+        assert [item['id'] for item in items] == [file.id for file in reversed(self.files)]
+
+    def test_versions_pages(self):
+        """Test that the versions action is paginated."""
+        for number in range(1, 4):
+            FileVersionFactory(file=self.files[0], version_number=number)
+        url = reverse('api:file-versions', kwargs={'pk': self.files[0].pk})
+        response = self.client.get(url, {'page_size': 2})
+
+        assert len(response.data['results']) == 2
+        assert len(self.collect(url, {'page_size': 2})) == 3
+
+    def test_available_users_pages(self):
+        """Test that available_users pages through users instead of returning the whole table."""
+        others = [UserFactory() for _ in range(3)]
+        items = self.collect(reverse('api:version-available-users'), {'page_size': 2})
+
+        assert sorted(item['id'] for item in items) == sorted(user.id for user in others)
+
+
+@pytest.mark.django_db
+class TestVersionAccessIndex:
+    def setup_method(self):
+        """Set up an owner, a reader and a version owned by the owner."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.reader = UserFactory()
+        self.version = FileVersionFactory(file=FileFactory(owner=self.owner))
+
+    def visible_hashes(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('api:version-list'))
+        return [item['content_hash'] for item in response.data['results']]
+
+    def test_owner_sees_new_versions(self):
+        """Test that versions are indexed for their owner on creation."""
+        assert self.visible_hashes(self.owner) == [self.version.content_hash]
+        assert self.visible_hashes(self.reader) == []
+
+    def test_set_permissions_updates_index(self):
+        """Test that granting and revoking read access is reflected in listings."""
+        self.client.force_authenticate(user=self.owner)
+        url = reverse('api:version-set-permissions', kwargs={'content_hash': self.version.content_hash})
+        self.client.post(url, {'can_read': [self.reader.pk], 'can_write': []}, format='json')
+        assert self.visible_hashes(self.reader) == [self.version.content_hash]
+
+        self.client.force_authenticate(user=self.owner)
+        self.client.post(url, {'can_read': [], 'can_write': []}, format='json')
+        assert self.visible_hashes(self.reader) == []
+
+    def test_listing_does_not_deduplicate(self):
+        """Test that the access check is a plain semi-join without DISTINCT."""
+        self.client.force_authenticate(user=self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('api:version-list'))
+
+        assert not any('DISTINCT' in query['sql'] for query in queries)
+
+
+@pytest.mark.django_db
+class TestFileAccess:
+    def setup_method(self):
+        """Set up an owner with a file and a second user."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.reader = UserFactory()
+        self.file = FileFactory(owner=self.owner)
+        self.version = FileVersionFactory(file=self.file, version_number=1, content=b'one')
+
+    def visible_hashes(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('api:version-list'))
+        return {item['content_hash'] for item in response.data['results']}
+
+    def test_versions_inherit_file_grants(self):
+        """Test that a file-level grant covers existing and future versions."""
+        self.client.force_authenticate(user=self.owner)
+        url = reverse('api:file-set-permissions', kwargs={'pk': self.file.pk})
+        response = self.client.post(url, {'can_read': [self.reader.pk], 'can_write': []}, format='json')
+        assert response.data['can_read'] == [self.reader.pk]
+
+        later = FileVersionFactory(file=self.file, version_number=2, content=b'two')
+        assert self.visible_hashes(self.reader) == {self.version.content_hash, later.content_hash}
+        assert later.can_read.count() == 0
+
+    def test_version_grants_override(self):
+        """Test that a per-version grant exposes only that version."""
+        other = FileVersionFactory(file=self.file, version_number=2, content=b'two')
+        self.version.set_grants([self.reader], [])
+
+        assert self.visible_hashes(self.reader) == {self.version.content_hash}
+        assert other.content_hash not in self.visible_hashes(self.reader)
+
+    def test_owner_cannot_be_granted(self):
+        """Test that the owner cannot appear in the file ACL."""
+        self.client.force_authenticate(user=self.owner)
+        url = reverse('api:file-set-permissions', kwargs={'pk': self.file.pk})
+        response = self.client.post(url, {'can_read': [self.owner.pk]}, format='json')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestListingETags:
+    def setup_method(self):
+        """Set up an owner with a versioned file."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.reader = UserFactory()
+        self.file = FileFactory(owner=self.owner, url_path='/docs/etag')
+        FileVersionFactory(file=self.file, version_number=1, content=b'one')
+        self.client.force_authenticate(user=self.owner)
+
+    def test_unchanged_listing_is_not_modified(self):
+        """Test that a matching If-None-Match is answered without touching the file tables."""
+        url = reverse('api:file-list')
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+        assert not [q for q in queries if 'file_versions_' in q['sql']]
+
+    def test_new_version_changes_etag(self, django_capture_on_commit_callbacks):
+        """Test that adding a version invalidates the file and version listings."""
+        list_url = reverse('api:file-list')
+        versions_url = reverse('api:file-versions', kwargs={'pk': self.file.pk})
+        list_etag = self.client.get(list_url)['ETag']
+        versions_etag = self.client.get(versions_url)['ETag']
+
+        with django_capture_on_commit_callbacks(execute=True):
+            FileVersionFactory(file=self.file, version_number=2, content=b'two')
+
+        response = self.client.get(versions_url, HTTP_IF_NONE_MATCH=versions_etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 2
+        assert self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code == status.HTTP_200_OK
+
+    def test_grant_changes_etag(self, django_capture_on_commit_callbacks):
+        """Test that a permission change invalidates the owner's listing and the grantee's token."""
+        url = reverse('api:file-list')
+        etag = self.client.get(url)['ETag']
+        reader_token = get_change_token(self.reader.pk)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.file.set_grants([self.reader], [])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'][0]['can_read'] == [self.reader.pk]
+        assert get_change_token(self.reader.pk) != reader_token
+
+    def test_etag_is_per_user(self):
+        """Test that two users never share a listing ETag."""
+        url = reverse('api:file-list')
+        etag = self.client.get(url)['ETag']
+
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_uncached_token_never_serves_stale_listing(self, settings, django_capture_on_commit_callbacks):
+        """Test that without a working cache a changed listing is never answered with 304."""
+        settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        url = reverse('api:file-list')
+        etag = self.client.get(url)['ETag']
+
+        with django_capture_on_commit_callbacks(execute=True):
+            FileVersionFactory(file=self.file, version_number=2, content=b'two')
+
+        assert self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestSnapshotReads:
+    def setup_method(self):
+        """Set up two files whose versions were created on known dates."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.client.force_authenticate(user=self.owner)
+        self.files = [FileFactory(owner=self.owner, url_path=f'/law/{n}') for n in range(2)]
+        for file in self.files:
+            for number, day in enumerate([1, 10, 20], start=1):
+                version = FileVersionFactory(file=file, version_number=number, content=f'{file.pk}-{number}'.encode())
+                FileVersion.objects.filter(pk=version.pk).update(created_at=f'2024-01-{day:02d}T00:00:00Z')
+        self.late = FileFactory(owner=self.owner, url_path='/law/late')
+        version = FileVersionFactory(file=self.late, version_number=1, content=b'late')
+        FileVersion.objects.filter(pk=version.pk).update(created_at='2024-02-01T00:00:00Z')
+
+    def test_list_as_of(self):
+        """Test that the file list shows the version current at ``as_of`` for every file."""
+        response = self.client.get(reverse('api:file-list'), {'as_of': '2024-01-15T00:00:00Z'})
+
+        results = response.data['results']
+        assert {r['url_path'] for r in results} == {'/law/0', '/law/1'}
+        assert {r['latest_version']['version_number'] for r in results} == {2}
+        assert all(len(r['versions']) == 2 for r in results)
+
+    def test_list_as_of_query_count(self, django_capture_on_commit_callbacks):
+        """Test that the snapshot does not issue a query per file."""
+        def count():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('api:file-list'), {'as_of': '2024-03-01T00:00:00Z'})
+            return len(queries)
+
+        before = count()
+        with django_capture_on_commit_callbacks(execute=True):
+            extra = FileFactory(owner=self.owner, url_path='/law/extra')
+            FileVersionFactory(file=extra, version_number=1, content=b'x')
+        FileVersion.objects.filter(file=extra).update(created_at='2024-01-05T00:00:00Z')
+        assert count() == before
+
+    def test_get_version_as_of(self):
+        """Test that ``get_version`` resolves the version current at ``as_of``."""
+        url = reverse('api:file-get-version', kwargs={'pk': self.files[0].pk})
+
+        assert self.client.get(url, {'as_of': '2024-01-10T00:00:00Z'}).data['version_number'] == 2
+        assert self.client.get(url, {'as_of': '2023-12-31T00:00:00Z'}).status_code == status.HTTP_404_NOT_FOUND
+        assert self.client.get(url, {'as_of': 'yesterday'}).status_code == status.HTTP_400_BAD_REQUEST
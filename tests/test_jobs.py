@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.changes import get_change_token
+from propylon_document_manager.file_versions.models import FileVersion, Job, SearchDocument
+from propylon_document_manager.file_versions.storage import FileSystemBlobStore, get_blob_store
+from propylon_document_manager.file_versions.text import DOCX
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+from tests.test_text_extraction import make_docx
+
+TEXT = b''.join(b'Section %d applies to every taxable person.\n' % n for n in range(500))
+
+
+@pytest.mark.django_db
+class TestJobQueue:
+    @pytest.fixture(autouse=True)
+    def queued(self, settings, tmpdir):
+        """Queue jobs for a worker instead of running them on commit."""
+        settings.FILE_VERSIONS_JOBS_EAGER = False
+        settings.FILE_VERSIONS_BLOB_STORE_OPTIONS = {'location': tmpdir.strpath}
+
+    def test_upload_returns_before_background_work(self, django_capture_on_commit_callbacks):
+        """Test that uploads store raw bytes and leave compression and extraction to the worker."""
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                reverse('api:file-list'),
+                {
+                    'url_path': '/docs/act.txt',
+                    'file_name': 'act.txt',
+                    'content_type': 'text/plain',
+                    'content': SimpleUploadedFile('act.txt', TEXT),
+                },
+                format='multipart',
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        store = get_blob_store()
+        content_hash = FileVersion.objects.get().content_hash
+        assert not store.is_compressed(content_hash)
+        assert list(Job.objects.values_list('kind', 'status')) == [(Job.COMPRESS, Job.PENDING)]
+
+        assert Job.run_pending() == 1
+        assert store.is_compressed(content_hash)
+        assert store.read(content_hash) == TEXT
+        assert Job.objects.get().status == Job.DONE
+
+    def test_extraction_updates_search(self, django_capture_on_commit_callbacks):
+        """Test that the extraction job stores the text, re-indexes the file and invalidates listings."""
+        file = FileFactory(url_path='/docs/bill.docx', content_type=DOCX)
+        with django_capture_on_commit_callbacks(execute=True):
+            version = FileVersionFactory(file=file, version_number=1, content=make_docx('Housing grants.'))
+        assert SearchDocument.objects.get(file=file).body == ''
+        token = get_change_token(file.owner_id)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Job.run_pending()
+
+        assert get_blob_store().read_text(version.content_hash) == 'Housing grants.'
+        assert SearchDocument.objects.get(file=file).body == 'Housing grants.'
+        # Listings cached with ``?include=diff`` are invalidated.
+        assert get_change_token(file.owner_id) != token
+
+    def test_jobs_are_idempotent_by_content_hash(self):
+        """Test that the same blob is only queued once, however many versions share it."""
+        content = make_docx('Shared text.')
+        for url_path in ('/a.docx', '/b.docx'):
+            FileVersionFactory(
+                file=FileFactory(url_path=url_path, content_type=DOCX), version_number=1, content=content
+            )
+        Job.run_pending()
+        FileVersionFactory(file=FileFactory(url_path='/c.docx', content_type=DOCX), version_number=1, content=content)
+
+        assert Job.objects.filter(kind=Job.EXTRACT_TEXT).count() == 1
+        assert Job.objects.get(kind=Job.EXTRACT_TEXT).status == Job.DONE
+
+    def test_retries_with_backoff_then_fails(self, settings, monkeypatch):
+        """Test that failing jobs are retried later, and marked failed after the last attempt."""
+        settings.FILE_VERSIONS_JOB_MAX_ATTEMPTS = 2
+        monkeypatch.setattr(FileSystemBlobStore, 'recompress', lambda *args: 1 / 0)
+        FileVersionFactory(file=FileFactory(content_type='text/plain'), version_number=1, content=TEXT)
+
+        assert Job.run_pending() == 1
+        job = Job.objects.get()
+        assert (job.status, job.attempts) == (Job.PENDING, 1)
+        assert job.run_after > timezone.now() + timedelta(seconds=settings.FILE_VERSIONS_JOB_RETRY_DELAY - 5)
+        assert 'ZeroDivisionError' in job.last_error
+        assert Job.run_pending() == 0
+
+        Job.objects.update(run_after=timezone.now())
+        assert Job.run_pending() == 1
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == (Job.FAILED, 2)
+
+        # Uploading the blob again gives the work another chance.
+        FileVersionFactory(file=FileFactory(content_type='text/plain'), version_number=1, content=TEXT)
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == (Job.PENDING, 0)
+
+    def test_abandoned_jobs_are_reclaimed(self, settings):
+        """Test that a job left running by a dead worker is run again after the lock timeout."""
+        FileVersionFactory(file=FileFactory(content_type='text/plain'), version_number=1, content=TEXT)
+        job = Job.claim_next()
+        assert Job.claim_next() is None
+
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=settings.FILE_VERSIONS_JOB_LOCK_TIMEOUT + 1)
+        )
+        assert Job.claim_next().attempts == 2
+
+    def test_worker_command(self, capsys):
+        """Test that the worker drains the queue and reports its depth."""
+        FileVersionFactory(file=FileFactory(content_type='text/plain'), version_number=1, content=TEXT)
+
+        call_command('process_jobs', '--status')
+        assert 'pending=1 running=0 done=0 failed=0' in capsys.readouterr().out
+
+        call_command('process_jobs', '--once')
+        assert 'Processed 1 jobs' in capsys.readouterr().out
+        assert Job.queue_depth()[Job.DONE] == 1
@@ -0,0 +1,74 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.api.permissions import PermissionResolver
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+
+@pytest.mark.django_db
+class TestPermissionResolver:
+    def setup_method(self):
+        """Set up an owner, a collaborator and a shared file."""
+        self.owner = UserFactory()
+        self.collaborator = UserFactory()
+        self.file = FileFactory(owner=self.owner)
+        self.version = FileVersionFactory(file=self.file, version_number=1)
+
+    def test_rights_are_resolved_once(self, django_assert_num_queries):
+        """Test that repeated checks on the same file are answered from memory."""
+        self.file.set_grants([self.collaborator], [self.collaborator])
+        resolver = PermissionResolver(self.collaborator)
+
+        with django_assert_num_queries(1):
+            assert resolver.file_rights(self.file).can_write
+            assert resolver.file_rights(self.file).can_read
+            assert resolver.version_rights(self.version).can_read is True
+        assert resolver.misses == 1
+        assert resolver.hits == 2
+
+    def test_owner_needs_no_queries(self, django_assert_num_queries):
+        """Test that ownership is decided from the loaded file."""
+        resolver = PermissionResolver(self.owner)
+
+        with django_assert_num_queries(0):
+            assert resolver.version_rights(self.version).can_write
+
+    def test_version_grants_add_to_file_rights(self):
+        """Test that a per-version grant adds to the file's rights."""
+        self.version.set_grants([], [self.collaborator])
+        resolver = PermissionResolver(self.collaborator)
+
+        assert not resolver.file_rights(self.file).can_write
+        assert resolver.version_rights(self.version).can_write
+        assert resolver.can_write_file(self.file)
+
+
+@pytest.mark.django_db
+class TestVersionWritePermissions:
+    def setup_method(self):
+        """Set up an owner, a collaborator with write access and a file."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.collaborator = UserFactory()
+        self.file = FileFactory(owner=self.owner)
+        self.version = FileVersionFactory(file=self.file, version_number=1)
+        self.file.set_grants([self.collaborator], [self.collaborator])
+        self.client.force_authenticate(user=self.collaborator)
+
+    def test_collaborator_can_add_versions(self):
+        """Test that a file-level write grant allows uploading a version."""
+        data = {'file': self.file.pk, 'file_name': 'new.txt', 'content': ContentFile(b'new', name='new.txt')}
+        response = self.client.post(reverse('api:version-list'), data, format='multipart')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['version_number'] == 2
+
+    def test_only_owner_can_delete(self):
+        """Test that non-owners cannot delete versions they can read."""
+        url = reverse('api:version-detail', kwargs={'content_hash': self.version.content_hash})
+        response = self.client.delete(url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,88 @@
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.models import SearchDocument
+from propylon_document_manager.file_versions.search import fts5_query
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+
+def test_fts5_query_quotes_words():
+    """Test that user input cannot inject FTS5 syntax."""
+    assert fts5_query('tax "relief" OR NEAR(') == '"tax" "relief" "OR" "NEAR"'
+
+
+@pytest.mark.django_db
+class TestSearch:
+    @pytest.fixture(autouse=True)
+    def documents(self, django_capture_on_commit_callbacks):
+        """Set up an owner with two text documents and a stranger."""
+        self.client = APIClient()
+        self.owner = UserFactory()
+        self.stranger = UserFactory()
+        with django_capture_on_commit_callbacks(execute=True):
+            self.act = FileFactory(owner=self.owner, url_path='/acts/finance.txt', content_type='text/plain')
+            FileVersionFactory(file=self.act, version_number=1, file_name='finance.txt', content=b'income tax relief')
+            self.bill = FileFactory(owner=self.owner, url_path='/bills/housing.txt', content_type='text/plain')
+            FileVersionFactory(
+                file=self.bill, version_number=1, file_name='housing.txt', content=b'housing grants and tax'
+            )
+        self.url = reverse('api:file-search')
+
+    def search(self, user, query):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(self.url, {'q': query})
+        assert response.status_code == status.HTTP_200_OK
+        return [result['url_path'] for result in response.data['results']]
+
+    def test_matches_body_and_path(self):
+        """Test that words from the body and the path are both searchable."""
+        assert self.search(self.owner, 'relief') == ['/acts/finance.txt']
+        assert self.search(self.owner, 'housing') == ['/bills/housing.txt']
+        assert set(self.search(self.owner, 'tax')) == {'/acts/finance.txt', '/bills/housing.txt'}
+
+    def test_path_matches_rank_first(self, django_capture_on_commit_callbacks):
+        """Test that a match in the path outranks a match in the body."""
+        with django_capture_on_commit_callbacks(execute=True):
+            memo = FileFactory(owner=self.owner, url_path='/notes/memo.txt', content_type='text/plain')
+            FileVersionFactory(file=memo, version_number=1, file_name='memo.txt', content=b'housing housing housing')
+
+        assert self.search(self.owner, 'housing') == ['/bills/housing.txt', '/notes/memo.txt']
+
+    def test_respects_read_permissions(self, django_capture_on_commit_callbacks):
+        """Test that only files the user can read are returned."""
+        assert self.search(self.stranger, 'tax') == []
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.act.set_grants([self.stranger], [])
+        assert self.search(self.stranger, 'tax') == ['/acts/finance.txt']
+
+    def test_new_version_is_indexed(self, django_capture_on_commit_callbacks):
+        """Test that the index follows the latest version."""
+        with django_capture_on_commit_callbacks(execute=True):
+            FileVersionFactory(file=self.act, version_number=2, file_name='finance.txt', content=b'customs duties')
+
+        assert self.search(self.owner, 'relief') == []
+        assert self.search(self.owner, 'customs') == ['/acts/finance.txt']
+
+    def test_deleted_file_is_removed(self):
+        """Test that deleting a file removes it from the index."""
+        self.bill.delete()
+
+        assert self.search(self.owner, 'housing') == []
+
+    def test_query_is_required(self):
+        """Test that an empty query is rejected."""
+        self.client.force_authenticate(user=self.owner)
+
+        assert self.client.get(self.url).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command indexes files that were never indexed."""
+        SearchDocument.objects.all().delete()
+
+        call_command('rebuild_search_index')
+
+        assert self.search(self.owner, 'relief') == ['/acts/finance.txt']
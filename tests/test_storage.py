@@ -0,0 +1,105 @@
+import hashlib
+import os
+
+import pytest
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.file_versions.storage import BlobTooLarge, FileSystemBlobStore, get_blob_store
+from tests.factories import FileFactory, FileVersionFactory
+
+
+class TestFileSystemBlobStore:
+    def test_save_is_sharded_by_hash_prefix(self, tmpdir):
+        """Test that blobs are stored under directories named after the hash prefix."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+        content_hash = store.save(b'Hello, World!')
+
+        assert content_hash == hashlib.sha256(b'Hello, World!').hexdigest()
+        expected = os.path.join(tmpdir.strpath, content_hash[:2], content_hash[2:4], content_hash)
+        assert store.path(content_hash) == expected
+        assert store.read(content_hash) == b'Hello, World!'
+        assert store.size(content_hash) == 13
+
+    def test_save_is_durable(self, tmpdir, monkeypatch):
+        """Test that a blob is fsynced before it is renamed into place, and its directories after."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+        synced = []
+        real_fsync = os.fsync
+
+        def fsync(fd):
+            synced.append(os.readlink(f'/proc/self/fd/{fd}'))
+            real_fsync(fd)
+
+        monkeypatch.setattr(os, 'fsync', fsync)
+
+        content_hash = store.save(b'Hello, World!')
+
+        blob_dir = os.path.dirname(store.path(content_hash))
+        assert os.path.dirname(synced[0]) == os.path.join(tmpdir.strpath, 'tmp')
+        assert synced[1:] == [blob_dir, os.path.dirname(blob_dir), tmpdir.strpath]
+
+    def test_identical_content_is_stored_once(self, tmpdir):
+        """Test that saving the same bytes twice keeps a single blob."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+        first = store.save(b'same bytes')
+        second = store.save(b'same bytes')
+
+        assert first == second
+        blobs = [name for _, _, names in os.walk(tmpdir.strpath) for name in names]
+        assert blobs == [first]
+
+    def test_missing_blob(self, tmpdir):
+        """Test that reading an unknown hash raises KeyError."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+
+        with pytest.raises(KeyError):
+            store.open('0' * 64)
+
+
+@pytest.mark.django_db
+class TestFileVersionContent:
+    def test_content_is_kept_out_of_the_database(self):
+        """Test that version content round-trips through the blob store."""
+        version = FileVersionFactory(content=b'version body')
+
+        assert get_blob_store().exists(version.content_hash)
+        assert version.size == len(b'version body')
+
+        reloaded = FileVersion.objects.get(pk=version.pk)
+        assert reloaded.content == b'version body'
+
+    def test_versions_share_blobs(self):
+        """Test that two versions with identical content point at the same blob."""
+        file = FileFactory()
+        version1 = FileVersionFactory(file=file, version_number=1, content=b'unchanged')
+        version2 = FileVersionFactory(file=file, version_number=2, content=b'unchanged')
+
+        assert version1.content_hash == version2.content_hash
+
+
+class TestSaveStream:
+    def test_hashes_while_writing(self, tmpdir):
+        """Test that streamed chunks are hashed and stored in one pass."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+        content_hash, size = store.save_stream([b'Hello, ', b'World!'])
+
+        assert content_hash == hashlib.sha256(b'Hello, World!').hexdigest()
+        assert size == 13
+        assert store.read(content_hash) == b'Hello, World!'
+
+    def test_size_limit(self, tmpdir):
+        """Test that a stream over the limit is rejected and leaves nothing behind."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+
+        with pytest.raises(BlobTooLarge):
+            store.save_stream([b'12345', b'67890'], max_size=8)
+        assert [name for _, _, names in os.walk(tmpdir.strpath) for name in names] == []
+
+    def test_duplicate_is_discarded(self, tmpdir):
+        """Test that re-uploading stored content does not leave a second copy."""
+        store = FileSystemBlobStore(location=tmpdir.strpath)
+        first, _ = store.save_stream([b'abc'])
+        second, _ = store.save_stream([b'a', b'bc'])
+
+        assert first == second
+        assert [name for _, _, names in os.walk(tmpdir.strpath) for name in names] == [first]
@@ -0,0 +1,129 @@
+import io
+import zipfile
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.storage import get_blob_store
+from propylon_document_manager.file_versions.text import DOCX, PDF, extract, normalize_text
+from tests.factories import FileFactory, FileVersionFactory
+
+
+def make_docx(*paragraphs):
+    body = '\n'.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', document)
+    return buffer.getvalue()
+
+
+def make_pdf(text):
+    stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def test_normalize_text():
+    """Test that whitespace and Unicode forms are normalized."""
+    assert normalize_text('  Café \t act\r\n\r\n\r\n\r\nSection  2 ') == 'Café act\n\nSection 2'
+
+
+@pytest.mark.django_db
+class TestExtraction:
+    def test_docx(self):
+        """Test that DOCX paragraphs become lines of text, stored next to the blob."""
+        version = FileVersionFactory(
+            file=FileFactory(url_path='/docs/act.docx', content_type=DOCX),
+            version_number=1,
+            content=make_docx('Section 1.', 'Tax  relief applies.'),
+        )
+
+        assert extract(version.content_hash, DOCX) == 'Section 1.\nTax relief applies.'
+        assert get_blob_store().read_text(version.content_hash) == 'Section 1.\nTax relief applies.'
+
+    def test_pdf(self):
+        """Test that PDF page text is extracted."""
+        pytest.importorskip('pypdf')
+        version = FileVersionFactory(
+            file=FileFactory(url_path='/docs/act.pdf', content_type=PDF),
+            version_number=1,
+            content=make_pdf('Finance Act 2024'),
+        )
+
+        assert extract(version.content_hash, PDF) == 'Finance Act 2024'
+
+    def test_unreadable_document_is_not_retried(self):
+        """Test that a broken document is stored as empty text."""
+        version = FileVersionFactory(
+            file=FileFactory(url_path='/docs/broken.docx', content_type=DOCX), version_number=1, content=b'not a zip'
+        )
+
+        assert extract(version.content_hash, DOCX) == ''
+        assert get_blob_store().read_text(version.content_hash) == ''
+
+
+@pytest.mark.django_db
+class TestExtractedTextUse:
+    def setup_method(self):
+        self.client = APIClient()
+        self.file = FileFactory(url_path='/docs/bill.docx', content_type=DOCX)
+        self.client.force_authenticate(user=self.file.owner)
+
+    def add_version(self, number, *paragraphs):
+        return FileVersionFactory(file=self.file, version_number=number, content=make_docx(*paragraphs))
+
+    def test_diff_uses_extracted_text(self, django_capture_on_commit_callbacks):
+        """Test that DOCX versions are diffed on their text rather than their zip bytes."""
+        with django_capture_on_commit_callbacks(execute=True):
+            self.add_version(1, 'Section 1.', 'Old wording.')
+            version = self.add_version(2, 'Section 1.', 'New wording.')
+
+        response = self.client.get(reverse('api:version-diff', kwargs={'content_hash': version.content_hash}))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert '-Old wording.\n+New wording.' in response.data['diff']
+
+    def test_pending_extraction(self):
+        """Test that diffs wait for extraction instead of diffing raw bytes."""
+        self.add_version(1, 'One.')
+        version = self.add_version(2, 'Two.')
+
+        response = self.client.get(reverse('api:version-diff', kwargs={'content_hash': version.content_hash}))
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_text_preview_and_search(self, django_capture_on_commit_callbacks):
+        """Test that extracted text feeds the preview and the search index."""
+        with django_capture_on_commit_callbacks(execute=True):
+            version = self.add_version(1, 'Housing grants.')
+
+        response = self.client.get(reverse('api:version-text', kwargs={'content_hash': version.content_hash}))
+        assert response.data['text'] == 'Housing grants.'
+
+        response = self.client.get(reverse('api:file-search'), {'q': 'grants'})
+        assert [result['url_path'] for result in response.data['results']] == ['/docs/bill.docx']
@@ -0,0 +1,286 @@
+import hashlib
+import os
+import threading
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.api import uploads
+from propylon_document_manager.file_versions.models import File, FileVersion, UploadSession
+from propylon_document_manager.file_versions.storage import FileSystemBlobStore, get_blob_store
+from tests.factories import FileFactory, FileVersionFactory, UserFactory
+
+CONTENT = os.urandom(10 * 1000 + 123)
+PART_SIZE = 1000
+
+
+@pytest.fixture(autouse=True)
+def blob_store(settings, tmpdir):
+    settings.FILE_VERSIONS_BLOB_STORE_OPTIONS = {'location': tmpdir.strpath}
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def start(client, **data):
+    data = {
+        'url_path': '/scans/deed.pdf', 'file_name': 'deed.pdf', 'size': len(CONTENT), 'part_size': PART_SIZE, **data
+    }
+    return client.post(reverse('api:file-start-upload'), data, format='json')
+
+
+def put_part(client, upload_id, number, data, **headers):
+    url = reverse('api:file-upload-part', kwargs={'upload_id': upload_id, 'number': number})
+    return client.put(url, data, content_type='application/octet-stream', headers=headers)
+
+
+def part(number):
+    return CONTENT[(number - 1) * PART_SIZE:number * PART_SIZE]
+
+
+@pytest.mark.django_db
+class TestUploadSessions:
+    def setup_method(self):
+        self.user = UserFactory()
+        self.client = client_for(self.user)
+
+    def test_parts_in_any_order_create_a_new_file(self):
+        """Test that parts sent out of order are assembled into the first version of a new file."""
+        response = start(self.client, content_type='application/pdf')
+        assert response.status_code == status.HTTP_201_CREATED
+        upload_id = response.json()['id']
+        assert response.json()['part_count'] == 11
+
+        for number in reversed(range(1, 12)):
+            response = put_part(self.client, upload_id, number, part(number))
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()['sha256'] == hashlib.sha256(part(number)).hexdigest()
+
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        assert response.status_code == status.HTTP_201_CREATED
+        file = File.objects.get(owner=self.user, url_path='/scans/deed.pdf')
+        assert response.json()['id'] == file.pk
+        assert file.content_type == 'application/pdf'
+        version = file.latest_version
+        assert version.content == CONTENT
+        assert version.content_hash == hashlib.sha256(CONTENT).hexdigest()
+        assert not os.path.exists(get_blob_store().upload_path(upload_id))
+
+        # Completing again, e.g. after a lost response, does not add a version.
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        assert response.status_code == status.HTTP_201_CREATED
+        assert file.versions.count() == 1
+        status_response = self.client.get(reverse('api:file-upload', kwargs={'upload_id': upload_id}))
+        assert status_response.json()['content_hash'] == version.content_hash
+
+    def test_upload_adds_a_version_to_an_existing_file(self):
+        """Test that an upload to an existing path adds the next version of that file."""
+        file = FileFactory(owner=self.user, url_path='/scans/deed.pdf', content_type='application/pdf')
+        FileVersionFactory(file=file, version_number=1, content=b'first scan')
+        upload_id = start(self.client, size=5, part_size=PART_SIZE).json()['id']
+        put_part(self.client, upload_id, 1, b'again')
+
+        self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+
+        assert list(file.versions.order_by('version_number').values_list('version_number', flat=True)) == [1, 2]
+        assert FileVersion.objects.get(file=file, version_number=2).content == b'again'
+
+    def test_resume_after_failed_parts(self):
+        """Test that the session reports missing parts, and bad parts can be sent again."""
+        upload_id = start(self.client).json()['id']
+        put_part(self.client, upload_id, 1, part(1))
+
+        response = put_part(self.client, upload_id, 2, part(2)[:-1])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = put_part(self.client, upload_id, 3, part(3), **{'X-Content-SHA256': '0' * 64})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert put_part(self.client, upload_id, 12, b'x').status_code == status.HTTP_400_BAD_REQUEST
+
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()['missing_parts'] == list(range(2, 12))
+
+        session = self.client.get(reverse('api:file-upload', kwargs={'upload_id': upload_id})).json()
+        for number in session['missing_parts']:
+            digest = hashlib.sha256(part(number)).hexdigest()
+            response = put_part(self.client, upload_id, number, part(number), **{'X-Content-SHA256': digest})
+            assert response.status_code == status.HTTP_200_OK
+
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        assert response.status_code == status.HTTP_201_CREATED
+        assert FileVersion.objects.get(file__owner=self.user).content == CONTENT
+
+    def test_failed_retry_marks_part_missing(self):
+        """Test that a part whose resend fails counts as missing, since its bytes were overwritten."""
+        upload_id = start(self.client).json()['id']
+        for number in range(1, 12):
+            put_part(self.client, upload_id, number, part(number))
+
+        response = put_part(self.client, upload_id, 4, part(5), **{'X-Content-SHA256': '0' * 64})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        assert response.json()['missing_parts'] == [4]
+
+    def test_completion_can_be_retried_after_a_failure(self, monkeypatch):
+        """Test that a completion failing after the blob was stored is retried without the upload file."""
+        upload_id = start(self.client).json()['id']
+        for number in range(1, 12):
+            put_part(self.client, upload_id, number, part(number))
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('database went away')
+
+        monkeypatch.setattr(uploads, 'add_version', fail)
+        with pytest.raises(RuntimeError):
+            self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        monkeypatch.undo()
+        assert not os.path.exists(get_blob_store().upload_path(upload_id))
+        assert put_part(self.client, upload_id, 1, part(1)).status_code == status.HTTP_400_BAD_REQUEST
+
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+        assert response.status_code == status.HTTP_201_CREATED
+        assert FileVersion.objects.get(file__owner=self.user).content == CONTENT
+
+    def test_lost_upload_file_is_a_conflict(self):
+        """Test that completing an upload whose file is gone, and whose hash was never recorded, fails cleanly."""
+        upload_id = start(self.client, size=5).json()['id']
+        put_part(self.client, upload_id, 1, b'bytes')
+        get_blob_store().abort_upload(upload_id)
+
+        response = self.client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert not FileVersion.objects.exists()
+
+    def test_sessions_are_private_and_can_be_aborted(self):
+        """Test that other users cannot see a session, and aborting discards its parts."""
+        upload_id = start(self.client).json()['id']
+        put_part(self.client, upload_id, 1, part(1))
+
+        other = client_for(UserFactory())
+        assert other.get(reverse('api:file-upload', kwargs={'upload_id': upload_id})).status_code == 404
+        assert put_part(other, upload_id, 2, part(2)).status_code == 404
+
+        response = self.client.delete(reverse('api:file-upload', kwargs={'upload_id': upload_id}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not UploadSession.objects.exists()
+        assert not os.path.exists(get_blob_store().upload_path(upload_id))
+
+    def test_session_limits(self, settings):
+        """Test the maximum upload size, and that the default part size grows to respect the part limit."""
+        settings.FILE_VERSIONS_UPLOAD_MAX_PARTS = 4
+        response = start(self.client)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        data = {'url_path': '/scans/deed.pdf', 'file_name': 'deed.pdf', 'size': len(CONTENT)}
+        settings.FILE_VERSIONS_UPLOAD_PART_SIZE = 1000
+        response = self.client.post(reverse('api:file-start-upload'), data, format='json')
+        assert response.json()['part_size'] == 2531
+        assert response.json()['part_count'] == 4
+
+        settings.FILE_VERSIONS_MAX_UPLOAD_SIZE = len(CONTENT) - 1
+        response = self.client.post(reverse('api:file-start-upload'), data, format='json')
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def test_expired_sessions_are_removed(self):
+        """Test that the expiry command deletes expired sessions and their upload files."""
+        upload_id = start(self.client).json()['id']
+        UploadSession.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        assert self.client.get(reverse('api:file-upload', kwargs={'upload_id': upload_id})).status_code == 404
+
+        call_command('expire_upload_sessions')
+
+        assert not UploadSession.objects.exists()
+        assert not os.path.exists(get_blob_store().upload_path(upload_id))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parts_upload_in_parallel():
+    """Test that parts sent concurrently over separate connections assemble correctly."""
+    user = UserFactory()
+    upload_id = start(client_for(user)).json()['id']
+    errors = []
+
+    def send(numbers):
+        try:
+            client = client_for(user)
+            for number in numbers:
+                assert put_part(client, upload_id, number, part(number)).status_code == 200
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=send, args=(range(i, 12, 4),)) for i in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    response = client_for(user).post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+    assert response.status_code == status.HTTP_201_CREATED
+    assert FileVersion.objects.get(file__owner=user).content == CONTENT
+
+
+@pytest.mark.django_db(transaction=True)
+def test_upload_is_committed_outside_a_transaction(monkeypatch):
+    """Test that the upload is hashed and moved while no database transaction is open."""
+    user = UserFactory()
+    client = client_for(user)
+    upload_id = start(client, size=5).json()['id']
+    put_part(client, upload_id, 1, b'bytes')
+    in_transaction = []
+    commit_upload = FileSystemBlobStore.commit_upload
+
+    def commit(store, upload_id):
+        in_transaction.append(connection.in_atomic_block)
+        return commit_upload(store, upload_id)
+
+    monkeypatch.setattr(FileSystemBlobStore, 'commit_upload', commit)
+    response = client.post(reverse('api:file-complete-upload', kwargs={'upload_id': upload_id}))
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert in_transaction == [False]
+
+
+def test_completion_waits_for_parts_in_flight(tmpdir):
+    """Test that committing an upload waits for a part being written, so the blob matches its hash."""
+    store = FileSystemBlobStore(location=tmpdir.strpath)
+    store.start_upload('upload', 4)
+    started, release = threading.Event(), threading.Event()
+
+    def chunks():
+        yield b'ab'
+        started.set()
+        release.wait()
+        yield b'cd'
+
+    writer = threading.Thread(target=store.write_part, args=('upload', 0, chunks()))
+    writer.start()
+    started.wait()
+    committed = []
+    committer = threading.Thread(target=lambda: committed.append(store.commit_upload('upload')))
+    committer.start()
+    committer.join(0.2)
+    try:
+        assert committer.is_alive()
+    finally:
+        release.set()
+        writer.join()
+    committer.join()
+    content_hash = hashlib.sha256(b'abcd').hexdigest()
+    assert committed == [(content_hash, 4)]
+    assert store.read(content_hash) == b'abcd'
+    with pytest.raises(KeyError):
+        store.write_part('upload', 0, [b'ab'])
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+from django.db import connection
+
+from propylon_document_manager.file_versions.models import File, FileVersion
+from tests.factories import FileFactory, FileVersionFactory
+
+
+@pytest.mark.django_db
+class TestVersionNumberAllocation:
+    def test_versions_are_numbered_sequentially(self):
+        """Test that versions saved without a number get the next one."""
+        file = FileFactory()
+        numbers = [
+            FileVersion.objects.create(file=file, file_name='a.txt', content=b'%d' % i).version_number
+            for i in range(3)
+        ]
+
+        assert numbers == [1, 2, 3]
+        file.refresh_from_db()
+        assert file.latest_version_number == 3
+
+    def test_explicit_numbers_advance_the_counter(self):
+        """Test that explicitly numbered versions are never reused by later allocations."""
+        file = FileFactory()
+        FileVersionFactory(file=file, version_number=5)
+
+        version = FileVersion.objects.create(file=file, file_name='a.txt', content=b'next')
+        assert version.version_number == 6
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_uploads_get_distinct_numbers():
+    """Test that N concurrent uploads to one file produce versions 1..N without errors."""
+    file = FileFactory()
+    workers = 8
+    barrier = threading.Barrier(workers)
+    errors = []
+
+    def upload(index):
+        try:
+            barrier.wait()
+            FileVersion.objects.create(file_id=file.pk, file_name='a.txt', content=b'upload %d' % index)
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    numbers = sorted(FileVersion.objects.filter(file=file).values_list('version_number', flat=True))
+    assert numbers == list(range(1, workers + 1))
+    assert File.objects.get(pk=file.pk).latest_version_number == workers
+
+
+@pytest.mark.django_db
+class TestLatestVersionPointer:
+    def test_pointer_follows_new_versions(self):
+        """Test that File.latest_version points at the most recently created version."""
+        file = FileFactory()
+        FileVersion.objects.create(file=file, file_name='a.txt', content=b'one')
+        second = FileVersion.objects.create(file=file, file_name='a.txt', content=b'two')
+
+        assert File.objects.get(pk=file.pk).latest_version == second
+
+    def test_pointer_moves_back_on_delete(self):
+        """Test that deleting the head version repoints the file at the previous one."""
+        file = FileFactory()
+        first = FileVersion.objects.create(file=file, file_name='a.txt', content=b'one')
+        second = FileVersion.objects.create(file=file, file_name='a.txt', content=b'two')
+
+        second.delete()
+        assert File.objects.get(pk=file.pk).latest_version == first
+
+    def test_head_revision_is_a_single_lookup(self, django_assert_max_num_queries):
+        """Test that reading the head revision does not scan the version history."""
+        file = FileFactory()
+        for i in range(20):
+            FileVersion.objects.create(file=file, file_name='a.txt', content=b'%d' % i)
+
+        with django_assert_max_num_queries(1):
+            head = File.objects.select_related('latest_version').get(pk=file.pk).latest_version
+        assert head.version_number == 20